@@ -5,11 +5,14 @@ import logging
 app = Flask(__name__)
 app.secret_key = os.environ.get("SESSION_SECRET")
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (level from LOG_LEVEL, INFO by default)
+from config import LOG_LEVEL, log_configuration
+logging.basicConfig(level=LOG_LEVEL)
+log_configuration()
 
 # Import routes after app initialization
 from routes import *  # noqa
 
 if __name__ == "__main__":
+    start_background_senders()
     app.run(host="0.0.0.0", port=5000, debug=True)
@@ -0,0 +1,516 @@
+"""
+End-to-end benchmarks for the route pipeline, run entirely offline.
+
+The ORS, Nominatim and OpenAI APIs are replaced by stub_server.py and
+email goes to a local SMTP sink, so the numbers measure our own code plus
+the simulated upstream latency (scaled by --latency-scale).
+
+    python benchmarks/run_benchmarks.py                      # full run
+    python benchmarks/run_benchmarks.py --quick              # smoke run
+    python benchmarks/run_benchmarks.py --output benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --compare benchmarks/baseline.json
+
+Reports:
+- application startup in a fresh interpreter: import of app.py, first
+  request, and the one-off module preload done by the gunicorn master,
+  checked against STARTUP_BUDGET_SECONDS;
+- GPX serialisation (GPXService.create_gpx, RouteGenerator._convert_to_gpx,
+  and the former gpxpy object-graph path as a reference) for routes of
+  500 to 50,000 points, with peak memory;
+- export formats (GPX, GPX.gz, FIT, polyline, GeoJSON): time and size
+  relative to plain GPX;
+- email delivery with one SMTP connection per message versus the pooled
+  sessions, against a sink that simulates the TLS + AUTH handshake;
+- track simplification before export: time, points kept, error introduced
+  and GPX size before/after;
+- the /generate-route endpoint and RouteGeneratorService.process_user_preferences
+  at several concurrency levels: throughput, end-to-end p50/p95/p99 and the
+  same percentiles for each pipeline stage.
+
+The route and description caches, distance calibration and rate limiter
+are disabled so that every request does the same work and runs are
+comparable.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+sys.path.append('.')
+
+from stub_server import (POINT_SPACING_M, SMTPSink, StubConfig, StubServer,
+                         build_route_geojson, synthetic_loop)
+
+ROUTE_SIZES = [500, 2000, 10000, 50000]
+CONCURRENCY_LEVELS = [1, 4, 8, 16]
+START = (-1.6778, 48.1173)  # Rennes
+
+LOCATIONS = ['Rennes', 'Vitré', 'Dinan', 'Quimper', 'Vannes', 'Lannion', 'Fougères', 'Morlaix']
+
+# Metrics checked by --compare, by name suffix; lower is better unless listed in HIGHER_IS_BETTER
+COMPARED_METRICS = ('_ms', '_kb', 'output_bytes', 'gpx_bytes_after', 'kept_points', 'max_error_m',
+                    'connections', 'throughput_rps', 'points_per_s', 'size_ratio')
+HIGHER_IS_BETTER = ('throughput_rps', 'points_per_s', 'size_ratio')
+
+
+def percentile(values, q):
+    """Linear-interpolated percentile (q in 0-100) of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * q / 100
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
+
+def summarize(seconds):
+    """p50/p95/p99 in milliseconds"""
+    return {f"p{q}_ms": round(1000 * percentile(seconds, q), 2) for q in (50, 95, 99)}
+
+
+def synthetic_route(points):
+    """ORS-shaped GeoJSON with about `points` coordinates"""
+    coords = synthetic_loop(START, points * POINT_SPACING_M, 3, random.Random(points))
+    return build_route_geojson(coords, 'foot-hiking', {})
+
+
+def request_payload(index):
+    return {
+        'location': LOCATIONS[index % len(LOCATIONS)],
+        'activity_type': 'hiking',
+        'level': 'intermediate',
+        'distance': str(5 + index % 4 * 5),
+        'landscape': 'forest',
+        'route_type': 'loop' if index % 2 == 0 else 'roundtrip',
+        'elevation_preference': 'moderate',
+        'duration': '1',
+        'surface_type': 'mixed',
+        'points_of_interest': '',
+        'email': f"bench{index}@example.com"
+    }
+
+
+def gpxpy_reference(route, preferences):
+    """The gpxpy object-graph serialisation used before services/gpx_writer.py"""
+    import gpxpy.gpx
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(track)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    track.segments.append(segment)
+    for coord in route['features'][0]['geometry']['coordinates']:
+        segment.points.append(gpxpy.gpx.GPXTrackPoint(
+            latitude=coord[1],
+            longitude=coord[0],
+            elevation=coord[2] if len(coord) > 2 else None
+        ))
+    gpx.name = f"Parcours {preferences['activity_type']} - {preferences['location']}"
+    gpx.author_name = "Sport Outdoor Route Generator"
+    return gpx.to_xml()
+
+
+def peak_memory_kb(func, *args):
+    tracemalloc.start()
+    try:
+        func(*args)
+        return round(tracemalloc.get_traced_memory()[1] / 1024)
+    finally:
+        tracemalloc.stop()
+
+
+def bench_serializers(sizes, repeats):
+    from services.gpx_service import GPXService
+    from services.route_generator import RouteGenerator
+
+    generator = RouteGenerator()
+    preferences = {'activity_type': 'hiking', 'location': 'Rennes', 'distance': 10}
+    candidates = {
+        'gpxpy (reference)': lambda route: gpxpy_reference(route, preferences),
+        'GPXService.create_gpx': lambda route: GPXService.create_gpx(route, preferences),
+        'RouteGenerator._convert_to_gpx': lambda route: generator._convert_to_gpx(route, preferences),
+    }
+
+    results = {}
+    for size in sizes:
+        route = synthetic_route(size)
+        point_count = len(route['features'][0]['geometry']['coordinates'])
+        runs = max(3, repeats * 2000 // size)
+        for name, func in candidates.items():
+            durations = []
+            output_size = 0
+            for _ in range(runs):
+                start = time.perf_counter()
+                output_size = len(func(route))
+                durations.append(time.perf_counter() - start)
+            stats = summarize(durations)
+            stats['points'] = point_count
+            stats['points_per_s'] = round(point_count / percentile(durations, 50))
+            stats['output_bytes'] = output_size
+            stats['peak_memory_kb'] = peak_memory_kb(func, route)
+            results.setdefault(name, {})[str(size)] = stats
+            print(f"  {name:32s} {point_count:6d} pts  p50 {stats['p50_ms']:9.2f} ms  "
+                  f"{stats['points_per_s']:>9d} pts/s  peak {stats['peak_memory_kb']:>7d} KiB")
+    return results
+
+
+def bench_exports(sizes, repeats):
+    from services.route_export import FORMATS, export_route
+
+    results = {}
+    for size in sizes:
+        coordinates = synthetic_route(size)['features'][0]['geometry']['coordinates']
+        runs = max(3, repeats * 2000 // size)
+        gpx_bytes = None
+        for name in FORMATS:
+            durations = []
+            for _ in range(runs):
+                start = time.perf_counter()
+                export = export_route(coordinates, name, name="Parcours hiking - Rennes", sport='hiking')
+                durations.append(time.perf_counter() - start)
+            gpx_bytes = gpx_bytes or len(export.content)
+            stats = summarize(durations)
+            stats['output_bytes'] = len(export.content)
+            stats['size_ratio'] = round(gpx_bytes / len(export.content), 1)
+            results.setdefault(name, {})[str(size)] = stats
+            print(f"  {name:10s} {len(coordinates):6d} pts  p50 {stats['p50_ms']:8.2f} ms  "
+                  f"{stats['output_bytes']:>9d} bytes  {stats['size_ratio']:5.1f}x smaller than GPX")
+    return results
+
+
+def bench_simplification(sizes, repeats):
+    from services.gpx_writer import render_gpx
+    from services.simplify import simplify_route
+
+    results = {}
+    for size in sizes:
+        route = synthetic_route(size)
+        runs = max(3, repeats * 2000 // size)
+        durations = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            simplified, report = simplify_route(route)
+            durations.append(time.perf_counter() - start)
+        stats = summarize(durations)
+        stats.update(report.to_dict())
+        stats['gpx_bytes_before'] = len(render_gpx(route['features'][0]['geometry']['coordinates']))
+        stats['gpx_bytes_after'] = len(render_gpx(simplified['features'][0]['geometry']['coordinates']))
+        results[str(size)] = stats
+        print(f"  {report.original_points:6d} -> {report.kept_points:5d} pts  p50 {stats['p50_ms']:8.2f} ms  "
+              f"max error {report.max_error_m:5.2f} m  ascent {report.ascent_delta_m:+8.1f} m  "
+              f"GPX {stats['gpx_bytes_before'] // 1024} -> {stats['gpx_bytes_after'] // 1024} KiB")
+    return results
+
+
+def bench_email(messages, latency_scale):
+    from services.email_service import EmailService
+    from services.route_export import export_route
+    from services.smtp_pool import get_smtp_pool
+
+    # Gmail takes a few hundred milliseconds for TCP, STARTTLS and AUTH
+    sink = SMTPSink(handshake_latency=0.15 * latency_scale).start()
+    host, port = sink.server.server_address[:2]
+    attachment = export_route(synthetic_route(2000)['features'][0]['geometry']['coordinates'], 'gpx.gz')
+    preferences = {'distance': 10, 'activity_type': 'hiking'}
+    results = {}
+    try:
+        for name, use_pool in (('one connection per email', False), ('pooled sessions', True)):
+            service = EmailService()
+            service.smtp_server, service.smtp_port, service.use_starttls = host, port, False
+            service.use_pool = use_pool
+            service.outbox = None  # measure the SMTP delivery itself
+            connections_before = sink.connections
+
+            def one(index):
+                start = time.perf_counter()
+                service.send_gpx_email(f"bench{index}@example.com", attachment, {}, preferences)
+                return time.perf_counter() - start
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                durations = list(executor.map(one, range(messages)))
+            elapsed = time.perf_counter() - start
+            stats = summarize(durations)
+            stats['throughput_rps'] = round(messages / elapsed, 2)
+            stats['connections'] = sink.connections - connections_before
+            results[name] = stats
+            print(f"  {name:26s} p50 {stats['p50_ms']:8.1f} ms  p99 {stats['p99_ms']:8.1f} ms  "
+                  f"{stats['throughput_rps']:7.2f} msg/s  {stats['connections']:3d} connections")
+    finally:
+        get_smtp_pool(host, port, service.sender_email, service.credentials, False).close()
+        sink.stop()
+    return results
+
+
+class StageRecorder:
+    """Collect PipelineExecutor.timings for every pipeline run"""
+
+    def __init__(self):
+        from services.pipeline import PipelineExecutor
+        self.runs = []
+        original_run = PipelineExecutor.run
+        recorder = self
+
+        def run(executor):
+            try:
+                return original_run(executor)
+            finally:
+                recorder.runs.append(dict(executor.timings))
+
+        PipelineExecutor.run = run
+
+    def reset(self):
+        self.runs = []
+
+    def stage_summary(self):
+        stages = {}
+        for timings in self.runs:
+            for name, seconds in timings.items():
+                stages.setdefault(name, []).append(seconds)
+        return {name: summarize(values) for name, values in stages.items()}
+
+
+STARTUP_SCRIPT = """
+import json, time
+start = time.perf_counter()
+import app
+imported = time.perf_counter()
+app.app.test_client().get('/')
+served = time.perf_counter()
+from config import PRELOAD_MODULES
+from services.lazy import preload_modules
+preload = preload_modules(PRELOAD_MODULES)
+print(json.dumps({'import': imported - start, 'first_request': served - imported, 'preload': preload}))
+"""
+
+
+def bench_startup(repeats):
+    from config import STARTUP_BUDGET_SECONDS
+
+    samples = {'import': [], 'first_request': [], 'preload': []}
+    for _ in range(repeats):
+        # A new interpreter each time: nothing is already imported
+        output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT], capture_output=True,
+                                text=True, check=True, env=os.environ.copy()).stdout
+        for name, seconds in json.loads(output.strip().splitlines()[-1]).items():
+            samples[name].append(seconds)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    import_s = results['import']['p50_ms'] / 1000
+    results['budget_s'] = STARTUP_BUDGET_SECONDS
+    results['within_budget'] = import_s <= STARTUP_BUDGET_SECONDS
+    for name in samples:
+        print(f"  {name:14s} p50 {results[name]['p50_ms']:8.1f} ms  p99 {results[name]['p99_ms']:8.1f} ms")
+    print(f"  import {'within' if results['within_budget'] else 'OVER'} the {STARTUP_BUDGET_SECONDS:.2f}s budget")
+    return results
+
+
+def bench_pipeline(name, call, recorder, levels, requests_per_level):
+    results = {}
+    for concurrency in levels:
+        recorder.reset()
+        count = max(requests_per_level, concurrency * 2)
+        latencies, errors = [], 0
+
+        def one(index):
+            start = time.perf_counter()
+            ok = call(index)
+            return ok, time.perf_counter() - start
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for ok, latency in pool.map(one, range(count)):
+                latencies.append(latency)
+                errors += 0 if ok else 1
+        elapsed = time.perf_counter() - start
+
+        results[str(concurrency)] = {
+            'requests': count,
+            'errors': errors,
+            'throughput_rps': round(count / elapsed, 2),
+            'latency': summarize(latencies),
+            'stages': recorder.stage_summary()
+        }
+        print(f"  {name:32s} c={concurrency:<3d} {count / elapsed:7.2f} req/s  "
+              f"p50 {results[str(concurrency)]['latency']['p50_ms']:9.1f} ms  "
+              f"p99 {results[str(concurrency)]['latency']['p99_ms']:9.1f} ms  errors {errors}")
+    return results
+
+
+def run_pipelines(levels, requests_per_level):
+    from app import app
+    from services.route_generator_service import RouteGeneratorService
+
+    recorder = StageRecorder()
+    client = app.test_client()
+    service = RouteGeneratorService()
+
+    def via_endpoint(index):
+        response = client.post('/generate-route', json=request_payload(index))
+        return response.status_code == 200
+
+    def via_service(index):
+        try:
+            return service.process_user_preferences(request_payload(index))['success']
+        except Exception as e:
+            logging.warning(f"process_user_preferences failed: {str(e)}")
+            return False
+
+    return {
+        'routes.generate_route': bench_pipeline('routes.generate_route', via_endpoint,
+                                                recorder, levels, requests_per_level),
+        'RouteGeneratorService': bench_pipeline('RouteGeneratorService', via_service,
+                                                recorder, levels, requests_per_level),
+    }
+
+
+def flatten(data, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, for numeric leaves only"""
+    flat = {}
+    for key, value in data.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, path + '.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def compare(baseline, current, threshold):
+    """
+    Print metrics that moved by more than threshold (fraction) in every
+    section present in both runs; return regressions. Sections missing from
+    either run (e.g. pipelines with --skip-pipelines) are listed and skipped.
+    """
+    sections = sorted((baseline.keys() & current.keys()) - {'meta'})
+    skipped = sorted((baseline.keys() ^ current.keys()) - {'meta'})
+    if skipped:
+        print(f"  not compared (missing from one run): {', '.join(skipped)}")
+    regressions = []
+    # A startup that fits the budget no longer does
+    was_within = baseline.get('startup', {}).get('within_budget')
+    if was_within and current.get('startup', {}).get('within_budget') is False:
+        print("  REGRESSION startup.within_budget: True -> False")
+        regressions.append('startup.within_budget')
+
+    old = flatten({k: baseline[k] for k in sections})
+    new = flatten({k: current[k] for k in sections})
+    for path in sorted(old.keys() & new.keys()):
+        if not path.endswith(COMPARED_METRICS) or not old[path]:
+            continue
+        change = (new[path] - old[path]) / old[path]
+        worse = -change if path.endswith(HIGHER_IS_BETTER) else change
+        if abs(change) < threshold:
+            continue
+        marker = 'REGRESSION' if worse > 0 else 'improved'
+        print(f"  {marker:10s} {path}: {old[path]} -> {new[path]} ({change:+.1%})")
+        if worse > 0:
+            regressions.append(path)
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks for the route pipeline")
+    parser.add_argument('--quick', action='store_true', help='small sizes and few requests')
+    parser.add_argument('--latency-scale', type=float, default=0.2,
+                        help='scale of the simulated upstream latencies (0 disables them)')
+    parser.add_argument('--requests', type=int, default=24, help='requests per concurrency level')
+    parser.add_argument('--repeats', type=int, default=5, help='serializer repetitions at 2000 points')
+    parser.add_argument('--skip-pipelines', action='store_true')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--threshold', type=float, default=0.10,
+                        help='relative change reported by --compare (default 0.10)')
+    args = parser.parse_args()
+
+    sizes = ROUTE_SIZES[:2] if args.quick else ROUTE_SIZES
+    levels = CONCURRENCY_LEVELS[:2] if args.quick else CONCURRENCY_LEVELS
+    requests_per_level = 4 if args.quick else args.requests
+
+    # Upstreams must be configured before config.py is imported
+    stub = StubServer(StubConfig(latency_scale=args.latency_scale, seed=42)).start()
+    sink = SMTPSink().start()
+    os.environ.update(stub.environment())
+    os.environ.update(sink.environment())
+    os.environ.update({
+        'CACHE_DIR': tempfile.mkdtemp(prefix='bench-cache-'),
+        'ROUTE_CACHE_ENABLED': 'false',
+        'CALIBRATION_ENABLED': 'false',
+        'RATE_LIMIT_ENABLED': 'false',
+        'DESCRIPTION_CACHE_ENABLED': 'false',
+    })
+    for name, value in (('ORS_API_KEY', 'benchmark-key-0000000000000000000000000'),
+                        ('OPENAI_API_KEY', 'sk-benchmark'),
+                        ('SENDER_EMAIL', 'bench@example.com'),
+                        ('GMAIL_CREDENTIALS', 'benchmark')):
+        os.environ.setdefault(name, value)
+
+    import config  # noqa: F401  (configures logging at DEBUG)
+    for logger in ('', 'werkzeug', 'httpx'):
+        logging.getLogger(logger).setLevel(logging.WARNING)
+
+    results = {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'options': {'quick': args.quick, 'latency_scale': args.latency_scale,
+                        'requests_per_level': requests_per_level, 'repeats': args.repeats}
+        }
+    }
+
+    print("Application startup")
+    results['startup'] = bench_startup(3 if args.quick else 10)
+    print("GPX serialisation")
+    results['serializers'] = bench_serializers(sizes, args.repeats)
+    print("Export formats")
+    results['exports'] = bench_exports(sizes, args.repeats)
+    print("Email delivery")
+    results['email'] = bench_email(8 if args.quick else 40, args.latency_scale)
+    print("Track simplification")
+    results['simplification'] = bench_simplification(sizes, args.repeats)
+    if not args.skip_pipelines:
+        print("Pipelines")
+        results['pipelines'] = run_pipelines(levels, requests_per_level)
+        # Emails leave through the outbox in the background
+        from services.email_outbox import get_email_outbox
+        get_email_outbox().flush(timeout=60)
+        results['meta']['emails_sent'] = len(sink.messages)
+
+    sink.stop()
+    stub.stop()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"Results written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        print(f"Comparison with {args.compare} (revision {baseline['meta'].get('revision')})")
+        if compare(baseline, results, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""
+Pre-generate the route catalogue for popular Breton start points.
+
+Every combination of start point, activity and distance from the
+ROUTE_CATALOGUE_* settings (or the options below) is routed with
+RouteGenerator.request_route, the generator /generate-route uses (an ORS
+round trip), in a process pool that shares the ORS rate limiter, and stored
+in ROUTE_CATALOGUE_PATH. /generate-route then serves matching requests from
+the catalogue without calling ORS. Like the live generator, the catalogue
+ignores the route type, level, landscape and elevation preference.
+
+    python build_catalogue.py --workers 2
+    python build_catalogue.py --places Rennes,Dinan --distances 5,10
+
+Entries already in the catalogue are skipped unless --refresh is given, so
+a run stopped by the daily ORS quota resumes where it left off.
+"""
+import argparse
+import json
+import os
+
+# A batch job can wait for the per-minute ORS quota much longer than a web request
+os.environ.setdefault('RATE_LIMIT_MAX_WAIT', '120')
+
+from config import (ACTIVITY_PROFILES, ROUTE_CATALOGUE_PLACES, ROUTE_CATALOGUE_DISTANCES_KM,
+                    ROUTE_CATALOGUE_WORKERS)
+from services.route_catalogue import RouteCatalogue, build_catalogue
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--places', type=_split, default=ROUTE_CATALOGUE_PLACES,
+                        help='comma-separated start points (gazetteer names)')
+    parser.add_argument('--activities', type=_split, default=list(ACTIVITY_PROFILES))
+    parser.add_argument('--distances', type=lambda value: [float(item) for item in _split(value)],
+                        default=ROUTE_CATALOGUE_DISTANCES_KM, help='comma-separated distances in km')
+    parser.add_argument('--workers', type=int, default=ROUTE_CATALOGUE_WORKERS)
+    parser.add_argument('--refresh', action='store_true', help='regenerate existing entries')
+    args = parser.parse_args()
+
+    catalogue = RouteCatalogue()
+    counts = build_catalogue(args.places, args.activities, args.distances,
+                             workers=args.workers, refresh=args.refresh, catalogue=catalogue)
+    print(json.dumps({**counts, **catalogue.stats()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
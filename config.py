@@ -1,46 +1,26 @@
 import os
 import logging
 
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+# Configure logging (DEBUG logs every ORS payload and response: for local debugging only)
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'INFO').upper()
+logging.basicConfig(level=LOG_LEVEL)
 
 # API Keys and Configuration
 OPENAI_API_KEY = os.environ.get('OPENAI_API_KEY')
 ORS_API_KEY = os.environ.get('ORS_API_KEY')
 GMAIL_CREDENTIALS = os.environ.get('GMAIL_CREDENTIALS')
 
-# Log API key status (without revealing the keys)
-if ORS_API_KEY:
-    logging.info("ORS API key is set")
-    # Log full ORS API key status for debugging
-    logging.info(f"ORS API key format: {ORS_API_KEY[:5]}...{ORS_API_KEY[-3:] if len(ORS_API_KEY) > 8 else ''}")
-    # Confirmer que la clé a le bon format
-    if not ORS_API_KEY.startswith('5b3ce3597851'):  # Format commun pour les clés ORS
-        logging.warning("ORS API key format may be incorrect! Check your environment variable.")
-    # Vérifier la longueur typique
-    if len(ORS_API_KEY) < 20:
-        logging.warning(f"ORS API key length suspicious: {len(ORS_API_KEY)} chars (should be ~40)")
-else:
-    logging.error("⚠️ CRITICAL: ORS API key is not set! Set the ORS_API_KEY environment variable.")
-    logging.error("The application will not function correctly without a valid API key")
-
-if OPENAI_API_KEY:
-    logging.info("OpenAI API key is set")
-else:
-    logging.warning("OpenAI API key is not set! Set the OPENAI_API_KEY environment variable.")
-
 # OpenRouteService API Configuration
-ORS_BASE_URL = "https://api.openrouteservice.org/v2"
+ORS_BASE_URL = os.environ.get('ORS_BASE_URL', "https://api.openrouteservice.org/v2")
 
-# Vérifier si l'environnement a changé
-if 'REPLIT_DB_URL' in os.environ:
-    logging.info("Running in Replit environment")
-else:
-    logging.info("Running in non-Replit environment")  
+# Other upstream endpoints (overridable to point at stub_server.py)
+NOMINATIM_BASE_URL = os.environ.get('NOMINATIM_BASE_URL', "https://nominatim.openstreetmap.org")
+OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL')  # None: the OpenAI client default
 
 # Email Configuration
-SMTP_SERVER = "smtp.gmail.com"
-SMTP_PORT = 587
+SMTP_SERVER = os.environ.get('SMTP_SERVER', "smtp.gmail.com")
+SMTP_PORT = int(os.environ.get('SMTP_PORT', '587'))
+SMTP_STARTTLS = os.environ.get('SMTP_STARTTLS', 'true').lower() in ('1', 'true', 'yes')
 SENDER_EMAIL = os.environ.get('SENDER_EMAIL')
 
 # Activity Types Mapping
@@ -64,4 +44,196 @@ DIFFICULTY_SETTINGS = {
         'max_elevation_gain': 1500,
         'max_distance': 30
     }
-}
\ No newline at end of file
+}
+
+# Asynchronous Job Configuration
+JOB_WORKERS = int(os.environ.get('JOB_WORKERS', '4'))
+JOB_MAX_PENDING = int(os.environ.get('JOB_MAX_PENDING', '32'))
+JOB_TTL_SECONDS = int(os.environ.get('JOB_TTL_SECONDS', '3600'))
+# Prometheus metrics served on /metrics (per gunicorn worker)
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+METRICS_PREFIX = os.environ.get('METRICS_PREFIX', 'routegen_')
+# Server-Sent Events stream of a job: keep-alive comment interval and client reconnect delay
+SSE_HEARTBEAT_SECONDS = float(os.environ.get('SSE_HEARTBEAT_SECONDS', '15'))
+SSE_RETRY_MS = int(os.environ.get('SSE_RETRY_MS', '2000'))
+
+# Local Cache Configuration
+CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), '.cache'))
+GEOCODE_CACHE_PATH = os.environ.get('GEOCODE_CACHE_PATH', os.path.join(CACHE_DIR, 'geocode.sqlite3'))
+GEOCODE_CACHE_TTL = int(os.environ.get('GEOCODE_CACHE_TTL', str(30 * 24 * 3600)))
+GEOCODE_CACHE_NEGATIVE_TTL = int(os.environ.get('GEOCODE_CACHE_NEGATIVE_TTL', str(24 * 3600)))
+GEOCODE_CACHE_MAX_ENTRIES = int(os.environ.get('GEOCODE_CACHE_MAX_ENTRIES', '5000'))
+
+# Offline gazetteer of Breton communes
+GAZETTEER_PATH = os.environ.get('GAZETTEER_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'communes_bretagne.csv'))
+
+# Nominatim Configuration
+NOMINATIM_TIMEOUT = float(os.environ.get('NOMINATIM_TIMEOUT', '10'))
+
+# ORS geocoding strategies: sequential (default) or raced in parallel
+ORS_GEOCODE_RACE = os.environ.get('ORS_GEOCODE_RACE', 'false').lower() in ('1', 'true', 'yes')
+# Strategies that win less than this share of races after enough samples are skipped
+ORS_GEOCODE_MIN_SAMPLES = int(os.environ.get('ORS_GEOCODE_MIN_SAMPLES', '50'))
+ORS_GEOCODE_MIN_WIN_RATE = float(os.environ.get('ORS_GEOCODE_MIN_WIN_RATE', '0.02'))
+
+# Concurrent route candidates: 0 or 1 keeps the sequential attempts
+ORS_ROUTE_CANDIDATES = int(os.environ.get('ORS_ROUTE_CANDIDATES', '0'))
+ORS_ROUTE_CONCURRENCY = int(os.environ.get('ORS_ROUTE_CONCURRENCY', '3'))
+
+# Distance calibration model for the ORS radius adjustment factor
+CALIBRATION_ENABLED = os.environ.get('CALIBRATION_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+CALIBRATION_PATH = os.environ.get('CALIBRATION_PATH', os.path.join(CACHE_DIR, 'calibration.sqlite3'))
+CALIBRATION_MIN_SAMPLES = int(os.environ.get('CALIBRATION_MIN_SAMPLES', '5'))
+CALIBRATION_WINDOW = int(os.environ.get('CALIBRATION_WINDOW', '50'))
+
+# Route result cache
+ROUTE_CACHE_ENABLED = os.environ.get('ROUTE_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ROUTE_CACHE_PATH = os.environ.get('ROUTE_CACHE_PATH', os.path.join(CACHE_DIR, 'routes.sqlite3'))
+ROUTE_CACHE_MAX_BYTES = int(os.environ.get('ROUTE_CACHE_MAX_BYTES', str(100 * 1024 * 1024)))
+ROUTE_CACHE_CELL_DEG = float(os.environ.get('ROUTE_CACHE_CELL_DEG', '0.005'))  # ≈ 500m
+ROUTE_CACHE_DISTANCE_STEP_KM = float(os.environ.get('ROUTE_CACHE_DISTANCE_STEP_KM', '1'))
+ROUTE_CACHE_VARIANTS = int(os.environ.get('ROUTE_CACHE_VARIANTS', '3'))
+# Pick among cached variants instead of always returning the same route
+ROUTE_CACHE_VARIETY = os.environ.get('ROUTE_CACHE_VARIETY', 'false').lower() in ('1', 'true', 'yes')
+
+# Shared outbound HTTP client
+HTTP_POOL_MAXSIZE = int(os.environ.get('HTTP_POOL_MAXSIZE', '10'))
+HTTP_DEFAULT_TIMEOUT = float(os.environ.get('HTTP_DEFAULT_TIMEOUT', '20'))
+HTTP_MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '2'))
+HTTP_BACKOFF_BASE = float(os.environ.get('HTTP_BACKOFF_BASE', '0.5'))
+HTTP_BACKOFF_MAX = float(os.environ.get('HTTP_BACKOFF_MAX', '5'))
+
+# Upstream rate limits (token buckets shared across workers via SQLite)
+RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+RATE_LIMIT_PATH = os.environ.get('RATE_LIMIT_PATH', os.path.join(CACHE_DIR, 'rate_limits.sqlite3'))
+RATE_LIMIT_MAX_WAIT = float(os.environ.get('RATE_LIMIT_MAX_WAIT', '15'))
+ORS_DIRECTIONS_PER_MINUTE = int(os.environ.get('ORS_DIRECTIONS_PER_MINUTE', '40'))
+ORS_DIRECTIONS_PER_DAY = int(os.environ.get('ORS_DIRECTIONS_PER_DAY', '2000'))
+ORS_GEOCODE_PER_MINUTE = int(os.environ.get('ORS_GEOCODE_PER_MINUTE', '100'))
+ORS_GEOCODE_PER_DAY = int(os.environ.get('ORS_GEOCODE_PER_DAY', '1000'))
+NOMINATIM_PER_SECOND = float(os.environ.get('NOMINATIM_PER_SECOND', '1'))
+
+# Track simplification before GPX export
+GPX_SIMPLIFY_ENABLED = os.environ.get('GPX_SIMPLIFY_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+GPX_MAX_POINTS = int(os.environ.get('GPX_MAX_POINTS', '2000'))
+GPX_SIMPLIFY_TOLERANCE_M = float(os.environ.get('GPX_SIMPLIFY_TOLERANCE_M', '1.0'))
+
+# Route export (email attachment format: gpx, gpx.gz, fit, polyline or geojson)
+EXPORT_DEFAULT_FORMAT = os.environ.get('EXPORT_DEFAULT_FORMAT', 'gpx')
+EXPORT_GZIP_LEVEL = int(os.environ.get('EXPORT_GZIP_LEVEL', '6'))
+
+# SMTP connection pool (authenticated sessions reused across emails)
+SMTP_POOL_ENABLED = os.environ.get('SMTP_POOL_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+SMTP_POOL_SIZE = int(os.environ.get('SMTP_POOL_SIZE', '2'))
+SMTP_MAX_MESSAGES_PER_CONNECTION = int(os.environ.get('SMTP_MAX_MESSAGES_PER_CONNECTION', '50'))
+SMTP_HEALTH_CHECK_AFTER = float(os.environ.get('SMTP_HEALTH_CHECK_AFTER', '10'))  # idle seconds before a NOOP
+SMTP_MAX_IDLE = float(os.environ.get('SMTP_MAX_IDLE', '240'))  # Gmail drops idle sessions after a few minutes
+SMTP_TIMEOUT = float(os.environ.get('SMTP_TIMEOUT', '30'))
+
+# Email outbox (messages are queued in SQLite and sent by background threads)
+OUTBOX_ENABLED = os.environ.get('OUTBOX_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+OUTBOX_PATH = os.environ.get('OUTBOX_PATH', os.path.join(CACHE_DIR, 'outbox.sqlite3'))
+OUTBOX_SENDERS = int(os.environ.get('OUTBOX_SENDERS', '2'))
+OUTBOX_MAX_ATTEMPTS = int(os.environ.get('OUTBOX_MAX_ATTEMPTS', '8'))
+OUTBOX_BACKOFF_BASE = float(os.environ.get('OUTBOX_BACKOFF_BASE', '30'))
+OUTBOX_BACKOFF_MAX = float(os.environ.get('OUTBOX_BACKOFF_MAX', '3600'))
+OUTBOX_LEASE_SECONDS = float(os.environ.get('OUTBOX_LEASE_SECONDS', '120'))  # reclaimed after a crash
+OUTBOX_POLL_INTERVAL = float(os.environ.get('OUTBOX_POLL_INTERVAL', '5'))
+OUTBOX_RETENTION = int(os.environ.get('OUTBOX_RETENTION', str(7 * 24 * 3600)))
+
+# Cache of OpenAI route descriptions, and deadline before the template fallback
+DESCRIPTION_CACHE_ENABLED = os.environ.get('DESCRIPTION_CACHE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+DESCRIPTION_CACHE_PATH = os.environ.get('DESCRIPTION_CACHE_PATH', os.path.join(CACHE_DIR, 'descriptions.sqlite3'))
+DESCRIPTION_CACHE_TTL = int(os.environ.get('DESCRIPTION_CACHE_TTL', str(30 * 24 * 3600)))
+DESCRIPTION_CACHE_MAX_ENTRIES = int(os.environ.get('DESCRIPTION_CACHE_MAX_ENTRIES', '5000'))
+DESCRIPTION_CACHE_VARIANTS = int(os.environ.get('DESCRIPTION_CACHE_VARIANTS', '3'))
+DESCRIPTION_CACHE_DISTANCE_STEP_KM = float(os.environ.get('DESCRIPTION_CACHE_DISTANCE_STEP_KM', '1'))
+DESCRIPTION_CACHE_ELEVATION_STEP_M = float(os.environ.get('DESCRIPTION_CACHE_ELEVATION_STEP_M', '50'))
+# Seconds before the template replaces GPT-4o; when streaming, only the first token must arrive in time
+DESCRIPTION_DEADLINE = float(os.environ.get('DESCRIPTION_DEADLINE', '10'))
+DESCRIPTION_WORKERS = int(os.environ.get('DESCRIPTION_WORKERS', '4'))
+
+
+# On-demand profiling of /generate-route (off by default; no cost when off)
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', 'false').lower() in ('1', 'true', 'yes')
+# Requests carrying this value in X-Profile-Token are profiled; it also guards /admin/profiles
+PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+# Share of requests profiled without the header (0.01 = 1 %)
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', '0'))
+# 'sampling' (wall-clock stack samples, collapsed stacks) or 'cprofile' (pstats)
+PROFILING_MODE = os.environ.get('PROFILING_MODE', 'sampling')
+PROFILING_INTERVAL = float(os.environ.get('PROFILING_INTERVAL', '0.005'))
+PROFILING_DIR = os.environ.get('PROFILING_DIR', os.path.join(CACHE_DIR, 'profiles'))
+PROFILING_MAX_FILES = int(os.environ.get('PROFILING_MAX_FILES', '50'))
+
+# Precomputed route catalogue (build_catalogue.py): popular start points served without calling ORS
+ROUTE_CATALOGUE_ENABLED = os.environ.get('ROUTE_CATALOGUE_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+ROUTE_CATALOGUE_PATH = os.environ.get('ROUTE_CATALOGUE_PATH', os.path.join(CACHE_DIR, 'catalogue.sqlite3'))
+ROUTE_CATALOGUE_PLACES = [place.strip() for place in os.environ.get(
+    'ROUTE_CATALOGUE_PLACES',
+    'Rennes,Brest,Quimper,Lorient,Vannes,Saint-Malo,Saint-Brieuc,Lannion,Morlaix,Dinan,'
+    'Fougères,Vitré,Concarneau,Douarnenez,Carnac,Quiberon,Perros-Guirec,Paimpol,Dinard,Cancale,'
+    'Pontivy,Auray,Redon,Crozon,Locronan,Huelgoat,Ploërmel,Josselin,Camaret-sur-Mer,Roscoff'
+).split(',') if place.strip()]
+ROUTE_CATALOGUE_DISTANCES_KM = [float(distance) for distance in
+                                os.environ.get('ROUTE_CATALOGUE_DISTANCES_KM', '5,10,15,20').split(',')]
+# A request matches an entry whose distance is within this fraction of the requested one
+ROUTE_CATALOGUE_DISTANCE_TOLERANCE = float(os.environ.get('ROUTE_CATALOGUE_DISTANCE_TOLERANCE', '0.1'))
+ROUTE_CATALOGUE_WORKERS = int(os.environ.get('ROUTE_CATALOGUE_WORKERS', '2'))
+
+# Per-request memory: tracemalloc peaks per stage (slows allocations, off by default) and a budget
+MEMORY_TRACKING = os.environ.get('MEMORY_TRACKING', 'false').lower() in ('1', 'true', 'yes')
+MEMORY_TRACE_FRAMES = int(os.environ.get('MEMORY_TRACE_FRAMES', '1'))
+# 0 disables the budget; routes needing more are simplified, ORS responses too big to parse are refused
+MEMORY_BUDGET_MB = float(os.environ.get('MEMORY_BUDGET_MB', '64'))
+# Measured on synthetic ORS routes (benchmarks): retained bytes per track point over a whole request,
+# and Python objects per byte of ORS JSON
+MEMORY_BYTES_PER_POINT = int(os.environ.get('MEMORY_BYTES_PER_POINT', '600'))
+MEMORY_PARSE_FACTOR = float(os.environ.get('MEMORY_PARSE_FACTOR', '7'))
+
+# Application startup (gunicorn.conf.py): preload in the master, then fork the workers
+GUNICORN_PRELOAD = os.environ.get('GUNICORN_PRELOAD', 'true').lower() in ('1', 'true', 'yes')
+# One worker by default: jobs, their event streams and metrics live in the worker's memory, so a
+# follow-up request reaching another worker would get 404 "Unknown job". Scale with GUNICORN_THREADS.
+GUNICORN_WORKERS = int(os.environ.get('WEB_CONCURRENCY', '1'))
+# Threaded workers: an open /jobs/<id>/events stream holds one thread, not a whole worker
+GUNICORN_THREADS = int(os.environ.get('GUNICORN_THREADS', '8'))
+# Heavy modules imported once in the master and inherited by every worker (nothing is instantiated)
+PRELOAD_MODULES = [module.strip() for module in os.environ.get(
+    'PRELOAD_MODULES',
+    'openai,requests,numpy,services.description_generator,services.openai_service,'
+    'services.route_generator,services.ors_service,services.location_validator,services.email_service'
+).split(',') if module.strip()]
+# Import time of the app that the startup benchmark flags as a regression
+STARTUP_BUDGET_SECONDS = float(os.environ.get('STARTUP_BUDGET_SECONDS', '0.6'))
+
+def log_configuration():
+    """Log the configuration checks; called once at startup (app.py), not on every import"""
+    # Log API key status (without revealing the keys)
+    if ORS_API_KEY:
+        logging.info("ORS API key is set")
+        # Log full ORS API key status for debugging
+        logging.info(f"ORS API key format: {ORS_API_KEY[:5]}...{ORS_API_KEY[-3:] if len(ORS_API_KEY) > 8 else ''}")
+        # Confirmer que la clé a le bon format
+        if not ORS_API_KEY.startswith('5b3ce3597851'):  # Format commun pour les clés ORS
+            logging.warning("ORS API key format may be incorrect! Check your environment variable.")
+        # Vérifier la longueur typique
+        if len(ORS_API_KEY) < 20:
+            logging.warning(f"ORS API key length suspicious: {len(ORS_API_KEY)} chars (should be ~40)")
+    else:
+        logging.error("⚠️ CRITICAL: ORS API key is not set! Set the ORS_API_KEY environment variable.")
+        logging.error("The application will not function correctly without a valid API key")
+
+    if OPENAI_API_KEY:
+        logging.info("OpenAI API key is set")
+    else:
+        logging.warning("OpenAI API key is not set! Set the OPENAI_API_KEY environment variable.")
+
+    if not SENDER_EMAIL or not GMAIL_CREDENTIALS:
+        logging.warning("SENDER_EMAIL or GMAIL_CREDENTIALS is not set: routes cannot be sent by email")
+
+    # Vérifier si l'environnement a changé
+    if 'REPLIT_DB_URL' in os.environ:
+        logging.info("Running in Replit environment")
+    else:
+        logging.info("Running in non-Replit environment")
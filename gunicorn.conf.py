@@ -0,0 +1,55 @@
+"""
+Gunicorn settings, read automatically from the working directory
+(`gunicorn main:app`).
+
+With preload (the default), the master imports the app and the heavy
+modules once, before forking: workers start with them already loaded and
+share their memory pages. Services themselves are built lazily in each
+worker (services/lazy.py), so no socket, thread or SQLite connection is
+created before the fork; post_fork still drops any instance the master
+may have built, as a safety net.
+
+Preload is turned off under --reload (the Replit workflow): a preloaded
+app lives in the master, which the reloader never re-imports.
+
+A single worker by default: asynchronous jobs, their Server-Sent Events
+and the /metrics registry are held in the worker's memory
+(services/job_service.py, services/metrics.py). With WEB_CONCURRENCY > 1,
+GET /jobs/<id> and /jobs/<id>/events may reach a worker that does not
+know the job; concurrency comes from the gthread threads instead.
+"""
+import logging
+import os
+import sys
+
+from config import GUNICORN_PRELOAD, GUNICORN_WORKERS, GUNICORN_THREADS, PRELOAD_MODULES
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+workers = GUNICORN_WORKERS
+worker_class = 'gthread'
+threads = GUNICORN_THREADS
+preload_app = GUNICORN_PRELOAD and '--reload' not in sys.argv
+timeout = 120
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and before the first fork
+    if workers > 1:
+        server.log.warning(f"{workers} workers: async jobs and /metrics are per worker, "
+                           "follow-up requests may not find their job")
+    if preload_app:
+        from services.lazy import preload_modules
+        elapsed = preload_modules(PRELOAD_MODULES)
+        server.log.info(f"Preloaded {len(PRELOAD_MODULES)} modules in {elapsed:.2f}s")
+
+
+def post_fork(server, worker):
+    from services.lazy import reset_services
+    reset_services()
+    logging.debug(f"Worker {worker.pid} forked")
+
+
+def post_worker_init(worker):
+    # The app is loaded in the worker by now, preloaded or not
+    from routes import start_background_senders
+    start_background_senders()
@@ -1,4 +1,6 @@
 from app import app
+from routes import start_background_senders
 
 if __name__ == "__main__":
+    start_background_senders()
     app.run(host="0.0.0.0", port=5000, debug=True)
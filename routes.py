@@ -1,50 +1,160 @@
-from flask import render_template, request, jsonify
+from flask import Response, abort, render_template, request, jsonify, send_from_directory, stream_with_context, url_for
 from app import app
-from services.route_generator import RouteGenerator
-from services.location_validator import LocationValidator
-from services.description_generator import DescriptionGenerator
-from services.email_service import EmailService
+from services.job_service import JobManager, JobQueueFull
+from services.lazy import LazyService
+from services.metrics import registry
+from services.profiling import list_profiles, profiled, should_profile
+from services.pipeline import PipelineExecutor, Stage, StageFailed
+from services.simplify import simplify_route
+from services.route_export import normalize_format
 import logging
 
-# Initialize services
-route_generator = RouteGenerator()
-location_validator = LocationValidator()
-description_generator = DescriptionGenerator()
-email_service = EmailService()
+# Services are built on first use (see services/lazy.py): importing this module
+# creates no OpenAI client or HTTP session, and a missing SMTP variable only
+# fails the requests that send email
+def _route_generator():
+    from services.route_generator import RouteGenerator
+    return RouteGenerator()
+
+def _location_validator():
+    from services.location_validator import LocationValidator
+    return LocationValidator()
+
+def _description_generator():
+    from services.description_generator import DescriptionGenerator
+    return DescriptionGenerator()
+
+def _email_service():
+    from services.email_service import EmailService
+    return EmailService()
+
+def _ors_service():
+    from services.ors_service import ORSService
+    return ORSService()
+
+def _gpx_service():
+    from services.gpx_service import GPXService
+    return GPXService()
+
+route_generator = LazyService(_route_generator)
+location_validator = LazyService(_location_validator)
+description_generator = LazyService(_description_generator)
+email_service = LazyService(_email_service)
+ors_service = LazyService(_ors_service)
+gpx_service = LazyService(_gpx_service)
+job_manager = JobManager()
+
+def _collect_service_metrics():
+    """Gauges read at scrape time; services not built yet are left out rather than built"""
+    yield ('jobs', 'gauge', "Asynchronous jobs held in memory, by status",
+           [({'status': status}, count) for status, count in job_manager.stats().items()])
+    if email_service.initialized and email_service.outbox is not None:
+        outbox = email_service.outbox.stats()
+        yield ('email_outbox_messages', 'gauge', "Email outbox messages, by status",
+               [({'status': status}, outbox[status]) for status in ('pending', 'sending', 'sent', 'dead')])
+
+registry.register_collector(_collect_service_metrics)
+
+def start_background_senders():
+    """
+    Start the email outbox senders at worker start (gunicorn.conf.py), so
+    messages left pending or leased by a crash or a restart are delivered
+    without waiting for this worker to queue a new email.
+    """
+    if not OUTBOX_ENABLED:
+        return
+    try:
+        email_service.start_outbox()
+    except Exception as e:
+        # Missing SMTP settings only fail the requests that send email
+        logging.warning(f"Email outbox senders not started: {str(e)}")
 
 @app.route('/')
 def index():
     return render_template('index.html')
 
-@app.route('/generate-route', methods=['POST'])
-def generate_route():
-    try:
-        data = request.json
-        logging.debug(f"Received route generation request with data: {data}")
+class RouteRequestError(Exception):
+    """Erreur du pipeline associée au code HTTP à renvoyer"""
 
-        # Validate input
-        required_fields = ['location', 'activity_type', 'level', 'distance', 
-                         'landscape', 'email']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'error': f'Missing required field: {field}'}), 400
+    def __init__(self, message, status_code=500):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _catalogue_entry(data):
+    """Precomputed route matching the request (build_catalogue.py), None to route live"""
+    from services.route_cache import wants_variety
+    from services.route_catalogue import get_route_catalogue
+    catalogue = get_route_catalogue()
+    # Variety mode asks for a new route every time, which a fixed catalogue cannot give
+    if catalogue is None or wants_variety(data):
+        return None
+    # Keyed like the live generator's routes: route_type, level and landscape do not change them
+    return catalogue.get(data['location'], data['activity_type'], data['distance'])
+
+def _run_route_pipeline(report, data):
+    """Run geocoding, routing, simplification, GPX, description and email for one request."""
+    # Asynchronous jobs stream stage results and description tokens to /jobs/<id>/events
+    publish = getattr(report, 'publish', None) or (lambda event, data=None: None)
+    # A catalogue hit skips geocoding, routing and simplification, and the GPX build
+    entry = _catalogue_entry(data)
 
+    def summarize(route):
+        return entry.summary if entry is not None else route_generator.summarize_route(route)
+
+    def validate_location(results):
+        if entry is not None:
+            publish('geocoded', {'latitude': entry.latitude, 'longitude': entry.longitude})
+            return entry
         # Validate location is in Brittany
         location_result = location_validator.validate_brittany_location(data['location'])
         if not location_result:
-            return jsonify({'error': 'Location not found or not in Brittany'}), 400
+            # Near-misses are offered back to the user, never geocoded silently
+            from services.gazetteer import get_gazetteer
+            suggestions = [place.name for place in get_gazetteer().suggest(data['location'])]
+            message = 'Location not found or not in Brittany'
+            if suggestions:
+                message += f" (did you mean {', '.join(suggestions)}?)"
+            raise RouteRequestError(message, 400)
         if not location_result.is_in_brittany:
-            return jsonify({'error': 'Location must be in Brittany'}), 400
+            raise RouteRequestError('Location must be in Brittany', 400)
+        publish('geocoded', {'latitude': location_result.latitude,
+                             'longitude': location_result.longitude})
+        return location_result
 
-        # Generate route
-        route_data = route_generator.generate_route(
+    def request_route(results):
+        if entry is not None:
+            publish('routed', {'distance': entry.summary['distance'],
+                               'elevation_gain': entry.summary['elevation_gain']})
+            return entry.route_data
+        location_result = results['geocoding']
+        route = route_generator.request_route(
             (location_result.latitude, location_result.longitude),
             data
         )
-        if not route_data:
-            return jsonify({'error': 'Failed to generate route'}), 500
+        segment = route['features'][0]['properties'].get('segments', [{}])[0]
+        publish('routed', {'distance': segment.get('distance'), 'elevation_gain': segment.get('ascent')})
+        return route
+
+    def simplify(results):
+        if entry is not None:
+            return entry.route_data
+        simplified, _ = simplify_route(results['routing'])
+        return simplified
 
-        # Generate description
+    def build_gpx(results):
+        # GPX by default, or the export format picked in the form
+        if entry is not None and data.get('export_format') == 'gpx':
+            export = entry.gpx_export()
+        else:
+            export = route_generator.export_route(results['simplifying'], data, data.get('export_format'))
+        publish('gpx_ready', {'format': export.format, 'filename': export.filename,
+                              'size': len(export.content)})
+        return export
+
+    def describe(results):
+        # The description only needs the elevation gain, so it runs alongside the GPX build
+        # on the full-resolution track
+        summary = summarize(results['routing'])
         description = description_generator.generate_description({
             'start_location': data['location'],
             'activity_type': data['activity_type'],
@@ -52,43 +162,197 @@ def generate_route():
             'distance_km': data['distance'],
             'landscape_type': data['landscape'],
             'route_type': data.get('route_type', 'loop'),
-            'elevation_gain': route_data.get('elevation_gain'),
+            'elevation_gain': summary.get('elevation_gain'),
+            'metrics': summary.get('metrics'),
             'points_of_interest': data.get('points_of_interest'),
             'estimated_duration': data.get('duration', '1h')
-        })
+        }, on_token=lambda text: publish('token', {'text': text}))
+        # Authoritative text: a cache hit or the template replaces whatever was streamed
+        publish('described', {'text': description})
+        return description
 
+    def send_email(results):
         # Send email with GPX file
+        sent = email_service.send_gpx_email(
+            data['email'],
+            results['gpx'],
+            results['describing'],
+            {
+                'distance': data['distance'],
+                'activity_type': data['activity_type']
+            }
+        )
+        publish('emailed', {'email': data['email']})
+        return sent
+
+    # A timed-out attempt keeps running (see PipelineExecutor), so only routing is retried, and
+    # only on network failures: quota (RateLimitExceeded), 413 and 4xx errors would fail again.
+    # The email is queued once; the outbox handles SMTP retries.
+    from requests.exceptions import ConnectionError as NetworkError, Timeout as NetworkTimeout
+    stages = [
+        Stage('geocoding', validate_location, timeout=20),
+        Stage('routing', request_route, depends_on=('geocoding',), timeout=45,
+              retries=1, retry_on=(NetworkError, NetworkTimeout),
+              error_message='Failed to generate route'),
+        Stage('simplifying', simplify, depends_on=('routing',), timeout=30,
+              error_message='Failed to generate route'),
+        Stage('gpx', build_gpx, depends_on=('simplifying',), timeout=30,
+              error_message='Failed to generate route'),
+        Stage('describing', describe, depends_on=('routing',), timeout=60),
+        Stage('emailing', send_email, depends_on=('gpx', 'describing'), timeout=60,
+              error_message='Failed to send email'),
+    ]
+
+    completed = []
+
+    def on_stage(name, event):
+        if event == 'started':
+            report(name, int(100 * len(completed) / len(stages)))
+        elif event == 'done':
+            completed.append(name)
+
+    results = PipelineExecutor(stages, on_stage=on_stage, name='generate_route').run()
+    summary = summarize(results['routing'])
+
+    return {
+        'success': True,
+        'message': 'Route generated and sent successfully',
+        'details': {
+            'distance': summary['distance'],
+            'elevation_gain': summary.get('elevation_gain'),
+            'location': data['location'],
+            'catalogue': entry is not None
+        }
+    }
+
+def _wants_async(data):
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    return bool(data.get('async'))
+
+@app.route('/generate-route', methods=['POST'])
+def generate_route():
+    try:
+        data = request.json
+        logging.debug(f"Received route generation request with data: {data}")
+
+        # Validate input
+        required_fields = ['location', 'activity_type', 'level', 'distance', 
+                         'landscape', 'email']
+        for field in required_fields:
+            if not data.get(field):
+                return jsonify({'error': f'Missing required field: {field}'}), 400
+
         try:
-            email_service.send_gpx_email(
-                data['email'],
-                route_data['gpx_content'],
-                description,
-                {
-                    'distance': data['distance'],
-                    'activity_type': data['activity_type']
-                }
-            )
-        except Exception as e:
-            logging.error(f"Failed to send email: {str(e)}")
-            return jsonify({'error': 'Failed to send email'}), 500
+            data['export_format'] = normalize_format(data.get('export_format'))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        return jsonify({
-            'success': True,
-            'message': 'Route generated and sent successfully',
-            'details': {
-                'distance': route_data['distance'],
-                'elevation_gain': route_data.get('elevation_gain'),
-                'location': data['location']
-            }
-        })
+        # Opt-in profiling (X-Profile-Token or PROFILING_SAMPLE_RATE); a no-op when disabled
+        pipeline = _run_route_pipeline
+        if should_profile(request.headers):
+            pipeline = profiled(_run_route_pipeline, label=str(data['location']))
 
+        if _wants_async(data):
+            try:
+                job = job_manager.submit(pipeline, data)
+            except JobQueueFull as e:
+                logging.warning(f"Job queue full: {str(e)}")
+                return jsonify({'error': 'Server busy, please retry shortly'}), 503
+            return jsonify({
+                'job_id': job.id,
+                'status': job.status,
+                'status_url': url_for('get_job', job_id=job.id),
+                'events_url': url_for('job_events', job_id=job.id)
+            }), 202
+
+        return jsonify(pipeline(lambda stage, progress: None, data))
+
+    except StageFailed as e:
+        return jsonify({'error': str(e)}), e.status_code
     except Exception as e:
         logging.error(f"Error generating route: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Report stage, progress and result of an asynchronous route job."""
+    job = job_manager.get(job_id)
+    if not job:
+        return jsonify({'error': 'Unknown job'}), 404
+
+    payload = job.to_dict()
+    if job.status == 'failed':
+        payload['status_code'] = job.status_code
+    return jsonify(payload)
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics of this worker: stage and span latencies, cache hits, upstream calls."""
+    if not METRICS_ENABLED:
+        return jsonify({'error': 'Metrics are disabled'}), 404
+    return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def _require_profiling_token():
+    token = request.headers.get('X-Profile-Token') or request.args.get('token')
+    if not (PROFILING_ENABLED and PROFILING_TOKEN and token
+            and hmac.compare_digest(token, PROFILING_TOKEN)):
+        abort(404)
+
+@app.route('/admin/profiles', methods=['GET'])
+def admin_profiles():
+    """List the request profiles written by the profiling hook, newest first."""
+    _require_profiling_token()
+    profiles = list_profiles(PROFILING_DIR)
+    for profile in profiles:
+        profile['url'] = url_for('admin_profile', name=profile['name'])
+    return jsonify({'mode': PROFILING_MODE, 'sample_rate': PROFILING_SAMPLE_RATE, 'profiles': profiles})
+
+@app.route('/admin/profiles/<name>', methods=['GET'])
+def admin_profile(name):
+    """Download one profile (.pstats for pstats/snakeviz, .collapsed for flamegraph.pl/speedscope)."""
+    _require_profiling_token()
+    return send_from_directory(PROFILING_DIR, name, as_attachment=True)
+
+def _sse(event):
+    return f"id: {event['id']}\nevent: {event['event']}\ndata: {json.dumps(event['data'])}\n\n"
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Stream the stages and description of an asynchronous route job as Server-Sent Events."""
+    if not job_manager.get(job_id):
+        return jsonify({'error': 'Unknown job'}), 404
+
+    # A reconnecting EventSource resumes after the last event it received
+    try:
+        last_event_id = int(request.headers.get('Last-Event-ID') or request.args.get('last_event_id') or 0)
+    except ValueError:
+        last_event_id = 0
+
+    def stream(after):
+        yield f"retry: {SSE_RETRY_MS}\n\n"
+        while True:
+            events = job_manager.wait_events(job_id, after, timeout=SSE_HEARTBEAT_SECONDS)
+            if events is None:
+                return
+            if not events:
+                # Comment line: keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                after = event['id']
+                yield _sse(event)
+                if event['event'] in ('done', 'error'):
+                    return
+
+    return Response(stream_with_context(stream(last_event_id)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/api-diagnostics', methods=['GET'])
 def api_diagnostics():
     """Tester la connectivité avec l'API ORS"""
+    from services.http_client import get_http_client
+
     results = {
         "environment": {},
         "ors_api": {
@@ -124,7 +388,7 @@ def api_diagnostics():
             'boundary.country': 'FRA'
         }
         
-        response = requests.get(test_url, headers=headers, params=params, timeout=10)
+        response = get_http_client().get(test_url, headers=headers, params=params, timeout=10)
         
         results["ors_api"]["connectivity"]["status_code"] = response.status_code
         results["ors_api"]["connectivity"]["response_type"] = response.headers.get('Content-Type')
@@ -145,6 +409,14 @@ def api_diagnostics():
         results["ors_api"]["connectivity"]["success"] = False
         results["ors_api"]["connectivity"]["exception"] = str(e)
     
+    # Latence et erreurs cumulées par hôte depuis le démarrage du worker
+    results["upstream_hosts"] = get_http_client().stats()
+
+    # File d'envoi des emails (messages en attente, en échec définitif)
+    if email_service.outbox is not None:
+        results["email_outbox"] = email_service.outbox.stats()
+        results["email_outbox"]["dead_letters"] = email_service.outbox.dead_letters(limit=5)
+    
     return jsonify(results)
 
 @app.route('/test-ors-api', methods=['GET'])
@@ -266,15 +538,10 @@ def test_ors_api():
             'message': f'Erreur inattendue lors du test: {str(e)}',
             'partial_results': results
         }), 500
-from services.openai_service import generate_route_description
-from services.ors_service import ORSService
-from services.gpx_service import GPXService
-from config import ORS_API_KEY, ORS_BASE_URL
+from config import (ORS_API_KEY, ORS_BASE_URL, SSE_HEARTBEAT_SECONDS, SSE_RETRY_MS, METRICS_ENABLED,
+                    PROFILING_ENABLED, PROFILING_TOKEN, PROFILING_DIR, PROFILING_MODE,
+                    PROFILING_SAMPLE_RATE, OUTBOX_ENABLED)
+import hmac
 import json
 import logging
-import requests
 import os
-
-ors_service = ORSService()
-gpx_service = GPXService()
-email_service = EmailService()
\ No newline at end of file
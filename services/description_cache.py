@@ -0,0 +1,215 @@
+import hashlib
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import closing
+from typing import Callable, Dict, Optional
+from config import (DESCRIPTION_CACHE_ENABLED, DESCRIPTION_CACHE_PATH, DESCRIPTION_CACHE_TTL,
+                    DESCRIPTION_CACHE_MAX_ENTRIES, DESCRIPTION_CACHE_VARIANTS,
+                    DESCRIPTION_CACHE_DISTANCE_STEP_KM, DESCRIPTION_CACHE_ELEVATION_STEP_M,
+                    DESCRIPTION_DEADLINE, DESCRIPTION_WORKERS)
+from services.geocode_cache import normalize_place_name
+from services.metrics import record_cache, registry
+
+DESCRIPTION_SOURCES = registry.counter(
+    'descriptions', "Descriptions servies par origine (cache, llm, template)", ('namespace', 'source'))
+
+# Champs dont la valeur exacte compte peu : ramenés à un pas
+DISTANCE_FIELDS = ('distance', 'distance_km')
+ELEVATION_FIELDS = ('elevation_gain',)
+PLACE_FIELDS = ('location', 'start_location')
+
+
+def _bucket(value, step: float):
+    try:
+        return round(float(value) / step) if step > 0 else float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def description_cache_key(namespace: str, inputs: Dict) -> str:
+    """
+    Clé de cache : entrées du prompt normalisées (lieu sans accents ni
+    casse, distance et dénivelé ramenés à un pas, texte en minuscules),
+    préfixées par le modèle et la version du prompt.
+    """
+    normalized = {}
+    for field, value in inputs.items():
+        if value is None or value == '':
+            continue
+        if field in PLACE_FIELDS:
+            normalized[field] = normalize_place_name(str(value))
+        elif field in DISTANCE_FIELDS:
+            normalized[field] = _bucket(value, DESCRIPTION_CACHE_DISTANCE_STEP_KM)
+        elif field in ELEVATION_FIELDS:
+            normalized[field] = _bucket(value, DESCRIPTION_CACHE_ELEVATION_STEP_M)
+        elif isinstance(value, str):
+            normalized[field] = value.strip().lower()
+        elif isinstance(value, (int, float, bool)):
+            normalized[field] = value
+    digest = hashlib.sha1(json.dumps(normalized, sort_keys=True).encode()).hexdigest()
+    return f"{namespace}|{digest}"
+
+
+class DescriptionCache:
+    """
+    Cache SQLite des descriptions générées par OpenAI.
+
+    Chaque clé conserve jusqu'à max_variants textes : tant que la
+    collection n'est pas complète, les requêtes manquent le cache pour la
+    remplir, puis un variant est tiré au hasard, afin que deux demandes
+    identiques ne reçoivent pas toujours le même texte. Les entrées
+    expirent après ttl_seconds ; au-delà de max_entries, les moins
+    récemment utilisées sont supprimées.
+    """
+
+    def __init__(self, path: str = DESCRIPTION_CACHE_PATH,
+                 ttl_seconds: int = DESCRIPTION_CACHE_TTL,
+                 max_entries: int = DESCRIPTION_CACHE_MAX_ENTRIES,
+                 max_variants: int = DESCRIPTION_CACHE_VARIANTS):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_variants = max(1, max_variants)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS descriptions ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " key TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS descriptions_key ON descriptions (key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS descriptions_last_used ON descriptions (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute("DELETE FROM descriptions WHERE key = ? AND created_at < ?",
+                             (key, now - self.ttl_seconds))
+                rows = conn.execute("SELECT id, content FROM descriptions WHERE key = ?", (key,)).fetchall()
+                if len(rows) < self.max_variants:
+                    if rows:
+                        logging.info(f"Cache de descriptions: {len(rows)}/{self.max_variants} variants "
+                                     f"pour {key}, génération d'un nouveau variant")
+                    record_cache('description', hit=False)
+                    return None
+                row_id, content = random.choice(rows)
+                conn.execute("UPDATE descriptions SET last_used = ? WHERE id = ?", (now, row_id))
+        except sqlite3.Error as e:
+            logging.warning(f"Cache de descriptions indisponible: {str(e)}")
+            record_cache('description', hit=False)
+            return None
+
+        record_cache('description', hit=True)
+        logging.info(f"Cache de descriptions: description trouvée pour {key}")
+        return content
+
+    def put(self, key: str, content: str):
+        now = time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT INTO descriptions (key, content, created_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, content, now, now)
+                )
+                # Garder au plus max_variants textes par clé (les plus récents)
+                conn.execute(
+                    "DELETE FROM descriptions WHERE key = ? AND id NOT IN ("
+                    " SELECT id FROM descriptions WHERE key = ? ORDER BY id DESC LIMIT ?)",
+                    (key, key, self.max_variants)
+                )
+                # Éviction LRU au-delà de la taille maximale
+                conn.execute(
+                    "DELETE FROM descriptions WHERE id IN ("
+                    " SELECT id FROM descriptions ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Impossible d'écrire dans le cache de descriptions: {str(e)}")
+
+
+_description_cache = None
+_description_cache_lock = threading.Lock()
+
+# Appels OpenAI exécutés hors du thread appelant, pour pouvoir les abandonner
+# à l'échéance sans perdre leur résultat
+_executor = ThreadPoolExecutor(max_workers=DESCRIPTION_WORKERS, thread_name_prefix='description')
+
+
+def get_description_cache() -> Optional[DescriptionCache]:
+    """Instance partagée, ou None si le cache est désactivé"""
+    global _description_cache
+    if not DESCRIPTION_CACHE_ENABLED:
+        return None
+    with _description_cache_lock:
+        if _description_cache is None:
+            _description_cache = DescriptionCache()
+        return _description_cache
+
+
+def cached_description(namespace: str, inputs: Dict, generate: Callable[[], str],
+                       fallback: Callable[[], str], deadline: float = DESCRIPTION_DEADLINE,
+                       cache: Optional[DescriptionCache] = None,
+                       first_token: Optional[threading.Event] = None) -> str:
+    """
+    Description en cache pour ces entrées, sinon generate() dans la limite
+    de deadline secondes, sinon fallback() (gabarit déterministe).
+
+    Un appel qui dépasse l'échéance continue en arrière-plan et alimente le
+    cache à son terme ; une erreur de generate() donne aussi le gabarit.
+
+    En streaming, generate() signale le premier token par first_token :
+    l'échéance ne porte alors que sur ce premier token. Une fois le texte
+    commencé chez le client, on attend la fin du flux plutôt que de le
+    remplacer par le gabarit.
+    """
+    cache = cache or get_description_cache()
+    key = description_cache_key(namespace, inputs)
+    if cache:
+        content = cache.get(key)
+        if content:
+            DESCRIPTION_SOURCES.inc(namespace=namespace, source='cache')
+            return content
+
+    def generate_and_store():
+        content = generate()
+        if cache and content:
+            cache.put(key, content)
+        return content
+
+    future = _executor.submit(generate_and_store)
+    try:
+        if first_token is None:
+            content = future.result(timeout=deadline)
+        else:
+            # Réveillé par le premier token ou par la fin de generate(), selon le premier
+            future.add_done_callback(lambda _: first_token.set())
+            if not first_token.wait(deadline):
+                raise FutureTimeout()
+            content = future.result()
+        if content:
+            DESCRIPTION_SOURCES.inc(namespace=namespace, source='llm')
+            return content
+        logging.warning(f"Description vide pour {key}, utilisation du gabarit")
+    except FutureTimeout:
+        logging.warning(f"Description non reçue après {deadline}s pour {key}, utilisation du gabarit")
+    except Exception as e:
+        logging.warning(f"Échec de la génération de description pour {key}, utilisation du gabarit: {str(e)}")
+    DESCRIPTION_SOURCES.inc(namespace=namespace, source='template')
+    return fallback()
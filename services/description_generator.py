@@ -1,48 +1,106 @@
 import os
 import json
+import threading
+import time
 from openai import OpenAI
-from typing import Dict
+from typing import Callable, Dict, Optional
+from config import OPENAI_BASE_URL
+from services.description_cache import cached_description
+from services.metrics import registry, span
+
+LLM_FIRST_TOKEN_SECONDS = registry.histogram(
+    'llm_first_token_seconds', "Delay before the first streamed token of a description", ('model',))
+
+# Bump the version when the prompt changes, so cached texts are not reused
+CACHE_NAMESPACE = "gpt-4o|description|v1"
 
 class DescriptionGenerator:
     def __init__(self):
         # the newest OpenAI model is "gpt-4o" which was released May 13, 2024.
         # do not change this unless explicitly requested by the user
         self.model = "gpt-4o"
-        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"))
+        self.client = OpenAI(api_key=os.environ.get("OPENAI_API_KEY"), base_url=OPENAI_BASE_URL)
         
-    def generate_description(self, route_data: Dict) -> str:
+    def generate_description(self, route_data: Dict,
+                             on_token: Optional[Callable[[str], None]] = None) -> str:
         """
-        Generate a personalized route description using GPT-4o
+        Generate a personalized route description using GPT-4o, served from the
+        description cache when possible and from a template when GPT-4o is too slow.
+
+        With on_token, GPT-4o is asked to stream and each text delta is passed to
+        on_token as it arrives; the returned text is still the complete description.
+        The deadline then only applies to the first token: once text has been sent,
+        the stream is never replaced by the template
         """
+        first_token = threading.Event() if on_token else None
+
+        def forward(text):
+            first_token.set()
+            on_token(text)
+
+        return cached_description(
+            CACHE_NAMESPACE,
+            self._cache_inputs(route_data),
+            generate=lambda: self._generate(route_data, forward if on_token else None),
+            fallback=lambda: self._fallback_description(route_data),
+            first_token=first_token
+        )
+
+    @staticmethod
+    def _cache_inputs(route_data: Dict) -> Dict:
+        """The prompt inputs that make two descriptions interchangeable"""
+        fields = ('start_location', 'activity_type', 'experience_level', 'distance_km',
+                  'landscape_type', 'route_type', 'elevation_gain', 'points_of_interest',
+                  'estimated_duration')
+        return {field: route_data.get(field) for field in fields}
+
+    def _generate(self, route_data: Dict,
+                  on_token: Optional[Callable[[str], None]] = None) -> Optional[str]:
         try:
-            prompt = self._create_prompt(route_data)
-            
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=[
-                    {
-                        "role": "system",
-                        "content": (
-                            "Tu es un expert en randonnée en Bretagne, spécialisé dans "
-                            "la création de descriptions de parcours personnalisées et "
-                            "engageantes. Utilise un ton chaleureux et professionnel."
-                        )
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                temperature=0.7,
-                max_tokens=500
-            )
-            
-            return response.choices[0].message.content
-            
+            with span('llm_description'):
+                return self._complete(route_data, on_token)
         except Exception as e:
             print(f"Error generating description: {str(e)}")
             return None
-            
+
+    def _complete(self, route_data: Dict, on_token: Optional[Callable[[str], None]]) -> str:
+        prompt = self._create_prompt(route_data)
+        start = time.perf_counter()
+
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=[
+                {
+                    "role": "system",
+                    "content": (
+                        "Tu es un expert en randonnée en Bretagne, spécialisé dans "
+                        "la création de descriptions de parcours personnalisées et "
+                        "engageantes. Utilise un ton chaleureux et professionnel."
+                    )
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            temperature=0.7,
+            max_tokens=500,
+            stream=on_token is not None
+        )
+
+        if on_token is None:
+            return response.choices[0].message.content
+
+        parts = []
+        for chunk in response:
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                if not parts:
+                    LLM_FIRST_TOKEN_SECONDS.observe(time.perf_counter() - start, model=self.model)
+                parts.append(delta)
+                on_token(delta)
+        return ''.join(parts)
+
     def _create_prompt(self, route_data: Dict) -> str:
         """Create a detailed prompt for GPT-4o"""
         return f"""
@@ -54,7 +112,7 @@ class DescriptionGenerator:
         - Niveau : {route_data['experience_level']}
         - Distance : {route_data['distance_km']} km
         - Dénivelé : {route_data.get('elevation_gain', 'N/A')} m
-        - Type de paysage : {route_data['landscape_type']}
+{self._format_metrics(route_data.get('metrics'))}        - Type de paysage : {route_data['landscape_type']}
         - Points d'intérêt : {route_data.get('points_of_interest', 'N/A')}
         - Type de parcours : {route_data['route_type']}
         - Durée estimée : {route_data['estimated_duration']}
@@ -72,3 +130,47 @@ class DescriptionGenerator:
         - Des conseils pratiques
         - Une conclusion encourageante
         """
+
+    @staticmethod
+    def _fallback_description(route_data: Dict) -> str:
+        """Deterministic description built from the route data alone"""
+        level_tips = {
+            'beginner': "Prenez votre temps, faites des pauses régulières et emportez de l'eau.",
+            'intermediate': "Gardez un rythme régulier dans les montées et pensez à vous hydrater.",
+            'advanced': "Le parcours se prête à une allure soutenue : gérez votre effort dans les côtes.",
+        }
+        elevation = route_data.get('elevation_gain')
+        elevation_text = f" pour {elevation:.0f} m de dénivelé positif" if isinstance(elevation, (int, float)) else ""
+        route_type = "en boucle" if route_data.get('route_type', 'loop') == 'loop' else "en aller-retour"
+        points_of_interest = route_data.get('points_of_interest')
+        interest_text = (f" Ouvrez l'œil : le parcours a été choisi pour ses points d'intérêt ({points_of_interest})."
+                         if points_of_interest and points_of_interest != 'none' else "")
+        return (
+            f"Au départ de {route_data['start_location']}, ce parcours {route_type} de "
+            f"{route_data['distance_km']} km en {route_data['activity_type']} vous emmène à travers "
+            f"des paysages de type {route_data['landscape_type']}{elevation_text}.\n\n"
+            f"Comptez environ {route_data.get('estimated_duration', '1h')} pour le boucler.{interest_text}\n\n"
+            f"{level_tips.get(route_data.get('experience_level'), level_tips['intermediate'])}\n\n"
+            f"Bonne sortie sur les chemins de Bretagne !"
+        )
+
+    @staticmethod
+    def _format_metrics(metrics: Optional[Dict]) -> str:
+        """Measured profile of the route (services.geometry), as extra prompt lines"""
+        if not metrics:
+            return ""
+        lines = [
+            f"        - Distance mesurée : {metrics['distance_m'] / 1000:.1f} km",
+            f"        - Dénivelé positif / négatif : +{metrics['ascent_m']:.0f} m / -{metrics['descent_m']:.0f} m",
+            f"        - Pente maximale : {metrics['max_grade_percent']:.0f} %",
+        ]
+        if metrics.get('min_elevation_m') is not None:
+            lines.append(f"        - Altitude : de {metrics['min_elevation_m']:.0f} m à {metrics['max_elevation_m']:.0f} m")
+        splits = metrics.get('splits') or []
+        if splits:
+            profile = ", ".join(
+                f"km {split['index']} : +{split['ascent_m']:.0f}/-{split['descent_m']:.0f} m"
+                for split in splits
+            )
+            lines.append(f"        - Profil kilomètre par kilomètre : {profile}")
+        return "\n".join(lines) + "\n"
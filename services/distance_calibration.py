@@ -0,0 +1,198 @@
+import logging
+import os
+import sqlite3
+import statistics
+import threading
+import time
+from contextlib import closing
+from typing import Dict, Optional
+from config import (CALIBRATION_ENABLED, CALIBRATION_PATH, CALIBRATION_MIN_SAMPLES,
+                    CALIBRATION_WINDOW)
+
+# Taille des cellules régionales, en degrés (≈ 28km x 18km en Bretagne)
+REGION_CELL_DEG = 0.25
+
+# Bornes de sécurité sur le facteur proposé
+MIN_FACTOR = 0.5
+MAX_FACTOR = 4.0
+
+
+def region_key(start_point) -> str:
+    """Cellule de grille contenant le point de départ [lon, lat]"""
+    lon, lat = start_point[0], start_point[1]
+    return f"{int(lat // REGION_CELL_DEG)}:{int(lon // REGION_CELL_DEG)}"
+
+
+def distance_bucket(distance_km: float) -> str:
+    if distance_km <= 5:
+        return 'short'
+    elif distance_km <= 15:
+        return 'medium'
+    return 'long'
+
+
+class CalibrationRun:
+    """Suivi des appels directions d'une génération d'itinéraire"""
+
+    def __init__(self, model, start_point, profile, route_type, distance_km):
+        self.model = model
+        self.region = region_key(start_point)
+        self.profile = profile
+        self.route_type = route_type
+        self.distance_km = distance_km
+        self.directions_calls = 0
+        self.initial_factor = model.suggest_factor(self.region, profile, route_type, distance_km)
+
+    @property
+    def calibrated(self) -> bool:
+        return self.initial_factor is not None
+
+    def observe(self, factor: float, achieved_km: Optional[float] = None, calls: int = 1):
+        """Enregistrer un appel directions ; achieved_km vaut None en cas d'échec"""
+        self.directions_calls += calls
+        if achieved_km:
+            self.model.record_observation(self.region, self.profile, self.route_type,
+                                          self.distance_km, factor, achieved_km)
+
+    def finish(self):
+        self.model.record_route(self.region, self.profile, self.route_type,
+                                self.distance_km, self.directions_calls, self.calibrated)
+
+
+class DistanceCalibration:
+    """
+    Modèle de calibration du facteur d'ajustement rayon/distance.
+
+    Chaque appel directions donne un facteur « idéal » a posteriori :
+    facteur utilisé × distance demandée / distance obtenue. Le facteur
+    proposé est la médiane des derniers facteurs idéaux pour la région, le
+    profil, le type de parcours et la tranche de distance, ou à défaut pour
+    toutes les régions. L'historique est conservé dans SQLite et survit
+    donc aux redémarrages.
+    """
+
+    def __init__(self, path: str = CALIBRATION_PATH,
+                 min_samples: int = CALIBRATION_MIN_SAMPLES,
+                 window: int = CALIBRATION_WINDOW,
+                 enabled: bool = CALIBRATION_ENABLED):
+        self.path = path
+        self.min_samples = min_samples
+        self.window = window
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        if not enabled:
+            return
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS observations ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " region TEXT NOT NULL, profile TEXT NOT NULL, route_type TEXT NOT NULL,"
+                " bucket TEXT NOT NULL, requested_km REAL NOT NULL, factor REAL NOT NULL,"
+                " achieved_km REAL NOT NULL, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS observations_key"
+                " ON observations (profile, route_type, bucket, region)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " region TEXT NOT NULL, profile TEXT NOT NULL, route_type TEXT NOT NULL,"
+                " requested_km REAL NOT NULL, directions_calls INTEGER NOT NULL,"
+                " calibrated INTEGER NOT NULL, created_at REAL NOT NULL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def start_run(self, start_point, profile, route_type, distance_km) -> CalibrationRun:
+        return CalibrationRun(self, start_point, profile, route_type, distance_km)
+
+    def suggest_factor(self, region, profile, route_type, distance_km) -> Optional[float]:
+        """Facteur calibré, ou None si l'historique est insuffisant"""
+        if not self.enabled:
+            return None
+        bucket = distance_bucket(distance_km)
+        queries = [
+            ("SELECT factor * requested_km / achieved_km FROM observations"
+             " WHERE profile = ? AND route_type = ? AND bucket = ? AND region = ?"
+             " ORDER BY id DESC LIMIT ?", (profile, route_type, bucket, region, self.window)),
+            ("SELECT factor * requested_km / achieved_km FROM observations"
+             " WHERE profile = ? AND route_type = ? AND bucket = ?"
+             " ORDER BY id DESC LIMIT ?", (profile, route_type, bucket, self.window)),
+        ]
+        try:
+            with closing(self._connect()) as conn:
+                for query, params in queries:
+                    factors = [row[0] for row in conn.execute(query, params)]
+                    if len(factors) >= self.min_samples:
+                        factor = max(MIN_FACTOR, min(MAX_FACTOR, statistics.median(factors)))
+                        logging.info(f"Facteur calibré {factor:.2f} ({len(factors)} observations)")
+                        return factor
+        except sqlite3.Error as e:
+            logging.warning(f"Calibration indisponible: {str(e)}")
+        return None
+
+    def record_observation(self, region, profile, route_type, requested_km, factor, achieved_km):
+        self._execute(
+            "INSERT INTO observations (region, profile, route_type, bucket, requested_km,"
+            " factor, achieved_km, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (region, profile, route_type, distance_bucket(requested_km), requested_km,
+             factor, achieved_km, time.time())
+        )
+
+    def record_route(self, region, profile, route_type, requested_km, directions_calls, calibrated):
+        self._execute(
+            "INSERT INTO routes (region, profile, route_type, requested_km, directions_calls,"
+            " calibrated, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (region, profile, route_type, requested_km, directions_calls, int(calibrated), time.time())
+        )
+
+    def _execute(self, query, params):
+        if not self.enabled:
+            return
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(query, params)
+        except sqlite3.Error as e:
+            logging.warning(f"Impossible d'enregistrer la calibration: {str(e)}")
+
+    def report(self) -> Dict:
+        """Nombre moyen d'appels directions par itinéraire, sans et avec calibration"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT calibrated, route_type, COUNT(*), AVG(directions_calls)"
+                " FROM routes GROUP BY calibrated, route_type"
+            ).fetchall()
+            observations = conn.execute("SELECT COUNT(*) FROM observations").fetchone()[0]
+
+        report = {'observations': observations, 'fixed_factor': {}, 'calibrated': {}}
+        for calibrated, route_type, count, average in rows:
+            key = 'calibrated' if calibrated else 'fixed_factor'
+            report[key][route_type] = {
+                'routes': count,
+                'avg_directions_calls': round(average, 2)
+            }
+        return report
+
+
+_calibration = None
+_calibration_lock = threading.Lock()
+
+
+def get_distance_calibration() -> DistanceCalibration:
+    """Instance partagée, créée au premier usage"""
+    global _calibration
+    with _calibration_lock:
+        if _calibration is None:
+            _calibration = DistanceCalibration()
+        return _calibration
+
+
+if __name__ == "__main__":
+    import json
+    print(json.dumps(DistanceCalibration().report(), indent=2))
@@ -0,0 +1,305 @@
+import logging
+import os
+import random
+import smtplib
+import sqlite3
+import threading
+import time
+import uuid
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional
+
+from config import (OUTBOX_PATH, OUTBOX_SENDERS, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE,
+                    OUTBOX_BACKOFF_MAX, OUTBOX_LEASE_SECONDS, OUTBOX_POLL_INTERVAL,
+                    OUTBOX_RETENTION)
+
+# deliver(sender, recipients, payload) sends one stored message or raises
+Deliver = Callable[[str, List[str], bytes], None]
+
+
+@dataclass
+class OutboxMessage:
+    id: int
+    sender: str
+    recipients: List[str]
+    payload: bytes
+    attempts: int
+    token: str  # identifies this claim; the row is only updated while the sender still holds it
+
+
+def is_permanent_failure(error: Exception) -> bool:
+    """5xx replies to MAIL, RCPT or DATA will not succeed on retry; anything else may"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(500 <= code < 600 for code, _ in error.recipients.values())
+    if isinstance(error, (smtplib.SMTPSenderRefused, smtplib.SMTPDataError)):
+        return 500 <= error.smtp_code < 600
+    return False
+
+
+class EmailOutbox:
+    """
+    Durable queue of outgoing emails in SQLite, drained by background sender
+    threads.
+
+    A message is stored as its serialised MIME bytes, so the request that
+    produced it can return as soon as it is queued. Senders claim one message
+    at a time with a lease (a sender that dies mid-send leaves the message to
+    be claimed again once the lease expires, also from another gunicorn
+    worker sharing the file). A sender whose send outlasted its lease finds
+    the message claimed by another sender and leaves its status alone; the
+    lease must therefore exceed the SMTP timeout to avoid double sends.
+    Failures are retried with exponential backoff; after max_attempts, or on
+    a permanent 5xx refusal, the message is kept as a dead letter for
+    inspection and requeue(). Sent messages lose their payload at once and
+    their row after `retention` seconds.
+    """
+
+    def __init__(self, path: str = OUTBOX_PATH,
+                 senders: int = OUTBOX_SENDERS,
+                 max_attempts: int = OUTBOX_MAX_ATTEMPTS,
+                 backoff_base: float = OUTBOX_BACKOFF_BASE,
+                 backoff_max: float = OUTBOX_BACKOFF_MAX,
+                 lease_seconds: float = OUTBOX_LEASE_SECONDS,
+                 poll_interval: float = OUTBOX_POLL_INTERVAL,
+                 retention: int = OUTBOX_RETENTION):
+        self.path = path
+        self.senders = max(1, senders)
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lease_seconds = lease_seconds
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS outbox ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " sender TEXT NOT NULL,"
+                " recipients TEXT NOT NULL,"
+                " payload BLOB,"
+                " status TEXT NOT NULL,"  # pending, sending, sent, dead
+                " attempts INTEGER NOT NULL DEFAULT 0,"
+                " next_attempt_at REAL NOT NULL,"
+                " locked_until REAL,"
+                " claim_token TEXT,"
+                " last_error TEXT,"
+                " created_at REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at)")
+            # Outbox files created before claim tokens existed
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outbox)")}
+            if 'claim_token' not in columns:
+                conn.execute("ALTER TABLE outbox ADD COLUMN claim_token TEXT")
+
+    def _connect(self):
+        # Autocommit: transactions are opened explicitly with BEGIN IMMEDIATE
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def enqueue(self, sender: str, recipients: List[str], payload: bytes) -> int:
+        """Store a message for delivery; raises sqlite3.Error if it could not be stored"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            cursor = conn.execute(
+                "INSERT INTO outbox (sender, recipients, payload, status, next_attempt_at, created_at, updated_at)"
+                " VALUES (?, ?, ?, 'pending', ?, ?, ?)",
+                (sender, '\n'.join(recipients), payload, now, now, now)
+            )
+            message_id = cursor.lastrowid
+        self._wakeup.set()
+        logging.info(f"Email {message_id} queued for {', '.join(recipients)}")
+        return message_id
+
+    def claim(self) -> Optional[OutboxMessage]:
+        """Lease the oldest due message, or None"""
+        now = time.time()
+        token = uuid.uuid4().hex
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = conn.execute(
+                    "SELECT id, sender, recipients, payload, attempts FROM outbox"
+                    " WHERE (status = 'pending' AND next_attempt_at <= ?)"
+                    "    OR (status = 'sending' AND locked_until < ?)"
+                    " ORDER BY next_attempt_at LIMIT 1",
+                    (now, now)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'sending', locked_until = ?, claim_token = ?, updated_at = ?"
+                        " WHERE id = ?",
+                        (now + self.lease_seconds, token, now, row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+        if not row:
+            return None
+        message_id, sender, recipients, payload, attempts = row
+        return OutboxMessage(message_id, sender, recipients.split('\n'), payload, attempts, token)
+
+    def mark_sent(self, message: OutboxMessage) -> bool:
+        """Record a delivery; False if the lease was lost to another sender meanwhile"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            updated = conn.execute(
+                "UPDATE outbox SET status = 'sent', payload = NULL, locked_until = NULL, claim_token = NULL,"
+                " attempts = attempts + 1, last_error = NULL, updated_at = ?"
+                " WHERE id = ? AND status = 'sending' AND claim_token = ?",
+                (now, message.id, message.token)
+            ).rowcount
+            conn.execute("DELETE FROM outbox WHERE status = 'sent' AND updated_at < ?",
+                         (now - self.retention,))
+        return bool(updated)
+
+    def mark_failed(self, message: OutboxMessage, error: str, permanent: bool = False) -> Optional[str]:
+        """
+        Schedule a retry, or dead-letter the message; returns the new status,
+        or None if the lease was lost to another sender meanwhile
+        """
+        now = time.time()
+        attempts = message.attempts + 1
+        status = 'dead' if permanent or attempts >= self.max_attempts else 'pending'
+        with closing(self._connect()) as conn:
+            updated = conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, locked_until = NULL,"
+                " claim_token = NULL, last_error = ?, updated_at = ?"
+                " WHERE id = ? AND status = 'sending' AND claim_token = ?",
+                (status, attempts, now + self._backoff(attempts), error[:500], now,
+                 message.id, message.token)
+            ).rowcount
+        return status if updated else None
+
+    def _backoff(self, attempts: int) -> float:
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (attempts - 1)))
+        # Jitter so that messages queued together are not all retried together
+        return delay * random.uniform(0.5, 1.5)
+
+    def process_one(self, deliver: Deliver) -> bool:
+        """Claim and send one due message; False when none is due"""
+        message = self.claim()
+        if message is None:
+            return False
+        try:
+            deliver(message.sender, message.recipients, message.payload)
+        except Exception as e:
+            status = self.mark_failed(message, str(e), permanent=is_permanent_failure(e))
+            if status is None:
+                logging.warning(f"Email {message.id} failed after its lease expired; "
+                                f"left to the sender that claimed it since: {str(e)}")
+            elif status == 'dead':
+                logging.error(f"Email {message.id} to {', '.join(message.recipients)} dead-lettered "
+                              f"after {message.attempts + 1} attempts: {str(e)}")
+            else:
+                logging.warning(f"Email {message.id} failed (attempt {message.attempts + 1}), "
+                                f"will retry: {str(e)}")
+            return True
+        if not self.mark_sent(message):
+            logging.warning(f"Email {message.id} sent after its lease expired; another sender "
+                            f"may send it again (lease {self.lease_seconds}s)")
+            return True
+        logging.info(f"Email {message.id} sent to {', '.join(message.recipients)}")
+        return True
+
+    def _run(self, deliver: Deliver):
+        while not self._stopping.is_set():
+            try:
+                if self.process_one(deliver):
+                    continue
+            except sqlite3.Error as e:
+                logging.warning(f"Email outbox unavailable: {str(e)}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def start(self, deliver: Deliver):
+        """Start the sender threads once; later calls are no-ops"""
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            self._threads = [threading.Thread(target=self._run, args=(deliver,), daemon=True,
+                                              name=f"email-outbox-{i}")
+                             for i in range(self.senders)]
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            self._stopping.set()
+            self._wakeup.set()
+            for thread in self._threads:
+                thread.join(timeout)
+            self._threads = []
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until no message is due or being sent (delayed retries excepted)"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            now = time.time()
+            with closing(self._connect()) as conn:
+                busy = conn.execute(
+                    "SELECT COUNT(*) FROM outbox WHERE status = 'sending'"
+                    " OR (status = 'pending' AND next_attempt_at <= ?)", (now,)
+                ).fetchone()[0]
+            if not busy:
+                return True
+            self._wakeup.set()
+            time.sleep(0.05)
+        return False
+
+    def requeue(self, message_id: int) -> bool:
+        """Give a dead letter a fresh set of attempts"""
+        now = time.time()
+        with closing(self._connect()) as conn:
+            updated = conn.execute(
+                "UPDATE outbox SET status = 'pending', attempts = 0, next_attempt_at = ?, updated_at = ?"
+                " WHERE id = ? AND status = 'dead'", (now, now, message_id)
+            ).rowcount
+        self._wakeup.set()
+        return bool(updated)
+
+    def dead_letters(self, limit: int = 20) -> List[Dict]:
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT id, recipients, attempts, last_error, created_at, updated_at FROM outbox"
+                " WHERE status = 'dead' ORDER BY updated_at DESC LIMIT ?", (limit,)
+            ).fetchall()
+        return [{'id': r[0], 'recipients': r[1].split('\n'), 'attempts': r[2], 'last_error': r[3],
+                 'created_at': r[4], 'updated_at': r[5]} for r in rows]
+
+    def stats(self) -> Dict:
+        with closing(self._connect()) as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall())
+            oldest = conn.execute("SELECT MIN(created_at) FROM outbox WHERE status IN ('pending', 'sending')"
+                                  ).fetchone()[0]
+        return {
+            'pending': counts.get('pending', 0),
+            'sending': counts.get('sending', 0),
+            'sent': counts.get('sent', 0),
+            'dead': counts.get('dead', 0),
+            'oldest_pending_age_s': round(time.time() - oldest, 1) if oldest else None,
+            'senders': len(self._threads)
+        }
+
+
+_outbox = None
+_outbox_lock = threading.Lock()
+
+
+def get_email_outbox() -> EmailOutbox:
+    """Shared outbox, created on first use"""
+    global _outbox
+    with _outbox_lock:
+        if _outbox is None:
+            _outbox = EmailOutbox()
+        return _outbox
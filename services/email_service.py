@@ -1,14 +1,25 @@
 import smtplib
+import sqlite3
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.application import MIMEApplication
-from config import SMTP_SERVER, SMTP_PORT, SENDER_EMAIL, GMAIL_CREDENTIALS
+from email.mime.base import MIMEBase
+from email import encoders
+from config import (SMTP_SERVER, SMTP_PORT, SMTP_STARTTLS, SMTP_POOL_ENABLED, OUTBOX_ENABLED,
+                    SENDER_EMAIL, GMAIL_CREDENTIALS)
 import logging
+from services.route_export import RouteExport
+from services.smtp_pool import get_smtp_pool
+from services.email_outbox import get_email_outbox
+from services.metrics import span
 
 class EmailService:
     def __init__(self):
         self.smtp_server = SMTP_SERVER
         self.smtp_port = SMTP_PORT
+        self.use_starttls = SMTP_STARTTLS
+        self.use_pool = SMTP_POOL_ENABLED
+        self.outbox = get_email_outbox() if OUTBOX_ENABLED else None
         if not SENDER_EMAIL:
             raise ValueError("SENDER_EMAIL environment variable is not set")
         self.sender_email = SENDER_EMAIL
@@ -16,6 +27,52 @@ class EmailService:
             raise ValueError("GMAIL_CREDENTIALS environment variable is not set")
         self.credentials = GMAIL_CREDENTIALS
 
+    def _deliver(self, msg):
+        """Queue the message in the outbox, or send it now when the outbox is off or unavailable"""
+        payload = msg.as_bytes()
+        recipients = [msg['To']]
+        if self.outbox is not None:
+            try:
+                self.outbox.enqueue(self.sender_email, recipients, payload)
+                # Normally already running since worker start (start_outbox); a no-op then
+                self.outbox.start(self._sendmail)
+                return
+            except sqlite3.Error as e:
+                logging.warning(f"Email outbox unavailable, sending directly: {str(e)}")
+        self._sendmail(self.sender_email, recipients, payload)
+
+    def start_outbox(self):
+        """Start the background senders, which also deliver mail left by a previous process"""
+        if self.outbox is not None:
+            self.outbox.start(self._sendmail)
+
+    @span('smtp_send')
+    def _sendmail(self, sender, recipients, payload):
+        """Send on a pooled authenticated session, or on a one-off connection"""
+        if self.use_pool:
+            pool = get_smtp_pool(self.smtp_server, self.smtp_port, self.sender_email,
+                                 self.credentials, self.use_starttls)
+            pool.sendmail(sender, recipients, payload)
+            return
+        with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
+            if self.use_starttls:
+                server.starttls()
+            server.login(self.sender_email, self.credentials)
+            server.sendmail(sender, recipients, payload)
+
+    @staticmethod
+    def _route_attachment(route_file):
+        if isinstance(route_file, RouteExport):
+            attachment = MIMEBase(route_file.maintype, route_file.subtype)
+            attachment.set_payload(route_file.content)
+            encoders.encode_base64(attachment)
+            filename = route_file.filename
+        else:
+            attachment = MIMEApplication(route_file, _subtype="gpx")
+            filename = 'parcours_bretagne.gpx'
+        attachment.add_header('Content-Disposition', 'attachment', filename=filename)
+        return attachment
+
     def send_gpx_email(self, recipient_email, gpx_content, route_description, preferences):
         """Send GPX file via email with personalized content."""
         try:
@@ -55,19 +112,13 @@ class EmailService:
 
             msg.attach(MIMEText(html_content, 'html'))
 
-            # Attach GPX file
-            gpx_attachment = MIMEApplication(gpx_content, _subtype="gpx")
-            gpx_attachment.add_header('Content-Disposition', 'attachment', 
-                                    filename='parcours_bretagne.gpx')
-            msg.attach(gpx_attachment)
+            # Attach the route: GPX text, or a RouteExport in the format the user picked
+            msg.attach(self._route_attachment(gpx_content))
 
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.sender_email, self.credentials)
-                server.send_message(msg)
+            # Queue (or send) the email
+            self._deliver(msg)
 
-            logging.debug("Email sent successfully")
+            logging.debug("Email handed over for delivery")
             return True
 
         except Exception as e:
@@ -0,0 +1,113 @@
+import bisect
+import csv
+import difflib
+import logging
+import threading
+from typing import Dict, List, NamedTuple, Optional
+from config import GAZETTEER_PATH
+from services.geocode_cache import normalize_place_name
+
+
+class Place(NamedTuple):
+    name: str
+    latitude: float
+    longitude: float
+    population: int
+
+
+class Gazetteer:
+    """
+    Index hors ligne des communes bretonnes.
+
+    Les données proviennent de GeoNames (cities500, licence CC BY 4.0) :
+    les localités de la région Bretagne de plus de 500 habitants, plus les
+    communes insulaires plus petites (Batz, Bréhat, Sein, Molène...). Ce
+    n'est pas la liste INSEE complète : les autres petites communes passent
+    par le géocodage en ligne. Deux communes ne partagent un nom que si ce
+    sont de vrais homonymes (Saint-Armel en Ille-et-Vilaine et Morbihan),
+    ce que vérifie tests/test_gazetteer.py.
+    Les noms sont indexés sous leur forme normalisée (sans accents, tirets
+    ni casse) ; une liste triée des clés permet la recherche par préfixe.
+    """
+
+    def __init__(self, path: str = GAZETTEER_PATH):
+        self._places: Dict[str, List[Place]] = {}
+        with open(path, newline='', encoding='utf-8') as f:
+            for row in csv.DictReader(f):
+                place = Place(row['name'], float(row['latitude']),
+                              float(row['longitude']), int(row['population']))
+                self._places.setdefault(normalize_place_name(place.name), []).append(place)
+
+        # Pour un nom partagé par plusieurs communes, la plus peuplée passe en premier
+        for places in self._places.values():
+            places.sort(key=lambda place: place.population, reverse=True)
+        self._keys = sorted(self._places)
+        logging.info(f"Gazetteer chargé: {len(self._keys)} communes")
+
+    def __len__(self):
+        return len(self._keys)
+
+    def lookup(self, name: str) -> Optional[Place]:
+        """Correspondance exacte sur le nom normalisé"""
+        places = self._places.get(normalize_place_name(name))
+        return places[0] if places else None
+
+    def prefix(self, prefix: str, limit: int = 10) -> List[Place]:
+        """Communes dont le nom normalisé commence par prefix"""
+        key = normalize_place_name(prefix)
+        matches = []
+        index = bisect.bisect_left(self._keys, key)
+        while index < len(self._keys) and self._keys[index].startswith(key) and len(matches) < limit:
+            matches.append(self._places[self._keys[index]][0])
+            index += 1
+        return matches
+
+    def fuzzy(self, name: str, limit: int = 5, cutoff: float = 0.85) -> List[Place]:
+        """Communes au nom proche (fautes de frappe, lettre manquante...)"""
+        keys = difflib.get_close_matches(normalize_place_name(name), self._keys, n=limit, cutoff=cutoff)
+        return [self._places[key][0] for key in keys]
+
+    def suggest(self, name: str, limit: int = 3) -> List[Place]:
+        """
+        Suggestions pour une saisie inconnue (« Vous vouliez dire... »).
+        Jamais utilisées pour géocoder : « Lille » est à 0,91 de « Laillé ».
+        Même initiale exigée, et un écart de longueur d'au plus un caractère
+        pour les noms courts, où une lettre pèse lourd dans le ratio.
+        """
+        key = normalize_place_name(name)
+        if not key:
+            return []
+        return [place for place in self.fuzzy(key, limit=limit * 3, cutoff=0.85)
+                if normalize_place_name(place.name)[0] == key[0]
+                and (len(key) > 8 or abs(len(normalize_place_name(place.name)) - len(key)) <= 1)][:limit]
+
+    def resolve(self, name: str) -> Optional[Place]:
+        """
+        Résoudre une saisie utilisateur : correspondance exacte sur le nom
+        normalisé, puis sur la partie avant la première virgule ("Rennes,
+        France"). Un nom approché n'est pas résolu : une ville hors de
+        Bretagne passerait pour une commune bretonne au nom voisin, et doit
+        au contraire passer par le géocodage en ligne.
+        """
+        candidates = [name]
+        if ',' in name:
+            candidates.append(name.split(',', 1)[0])
+
+        for candidate in candidates:
+            place = self.lookup(candidate)
+            if place:
+                return place
+        return None
+
+
+_gazetteer = None
+_gazetteer_lock = threading.Lock()
+
+
+def get_gazetteer() -> Gazetteer:
+    """Instance partagée, chargée au premier usage"""
+    global _gazetteer
+    with _gazetteer_lock:
+        if _gazetteer is None:
+            _gazetteer = Gazetteer()
+        return _gazetteer
@@ -0,0 +1,140 @@
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from contextlib import closing
+from dataclasses import dataclass
+from typing import Optional
+from config import (GEOCODE_CACHE_PATH, GEOCODE_CACHE_TTL, GEOCODE_CACHE_NEGATIVE_TTL,
+                    GEOCODE_CACHE_MAX_ENTRIES)
+from services.metrics import record_cache
+
+
+def normalize_place_name(name: str) -> str:
+    """Clé de cache insensible à la casse, aux accents, tirets et apostrophes"""
+    decomposed = unicodedata.normalize('NFKD', name or '')
+    without_accents = ''.join(c for c in decomposed if not unicodedata.combining(c))
+    # Ligatures que NFKD ne décompose pas : "Hœdic" s'écrit aussi "Hoedic"
+    without_accents = without_accents.replace('œ', 'oe').replace('Œ', 'OE')
+    normalized = re.sub(r"[\s\-'’,.]+", ' ', without_accents).strip().lower()
+    # Abréviations courantes : "St Malo", "Ste Anne d'Auray"
+    normalized = re.sub(r'\bst\b', 'saint', normalized)
+    return re.sub(r'\bste\b', 'sainte', normalized)
+
+
+@dataclass
+class GeocodeEntry:
+    found: bool
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+
+
+class GeocodeCache:
+    """
+    Cache SQLite des résultats de géocodage, partagé par LocationValidator
+    et ORSService.
+
+    Les recherches sans résultat sont aussi mises en cache (found=False)
+    avec une durée de vie plus courte. Au-delà de max_entries, les entrées
+    les moins récemment utilisées sont supprimées.
+    """
+
+    def __init__(self, path: str = GEOCODE_CACHE_PATH,
+                 ttl_seconds: int = GEOCODE_CACHE_TTL,
+                 negative_ttl_seconds: int = GEOCODE_CACHE_NEGATIVE_TTL,
+                 max_entries: int = GEOCODE_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS geocode ("
+                " key TEXT PRIMARY KEY,"
+                " found INTEGER NOT NULL,"
+                " latitude REAL,"
+                " longitude REAL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS geocode_last_used ON geocode (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, location_name: str) -> Optional[GeocodeEntry]:
+        """Renvoie l'entrée en cache, ou None si absente ou expirée"""
+        key = normalize_place_name(location_name)
+        now = time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                row = conn.execute(
+                    "SELECT found, latitude, longitude, created_at FROM geocode WHERE key = ?",
+                    (key,)
+                ).fetchone()
+                if not row:
+                    record_cache('geocode', hit=False)
+                    return None
+
+                found, latitude, longitude, created_at = row
+                ttl = self.ttl_seconds if found else self.negative_ttl_seconds
+                if now - created_at > ttl:
+                    conn.execute("DELETE FROM geocode WHERE key = ?", (key,))
+                    record_cache('geocode', hit=False)
+                    return None
+
+                conn.execute("UPDATE geocode SET last_used = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logging.warning(f"Cache de géocodage indisponible: {str(e)}")
+            record_cache('geocode', hit=False)
+            return None
+
+        record_cache('geocode', hit=True)
+        logging.info(f"Cache de géocodage: '{key}' trouvé ({'positif' if found else 'négatif'})")
+        return GeocodeEntry(found=bool(found), latitude=latitude, longitude=longitude)
+
+    def put(self, location_name: str, latitude: float, longitude: float):
+        self._store(location_name, True, latitude, longitude)
+
+    def put_not_found(self, location_name: str):
+        self._store(location_name, False, None, None)
+
+    def _store(self, location_name, found, latitude, longitude):
+        key = normalize_place_name(location_name)
+        now = time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO geocode (key, found, latitude, longitude, created_at, last_used)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    (key, int(found), latitude, longitude, now, now)
+                )
+                # Éviction LRU au-delà de la taille maximale
+                conn.execute(
+                    "DELETE FROM geocode WHERE key IN ("
+                    " SELECT key FROM geocode ORDER BY last_used DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Impossible d'écrire dans le cache de géocodage: {str(e)}")
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_geocode_cache() -> GeocodeCache:
+    """Instance partagée du cache, créée au premier usage"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = GeocodeCache()
+        return _cache
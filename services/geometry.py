@@ -0,0 +1,194 @@
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+
+EARTH_RADIUS_M = 6371008.8
+
+# Elevation is averaged over this distance before summing gain/loss, to
+# ignore the centimetre-level noise in DEM samples (ORS does the same)
+SMOOTHING_WINDOW_M = 100.0
+
+# Grades are measured over at least this distance, so that one noisy
+# sample 5m away does not produce a 40% "climb"
+GRADE_MIN_DISTANCE_M = 50.0
+
+SPLIT_LENGTH_M = 1000.0
+
+
+@dataclass
+class Split:
+    index: int            # 1-based kilometre number
+    distance_m: float     # length of the split (the last one is usually shorter)
+    ascent_m: float
+    descent_m: float
+    grade_percent: float  # net elevation change over the split
+
+
+@dataclass
+class RouteMetrics:
+    distance_m: float
+    ascent_m: float
+    descent_m: float
+    max_grade_percent: float
+    min_elevation_m: Optional[float]
+    max_elevation_m: Optional[float]
+    points: int
+    splits: List[Split] = field(default_factory=list)
+
+    @property
+    def distance_km(self) -> float:
+        return self.distance_m / 1000
+
+    @property
+    def has_elevation(self) -> bool:
+        return self.min_elevation_m is not None
+
+    def to_dict(self) -> Dict:
+        return asdict(self)
+
+
+def as_array(coordinates: Sequence[Sequence[float]]) -> np.ndarray:
+    """GeoJSON [lon, lat(, ele)] coordinates as an (N, 3) float array; missing elevation is NaN"""
+    if isinstance(coordinates, np.ndarray) and coordinates.ndim == 2 and coordinates.shape[1] == 3:
+        return coordinates.astype(float, copy=False)
+    if not len(coordinates):
+        return np.empty((0, 3))
+    try:
+        points = np.asarray(coordinates, dtype=float)
+    except (TypeError, ValueError):
+        # Ragged list or null elevations: some points have no elevation
+        points = np.array([[np.nan if v is None else v for v in c[:3]] + [np.nan] * (3 - len(c[:3]))
+                           for c in coordinates], dtype=float)
+    if points.ndim != 2 or points.shape[1] < 2:
+        raise ValueError("Coordinates must be [lon, lat] or [lon, lat, ele] pairs")
+    if points.shape[1] == 2:
+        points = np.column_stack([points, np.full(len(points), np.nan)])
+    return points[:, :3]
+
+
+def segment_lengths(points: np.ndarray) -> np.ndarray:
+    """Haversine distance in metres between consecutive points, shape (N-1,)"""
+    lon = np.radians(points[:, 0])
+    lat = np.radians(points[:, 1])
+    dlat = np.diff(lat)
+    dlon = np.diff(lon)
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def cumulative_distance(points: np.ndarray) -> np.ndarray:
+    """Distance from the start in metres at each point, shape (N,)"""
+    return np.concatenate([[0.0], np.cumsum(segment_lengths(points))])
+
+
+def smooth_elevation(elevation: np.ndarray, cumulative: np.ndarray,
+                     window_m: float = SMOOTHING_WINDOW_M) -> np.ndarray:
+    """Moving average of elevation over about window_m, using the median point spacing"""
+    if len(elevation) < 3 or window_m <= 0:
+        return elevation
+    spacing = np.median(np.diff(cumulative))
+    window = int(round(window_m / spacing)) if spacing > 0 else 1
+    window = min(len(elevation), max(1, window)) | 1  # odd, centred
+    if window == 1:
+        return elevation
+    half = window // 2
+    padded = np.concatenate([np.full(half, elevation[0]), elevation, np.full(half, elevation[-1])])
+    sums = np.cumsum(np.concatenate([[0.0], padded]))
+    return (sums[window:] - sums[:-window]) / window
+
+
+def compute_metrics(coordinates, smoothing_window_m: float = SMOOTHING_WINDOW_M,
+                    grade_distance_m: float = GRADE_MIN_DISTANCE_M,
+                    split_length_m: float = SPLIT_LENGTH_M) -> RouteMetrics:
+    """Distance, smoothed gain/loss, max grade and per-km splits of a track"""
+    points = as_array(coordinates)
+    count = len(points)
+    if count < 2:
+        return RouteMetrics(0.0, 0.0, 0.0, 0.0, None, None, count)
+
+    cumulative = cumulative_distance(points)
+    total = float(cumulative[-1])
+    elevation = points[:, 2]
+
+    if np.isnan(elevation).any():
+        # Without a complete elevation profile only distances are meaningful
+        ascent = descent = max_grade = 0.0
+        min_elevation = max_elevation = None
+        rises = np.zeros(count - 1)
+        smoothed = np.zeros(count)
+    else:
+        smoothed = smooth_elevation(elevation, cumulative, smoothing_window_m)
+        rises = np.diff(smoothed)
+        ascent = float(rises[rises > 0].sum())
+        descent = float(-rises[rises < 0].sum())
+        min_elevation = float(elevation.min())
+        max_elevation = float(elevation.max())
+
+        # Grade between each point and the first point at least grade_distance_m further on
+        ahead = np.searchsorted(cumulative, cumulative + grade_distance_m)
+        valid = ahead < count
+        if valid.any():
+            start = np.nonzero(valid)[0]
+            end = ahead[valid]
+            grades = (smoothed[end] - smoothed[start]) / (cumulative[end] - cumulative[start])
+            max_grade = float(np.abs(grades).max() * 100)
+        else:
+            max_grade = float(abs(smoothed[-1] - smoothed[0]) / total * 100) if total else 0.0
+
+    # Splits: index of the first point past each kilometre mark
+    climbed = np.concatenate([[0.0], np.cumsum(np.clip(rises, 0, None))])
+    dropped = np.concatenate([[0.0], np.cumsum(np.clip(-rises, 0, None))])
+    marks = np.arange(split_length_m, total, split_length_m)
+    bounds = np.concatenate([[0], np.searchsorted(cumulative, marks), [count - 1]])
+    starts, ends = bounds[:-1], bounds[1:]
+    lengths = cumulative[ends] - cumulative[starts]
+    net = smoothed[ends] - smoothed[starts]
+    splits = [
+        Split(index=i + 1,
+              distance_m=round(float(lengths[i]), 1),
+              ascent_m=round(float(climbed[ends[i]] - climbed[starts[i]]), 1),
+              descent_m=round(float(dropped[ends[i]] - dropped[starts[i]]), 1),
+              grade_percent=round(float(net[i] / lengths[i] * 100), 1) if lengths[i] else 0.0)
+        for i in range(len(starts)) if ends[i] > starts[i]
+    ]
+
+    return RouteMetrics(
+        distance_m=round(total, 1),
+        ascent_m=round(ascent, 1),
+        descent_m=round(descent, 1),
+        max_grade_percent=round(max_grade, 1),
+        min_elevation_m=min_elevation,
+        max_elevation_m=max_elevation,
+        points=count,
+        splits=splits
+    )
+
+
+def route_metrics(route_data: Dict) -> RouteMetrics:
+    """compute_metrics() for the first feature of an ORS GeoJSON response"""
+    return compute_metrics(route_data['features'][0]['geometry']['coordinates'])
+
+
+# Metres per ORS distance unit (the "units" request parameter; ascent is always in metres)
+ORS_DISTANCE_UNITS = {'m': 1.0, 'km': 1000.0, 'mi': 1609.344}
+
+
+def check_against_ors(route_data: Dict, metrics: RouteMetrics, distance_unit: str = 'm') -> bool:
+    """Log when ORS's own distance or ascent disagree with ours beyond normal variation"""
+    segments = route_data['features'][0].get('properties', {}).get('segments') or [{}]
+    consistent = True
+    # Ascent depends heavily on each tool's smoothing, so it gets a wider margin
+    # (key, our value, absolute slack in metres, relative tolerance, metres per ORS unit)
+    checks = (('distance', metrics.distance_m, 50.0, 0.05, ORS_DISTANCE_UNITS[distance_unit]),
+              ('ascent', metrics.ascent_m, 20.0, 0.25, 1.0))
+    for key, ours, slack, tolerance, scale in checks:
+        theirs = segments[0].get(key)
+        if theirs is None or key == 'ascent' and not metrics.has_elevation:
+            continue
+        theirs *= scale
+        if abs(ours - theirs) > max(slack, tolerance * abs(theirs)):
+            logging.warning(f"Route {key} mismatch: ORS {theirs:.1f}, computed {ours:.1f}")
+            consistent = False
+    return consistent
@@ -1,58 +1,61 @@
-import gpxpy
-import gpxpy.gpx
 from datetime import datetime
 import logging
+from services.gpx_writer import render_gpx
+from services.route_export import export_route
+from services.geometry import compute_metrics
 
 class GPXService:
     @staticmethod
-    def create_gpx(route_data, preferences):
-        """Convert route data to GPX format."""
-        try:
-            logging.debug(f"Creating GPX from route data: {route_data}")
-            gpx = gpxpy.gpx.GPX()
+    def _coordinates(route_data):
+        if not route_data.get('features') or not route_data['features']:
+            raise Exception("No route features found in response")
 
-            # Create first track in our GPX
-            gpx_track = gpxpy.gpx.GPXTrack()
-            gpx.tracks.append(gpx_track)
+        coordinates = route_data['features'][0]['geometry']['coordinates']
+        if not coordinates:
+            raise Exception("No coordinates found in route data")
+        return coordinates
 
-            # Create first segment in our track
-            gpx_segment = gpxpy.gpx.GPXTrackSegment()
-            gpx_track.segments.append(gpx_segment)
+    @staticmethod
+    def _metadata(coordinates, preferences):
+        metrics = compute_metrics(coordinates)
+        return {
+            'name': f"{preferences['activity_type'].title()} Route - {preferences['location']}",
+            'description': (
+                f"Generated route for {metrics.distance_km:.1f}km {preferences['activity_type']} "
+                f"(+{metrics.ascent_m:.0f}m / -{metrics.descent_m:.0f}m)"
+            ),
+            'author_name': "Route Generator",
+            'time': datetime.utcnow()
+        }
 
+    @staticmethod
+    def create_gpx(route_data, preferences):
+        """Convert route data to GPX format."""
+        try:
             # Extract coordinates from GeoJSON format
-            if not route_data.get('features') or not route_data['features']:
-                raise Exception("No route features found in response")
-
-            coordinates = route_data['features'][0]['geometry']['coordinates']
-            if not coordinates:
-                raise Exception("No coordinates found in route data")
-
+            coordinates = GPXService._coordinates(route_data)
             logging.debug(f"Processing {len(coordinates)} coordinates")
 
-            # Create points from coordinates [longitude, latitude, elevation]
-            for coord in coordinates:
-                try:
-                    point = gpxpy.gpx.GPXTrackPoint(
-                        latitude=coord[1],  # GeoJSON uses [longitude, latitude] order
-                        longitude=coord[0],
-                        elevation=coord[2] if len(coord) > 2 else None
-                    )
-                    gpx_segment.points.append(point)
-                    logging.debug(f"Added point: lat={coord[1]}, lon={coord[0]}")
-                except Exception as e:
-                    logging.error(f"Error adding point {coord}: {str(e)}")
-                    continue
-
-            # Add metadata
-            gpx.name = f"{preferences['activity_type'].title()} Route - {preferences['location']}"
-            gpx.description = f"Generated route for {preferences['distance']}km {preferences['activity_type']}"
-            gpx.author_name = "Route Generator"
-            gpx.time = datetime.utcnow()
-
-            xml_output = gpx.to_xml()
-            logging.debug(f"Generated GPX with {len(gpx_segment.points)} points")
+            # Coordinates are [longitude, latitude, elevation], written straight to XML
+            xml_output = render_gpx(coordinates, **GPXService._metadata(coordinates, preferences))
+            logging.debug(f"Generated GPX with {len(coordinates)} points")
             return xml_output
 
         except Exception as e:
             logging.error(f"Failed to create GPX file: {str(e)}")
-            raise Exception(f"Failed to create GPX file: {str(e)}")
\ No newline at end of file
+            raise Exception(f"Failed to create GPX file: {str(e)}")
+
+    @staticmethod
+    def create_export(route_data, preferences, export_format=None):
+        """Route in the requested export format (see services/route_export.py)."""
+        try:
+            coordinates = GPXService._coordinates(route_data)
+            export = export_route(coordinates, export_format,
+                                  sport=preferences.get('activity_type'),
+                                  **GPXService._metadata(coordinates, preferences))
+            logging.debug(f"Generated {export.format} export with {export.points} points ({len(export.content)} bytes)")
+            return export
+
+        except Exception as e:
+            logging.error(f"Failed to create {export_format or 'default'} export: {str(e)}")
+            raise Exception(f"Failed to create route export: {str(e)}")
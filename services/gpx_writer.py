@@ -0,0 +1,98 @@
+import logging
+from datetime import datetime
+from typing import Iterable, Iterator, Optional, Sequence
+from xml.sax.saxutils import escape
+
+# Same creator and namespaces as gpxpy, so files are identical to what we sent before
+GPX_HEADER = (
+    '<?xml version="1.0" encoding="UTF-8"?>\n'
+    '<gpx xmlns="http://www.topografix.com/GPX/1/1"'
+    ' xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance"'
+    ' xsi:schemaLocation="http://www.topografix.com/GPX/1/1 http://www.topografix.com/GPX/1/1/gpx.xsd"'
+    ' version="1.1" creator="gpx.py -- https://github.com/tkrajina/gpxpy">'
+)
+
+POINT = '\n      <trkpt lat="%s" lon="%s">\n      </trkpt>'
+POINT_WITH_ELEVATION = '\n      <trkpt lat="%s" lon="%s">\n        <ele>%s</ele>\n      </trkpt>'
+
+DEFAULT_CHUNK_POINTS = 2000
+
+
+def format_number(value) -> str:
+    """Number formatting of gpxpy: repr for floats, without scientific notation"""
+    text = str(value)
+    if 'e' in text:
+        return format(value, '.10f').rstrip('0').rstrip('.')
+    return text
+
+
+def _metadata(name, description, author_name, time) -> str:
+    if name is None and description is None and author_name is None and time is None:
+        return ''
+    parts = ['\n  <metadata>']
+    if name is not None:
+        parts.append(f'\n    <name>{escape(name)}</name>')
+    if description is not None:
+        parts.append(f'\n    <desc>{escape(description)}</desc>')
+    if author_name is not None:
+        parts.append(f'\n    <author>\n      <name>{escape(author_name)}</name>\n    </author>')
+    if time is not None:
+        parts.append(f"\n    <time>{time.isoformat().replace('+00:00', 'Z')}</time>")
+    parts.append('\n  </metadata>')
+    return ''.join(parts)
+
+
+def _points(coordinates: Iterable[Sequence[float]], chunk_points: int) -> Iterator[str]:
+    """Track points, chunk_points at a time, straight from [lon, lat(, ele)] lists"""
+    fmt = format_number
+    chunk = []
+    append = chunk.append
+    skipped = 0
+    for coord in coordinates:
+        if len(coord) < 2:
+            skipped += 1
+            continue
+        # gpxpy stores `latitude or 0`, so 0.0 and -0.0 are written as "0"
+        lat = fmt(coord[1]) if coord[1] else '0'
+        lon = fmt(coord[0]) if coord[0] else '0'
+        if len(coord) > 2 and coord[2] is not None:
+            append(POINT_WITH_ELEVATION % (lat, lon, fmt(coord[2])))
+        else:
+            append(POINT % (lat, lon))
+        if len(chunk) >= chunk_points:
+            yield ''.join(chunk)
+            chunk.clear()
+    if chunk:
+        yield ''.join(chunk)
+    if skipped:
+        logging.warning(f"Skipped {skipped} coordinates without latitude/longitude")
+
+
+def iter_gpx(coordinates: Iterable[Sequence[float]],
+             name: Optional[str] = None,
+             description: Optional[str] = None,
+             author_name: Optional[str] = None,
+             time: Optional[datetime] = None,
+             chunk_points: int = DEFAULT_CHUNK_POINTS) -> Iterator[str]:
+    """
+    Stream a GPX 1.1 document with a single track from GeoJSON coordinates.
+
+    Yields text chunks of at most chunk_points track points; no per-point
+    objects are created. The output is byte-for-byte what gpxpy's to_xml()
+    produces for the same track and metadata.
+    """
+    yield GPX_HEADER + _metadata(name, description, author_name, time) + '\n  <trk>\n    <trkseg>'
+    yield from _points(coordinates, chunk_points)
+    yield '\n    </trkseg>\n  </trk>\n</gpx>'
+
+
+def iter_gpx_bytes(coordinates: Iterable[Sequence[float]], encoding: str = 'utf-8',
+                   **kwargs) -> Iterator[bytes]:
+    """iter_gpx() encoded, for streaming responses or files"""
+    for chunk in iter_gpx(coordinates, **kwargs):
+        yield chunk.encode(encoding)
+
+
+def render_gpx(coordinates: Iterable[Sequence[float]], **kwargs) -> str:
+    """The whole document as a string (drop-in for gpxpy's to_xml())"""
+    return ''.join(iter_gpx(coordinates, **kwargs))
@@ -0,0 +1,202 @@
+import logging
+import random
+import threading
+import time
+from typing import Dict, Optional
+from urllib.parse import urlparse
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from config import (HTTP_POOL_MAXSIZE, HTTP_DEFAULT_TIMEOUT, HTTP_MAX_RETRIES,
+                    HTTP_BACKOFF_BASE, HTTP_BACKOFF_MAX, RATE_LIMIT_MAX_WAIT)
+from services.rate_limiter import get_rate_limiter, upstream_for_url
+from services.metrics import UPSTREAM_SECONDS, registry
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+# Méthodes qu'une erreur réseau en cours d'échange permet de rejouer sans risque
+IDEMPOTENT_METHODS = {'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'}
+
+UPSTREAM_RETRIES = registry.counter('upstream_retries', "Nouvelles tentatives d'appels HTTP sortants", ('host',))
+UPSTREAM_THROTTLE_SECONDS = registry.counter(
+    'upstream_throttle_seconds', "Attente imposée par le limiteur de débit avant les appels sortants", ('host',))
+
+
+class HostStats:
+    """Compteurs de latence et d'erreurs pour un hôte"""
+
+    def __init__(self):
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.throttle_wait = 0.0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+        self.status_codes: Dict[int, int] = {}
+
+    def to_dict(self):
+        return {
+            'requests': self.requests,
+            'errors': self.errors,
+            'retries': self.retries,
+            'throttle_wait_s': round(self.throttle_wait, 2),
+            'avg_latency_ms': round(1000 * self.total_latency / self.requests, 1) if self.requests else None,
+            'max_latency_ms': round(1000 * self.max_latency, 1),
+            'status_codes': dict(self.status_codes)
+        }
+
+
+class HTTPClient:
+    """
+    Client HTTP partagé par tous les services : une session requests par
+    hôte (pool de connexions keep-alive), un délai par défaut, des
+    nouvelles tentatives avec backoff exponentiel et gigue sur les erreurs
+    réseau et les codes 429/5xx, et des compteurs par hôte.
+
+    Une requête non idempotente (POST) n'est rejouée après une erreur
+    réseau que si elle n'a pas pu partir : délai de connexion dépassé ou
+    connexion refusée. Après un délai de lecture ou une coupure en cours
+    d'échange, le serveur a pu la traiter : l'erreur est propagée.
+
+    Les appels vers ORS et Nominatim passent d'abord par le limiteur de
+    débit partagé : en cas de quota épuisé, l'appel attend un créneau
+    (RATE_LIMIT_MAX_WAIT au plus, sur l'ensemble des tentatives) puis lève
+    RateLimitExceeded.
+
+    Les exceptions requests sont propagées telles quelles après la dernière
+    tentative ; pour un code HTTP en échec, la dernière réponse est renvoyée.
+    """
+
+    def __init__(self, pool_maxsize: int = HTTP_POOL_MAXSIZE,
+                 default_timeout: float = HTTP_DEFAULT_TIMEOUT,
+                 max_retries: int = HTTP_MAX_RETRIES,
+                 backoff_base: float = HTTP_BACKOFF_BASE,
+                 backoff_max: float = HTTP_BACKOFF_MAX):
+        self.pool_maxsize = pool_maxsize
+        self.default_timeout = default_timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._sessions: Dict[str, requests.Session] = {}
+        self._stats: Dict[str, HostStats] = {}
+        self._lock = threading.Lock()
+
+    def _session(self, host: str) -> requests.Session:
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_maxsize, max_retries=0)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._sessions[host] = session
+                self._stats[host] = HostStats()
+            return session
+
+    def get(self, url, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, timeout=None,
+                retries: Optional[int] = None, **kwargs) -> requests.Response:
+        host = urlparse(url).netloc
+        session = self._session(host)
+        retries = self.max_retries if retries is None else retries
+        timeout = timeout or self.default_timeout
+        limiter = get_rate_limiter()
+        upstream = upstream_for_url(url) if limiter else None
+        deadline = time.time() + RATE_LIMIT_MAX_WAIT
+
+        for attempt in range(retries + 1):
+            if upstream:
+                waited = time.perf_counter()
+                limiter.acquire(upstream, max_wait=max(0.0, deadline - time.time()))
+                self._record_throttle(host, time.perf_counter() - waited)
+
+            start = time.perf_counter()
+            try:
+                response = session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._record(host, time.perf_counter() - start, None, retried=attempt > 0)
+                if attempt >= retries or (method.upper() not in IDEMPOTENT_METHODS
+                                          and not _request_not_sent(e)):
+                    raise
+                delay = self._backoff(attempt)
+                logging.warning(f"{method} {host}: {type(e).__name__}, nouvel essai dans {delay:.2f}s")
+                time.sleep(delay)
+                continue
+
+            self._record(host, time.perf_counter() - start, response.status_code, retried=attempt > 0)
+            if upstream:
+                limiter.observe(upstream, response)
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= retries:
+                return response
+
+            if upstream and response.status_code == 429:
+                # Le limiteur a enregistré le blocage : acquire() fera l'attente
+                logging.warning(f"{method} {host}: code 429, attente d'un créneau {upstream}")
+                continue
+            delay = self._backoff(attempt, response.headers.get('Retry-After'))
+            logging.warning(f"{method} {host}: code {response.status_code}, nouvel essai dans {delay:.2f}s")
+            time.sleep(delay)
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        # Gigue pour éviter que les workers ne réessaient tous en même temps
+        return delay * random.uniform(0.5, 1.5)
+
+    def _record(self, host, latency, status_code, retried):
+        UPSTREAM_SECONDS.observe(latency, host=host, status=status_code or 'error')
+        if retried:
+            UPSTREAM_RETRIES.inc(host=host)
+        with self._lock:
+            stats = self._stats[host]
+            stats.requests += 1
+            stats.total_latency += latency
+            stats.max_latency = max(stats.max_latency, latency)
+            if retried:
+                stats.retries += 1
+            if status_code is None or status_code in RETRY_STATUS_CODES:
+                stats.errors += 1
+            if status_code is not None:
+                stats.status_codes[status_code] = stats.status_codes.get(status_code, 0) + 1
+
+    def _record_throttle(self, host, wait):
+        if wait > 0.001:
+            UPSTREAM_THROTTLE_SECONDS.inc(wait, host=host)
+        with self._lock:
+            self._stats[host].throttle_wait += wait
+
+    def stats(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {host: stats.to_dict() for host, stats in self._stats.items()}
+
+
+def _request_not_sent(error: requests.exceptions.RequestException) -> bool:
+    """Vrai si l'erreur est survenue avant l'envoi de la requête (connexion impossible)"""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ConnectionError):
+        # requests enveloppe l'erreur urllib3 : MaxRetryError(reason=NewConnectionError)
+        cause = error.args[0] if error.args else None
+        return isinstance(getattr(cause, 'reason', cause), NewConnectionError)
+    return False
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_http_client() -> HTTPClient:
+    """Instance partagée, créée au premier usage"""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HTTPClient()
+        return _client
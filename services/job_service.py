@@ -0,0 +1,157 @@
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+from config import JOB_WORKERS, JOB_MAX_PENDING, JOB_TTL_SECONDS
+
+FINISHED = ('succeeded', 'failed')
+
+
+class JobQueueFull(Exception):
+    """Levée quand trop de jobs sont déjà en attente d'exécution"""
+
+
+@dataclass
+class Job:
+    id: str
+    status: str = 'queued'  # queued, running, succeeded, failed
+    stage: str = 'queued'
+    progress: int = 0
+    result: Optional[Dict] = None
+    error: Optional[str] = None
+    status_code: Optional[int] = None
+    created_at: float = field(default_factory=time.time)
+    updated_at: float = field(default_factory=time.time)
+    # Flux d'événements (étapes, morceaux de description) relu par /jobs/<id>/events
+    events: List[Dict[str, Any]] = field(default_factory=list)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'stage': self.stage,
+            'progress': self.progress,
+            'result': self.result,
+            'error': self.error,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class JobManager:
+    """
+    Exécute les pipelines de génération dans un pool de threads borné.
+
+    Les jobs sont conservés en mémoire dans le processus courant : avec
+    plusieurs workers gunicorn, l'état d'un job n'est visible que depuis
+    le worker qui l'a reçu.
+    """
+
+    def __init__(self, max_workers: int = JOB_WORKERS,
+                 max_pending: int = JOB_MAX_PENDING,
+                 ttl_seconds: int = JOB_TTL_SECONDS):
+        self.max_pending = max_pending
+        self.ttl_seconds = ttl_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers,
+                                            thread_name_prefix='route-job')
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        # Réveille les flux SSE en attente à chaque nouvel événement
+        self._changed = threading.Condition(self._lock)
+
+    def submit(self, func: Callable, *args) -> Job:
+        """
+        Planifier func(report, *args) ; report(stage, progress) met à jour le job
+        et report.publish(event, data) ajoute un événement à son flux.
+        """
+        with self._lock:
+            self._purge_expired()
+            pending = sum(1 for job in self._jobs.values()
+                          if job.status in ('queued', 'running'))
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs déjà en attente")
+            job = Job(id=uuid.uuid4().hex)
+            self._jobs[job.id] = job
+
+        self._executor.submit(self._run, job, func, args)
+        logging.info(f"Job {job.id} planifié ({pending + 1} en attente)")
+        return job
+
+    def stats(self) -> Dict[str, int]:
+        """Nombre de jobs conservés par statut"""
+        counts = {status: 0 for status in ('queued', 'running', 'succeeded', 'failed')}
+        with self._lock:
+            for job in self._jobs.values():
+                counts[job.status] += 1
+        return counts
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _update(self, job: Job, event: Optional[str] = None, data: Any = None, **changes):
+        with self._lock:
+            for key, value in changes.items():
+                setattr(job, key, value)
+            job.updated_at = time.time()
+            if event:
+                job.events.append({'id': len(job.events) + 1, 'event': event, 'data': data})
+            self._changed.notify_all()
+
+    def publish(self, job: Job, event: str, data: Any = None):
+        """Ajouter un événement au flux du job"""
+        self._update(job, event=event, data=data)
+
+    def wait_events(self, job_id: str, after: int = 0,
+                    timeout: float = 15.0) -> Optional[List[Dict[str, Any]]]:
+        """
+        Événements du job postérieurs à l'identifiant after, en attendant au
+        plus timeout secondes qu'il en arrive ([] à l'échéance). None quand le
+        job est inconnu, ou terminé sans rien de plus à transmettre.
+        """
+        deadline = time.monotonic() + timeout
+        with self._changed:
+            while True:
+                job = self._jobs.get(job_id)
+                if job is None:
+                    return None
+                if len(job.events) > after:
+                    return job.events[after:]
+                if job.status in FINISHED:
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return []
+                self._changed.wait(remaining)
+
+    def _run(self, job: Job, func: Callable, args):
+        self._update(job, status='running', stage='started', progress=0,
+                     event='stage', data={'stage': 'started', 'progress': 0})
+
+        def report(stage: str, progress: int):
+            self._update(job, stage=stage, progress=progress,
+                         event='stage', data={'stage': stage, 'progress': progress})
+        report.publish = lambda event, data=None: self.publish(job, event, data)
+
+        try:
+            result = func(report, *args)
+            # Statut et événement final ensemble : un flux ne voit jamais l'un sans l'autre
+            self._update(job, status='succeeded', stage='done', progress=100, result=result,
+                         event='done', data=result)
+            logging.info(f"Job {job.id} terminé")
+        except Exception as e:
+            logging.error(f"Job {job.id} en échec à l'étape {job.stage}: {str(e)}")
+            status_code = getattr(e, 'status_code', 500)
+            self._update(job, status='failed', error=str(e), status_code=status_code,
+                         event='error', data={'error': str(e), 'status_code': status_code})
+
+    def _purge_expired(self):
+        # Appelé avec le verrou déjà acquis
+        cutoff = time.time() - self.ttl_seconds
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.status in FINISHED and job.updated_at < cutoff]
+        for job_id in expired:
+            del self._jobs[job_id]
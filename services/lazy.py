@@ -0,0 +1,78 @@
+import importlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Iterable, List, Optional
+
+_services: List['LazyService'] = []
+
+
+class LazyService:
+    """
+    Service construit au premier usage plutôt qu'à l'import du module.
+
+    S'utilise comme l'instance elle-même (les attributs sont relayés), si
+    bien que `email_service.send_gpx_email(...)` construit EmailService au
+    premier envoi seulement : démarrer un worker ne crée ni client OpenAI
+    ni session HTTP, et une variable d'environnement manquante ne fait
+    échouer que les requêtes qui ont besoin du service concerné.
+    """
+
+    def __init__(self, factory: Callable[[], Any], name: Optional[str] = None):
+        self._factory = factory
+        self._name = name or getattr(factory, '__name__', 'service')
+        self._instance = None
+        self._lock = threading.Lock()
+        _services.append(self)
+
+    def get(self) -> Any:
+        instance = self._instance
+        if instance is None:
+            with self._lock:
+                if self._instance is None:
+                    start = time.perf_counter()
+                    self._instance = self._factory()
+                    logging.debug(f"Service {self._name} construit en "
+                                  f"{(time.perf_counter() - start) * 1000:.0f} ms")
+                instance = self._instance
+        return instance
+
+    @property
+    def initialized(self) -> bool:
+        return self._instance is not None
+
+    def reset(self):
+        """Oublier l'instance : la suivante sera construite au prochain usage"""
+        with self._lock:
+            self._instance = None
+
+    def __getattr__(self, name: str) -> Any:
+        # Appelé seulement pour les attributs absents du proxy lui-même
+        return getattr(self.get(), name)
+
+    def __repr__(self) -> str:
+        state = 'construit' if self.initialized else 'non construit'
+        return f"<LazyService {self._name} ({state})>"
+
+
+def reset_services():
+    """
+    Après un fork (gunicorn --preload), repartir sans les instances du
+    processus maître : leurs sockets et leurs threads ne lui survivent pas.
+    """
+    for service in _services:
+        service.reset()
+
+
+def preload_modules(modules: Iterable[str]) -> float:
+    """
+    Importer les modules lourds sans rien instancier, pour que les workers
+    forkés les héritent déjà chargés ; renvoie la durée en secondes.
+    """
+    start = time.perf_counter()
+    for module in modules:
+        try:
+            importlib.import_module(module)
+        except ImportError as e:
+            logging.warning(f"Préchargement de {module} impossible: {str(e)}")
+    return time.perf_counter() - start
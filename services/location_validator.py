@@ -1,6 +1,11 @@
-import requests
 from typing import Optional, Tuple
 from dataclasses import dataclass
+from config import NOMINATIM_TIMEOUT, NOMINATIM_BASE_URL
+from services.geocode_cache import get_geocode_cache
+from services.gazetteer import get_gazetteer
+from services.http_client import get_http_client
+from services.rate_limiter import RateLimitExceeded
+from services.metrics import span
 
 @dataclass
 class Location:
@@ -18,46 +23,72 @@ class LocationValidator:
     }
 
     @staticmethod
+    @span('geocode')
     def validate_brittany_location(location_name: str) -> Optional[Location]:
         """
         Validates if a given location is in Brittany and returns its coordinates.
-        Uses Nominatim API for geocoding.
+        Uses the offline gazetteer first, then Nominatim API for geocoding.
         """
         try:
+            place = get_gazetteer().resolve(location_name)
+            if place:
+                return LocationValidator._build_location(
+                    location_name, place.latitude, place.longitude
+                )
+
+            cache = get_geocode_cache()
+            cached = cache.get(location_name)
+            if cached is not None:
+                if not cached.found:
+                    return None
+                return LocationValidator._build_location(
+                    location_name, cached.latitude, cached.longitude
+                )
+
             # Use Nominatim API to get coordinates
-            response = requests.get(
-                f"https://nominatim.openstreetmap.org/search",
+            response = get_http_client().get(
+                f"{NOMINATIM_BASE_URL}/search",
                 params={
                     'q': f"{location_name}, Bretagne, France",
                     'format': 'json',
                     'limit': 1
                 },
-                headers={'User-Agent': 'SportOutdoorRouteGenerator/1.0'}
+                headers={'User-Agent': 'SportOutdoorRouteGenerator/1.0'},
+                timeout=NOMINATIM_TIMEOUT
             )
             response.raise_for_status()
             
             if not response.json():
+                cache.put_not_found(location_name)
                 return None
                 
             location_data = response.json()[0]
             lat = float(location_data['lat'])
             lon = float(location_data['lon'])
+            cache.put(location_name, lat, lon)
+
+            return LocationValidator._build_location(location_name, lat, lon)
             
-            # Check if coordinates are within Brittany's bounding box
-            is_in_brittany = (
-                LocationValidator.BRITTANY_BOUNDING_BOX['min_lat'] <= lat <=
-                LocationValidator.BRITTANY_BOUNDING_BOX['max_lat'] and
-                LocationValidator.BRITTANY_BOUNDING_BOX['min_lon'] <= lon <=
-                LocationValidator.BRITTANY_BOUNDING_BOX['max_lon']
-            )
-            
-            return Location(
-                name=location_name,
-                latitude=lat,
-                longitude=lon,
-                is_in_brittany=is_in_brittany
-            )
-            
+        except RateLimitExceeded:
+            # Not an invalid location: let the caller report the overload
+            raise
         except Exception as e:
             print(f"Error validating location: {str(e)}")
             return None
+
+    @staticmethod
+    def _build_location(location_name: str, lat: float, lon: float) -> Location:
+        # Check if coordinates are within Brittany's bounding box
+        is_in_brittany = (
+            LocationValidator.BRITTANY_BOUNDING_BOX['min_lat'] <= lat <=
+            LocationValidator.BRITTANY_BOUNDING_BOX['max_lat'] and
+            LocationValidator.BRITTANY_BOUNDING_BOX['min_lon'] <= lon <=
+            LocationValidator.BRITTANY_BOUNDING_BOX['max_lon']
+        )
+        
+        return Location(
+            name=location_name,
+            latitude=lat,
+            longitude=lon,
+            is_in_brittany=is_in_brittany
+        )
@@ -0,0 +1,97 @@
+import logging
+import threading
+import tracemalloc
+from contextlib import contextmanager
+from typing import Optional
+from config import (MEMORY_TRACKING, MEMORY_TRACE_FRAMES, MEMORY_BUDGET_MB, MEMORY_BYTES_PER_POINT,
+                    MEMORY_PARSE_FACTOR)
+from services.metrics import registry
+
+# Octets : de l'étape la plus légère (quelques Ko) aux réponses ORS les plus longues
+MEMORY_BUCKETS = tuple(2 ** power for power in range(16, 31, 2))  # 64 Kio à 1 Gio
+
+PEAK_BYTES = registry.histogram(
+    'memory_peak_bytes', "Pic d'allocations Python par étape et par pipeline complet (stage=total)",
+    ('pipeline', 'stage'), buckets=MEMORY_BUCKETS)
+BUDGET_ACTIONS = registry.counter(
+    'memory_budget_actions', "Itinéraires simplifiés ou refusés pour tenir dans le budget mémoire",
+    ('action',))
+
+
+class MemoryBudgetExceeded(Exception):
+    """Levée quand un itinéraire ne tiendrait pas dans le budget mémoire d'une requête"""
+    status_code = 413
+
+
+def budget_bytes() -> Optional[int]:
+    return int(MEMORY_BUDGET_MB * 1024 * 1024) if MEMORY_BUDGET_MB > 0 else None
+
+
+def budget_points() -> Optional[int]:
+    """Nombre de points qu'une requête peut traiter dans le budget (None : pas de budget)"""
+    budget = budget_bytes()
+    return max(2, budget // MEMORY_BYTES_PER_POINT) if budget else None
+
+
+def check_response_size(size: int, what: str = "réponse ORS"):
+    """
+    Refuser une réponse dont le décodage JSON dépasserait à lui seul le
+    budget (environ MEMORY_PARSE_FACTOR fois sa taille en objets Python),
+    avant de la décoder.
+    """
+    budget = budget_bytes()
+    if budget and size * MEMORY_PARSE_FACTOR > budget:
+        BUDGET_ACTIONS.inc(action='rejected')
+        logging.warning(f"{what} de {size / 1e6:.1f} Mo refusée : environ "
+                        f"{size * MEMORY_PARSE_FACTOR / 1e6:.0f} Mo une fois décodée, "
+                        f"budget {MEMORY_BUDGET_MB} Mo")
+        raise MemoryBudgetExceeded("Route too large to process")
+
+
+class _PeakTracker:
+    """
+    tracemalloc n'a qu'un pic pour tout le processus : il est remis à zéro
+    quand aucun bloc n'est suivi, et chaque bloc se voit attribuer le pic
+    atteint depuis son début. Quand des étapes ou des requêtes se
+    chevauchent, la valeur est donc une borne haute de leur pic propre.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._active = 0
+
+    def begin(self) -> int:
+        with self._lock:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start(MEMORY_TRACE_FRAMES)
+            if self._active == 0:
+                tracemalloc.reset_peak()
+            self._active += 1
+            return tracemalloc.get_traced_memory()[0]
+
+    def end(self, start: int) -> int:
+        with self._lock:
+            self._active -= 1
+            _, peak = tracemalloc.get_traced_memory()
+            return max(0, peak - start)
+
+
+_tracker = _PeakTracker()
+
+
+@contextmanager
+def track_memory(pipeline: str, stage: str):
+    """Enregistrer dans PEAK_BYTES le pic d'allocations du bloc (MEMORY_TRACKING)"""
+    if not MEMORY_TRACKING:
+        yield
+        return
+    start = _tracker.begin()
+    try:
+        yield
+    finally:
+        peak = _tracker.end(start)
+        PEAK_BYTES.observe(peak, pipeline=pipeline, stage=stage)
+        budget = budget_bytes()
+        if stage == 'total' and budget and peak > budget:
+            logging.warning(f"Pipeline {pipeline}: pic de {peak / 1e6:.1f} Mo, "
+                            f"au-delà du budget de {MEMORY_BUDGET_MB} Mo")
@@ -0,0 +1,218 @@
+import bisect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+from config import METRICS_ENABLED, METRICS_PREFIX
+
+# Secondes : du cache local (quelques ms) aux appels OpenAI et ORS les plus lents
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# (labels, valeur) ; un collecteur renvoie des lignes de métriques calculées au moment du scrape
+Sample = Tuple[Dict[str, str], float]
+Collector = Callable[[], Iterable[Tuple[str, str, str, List[Sample]]]]
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict) -> Tuple[str, ...]:
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def _labels(self, key: Tuple[str, ...], **extra) -> Dict[str, str]:
+        labels = dict(zip(self.labelnames, key))
+        labels.update(extra)
+        return labels
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        with self._lock:
+            return [(f"{self.name}_total", self._labels(key), value) for key, value in self._values.items()]
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Par jeu de labels : effectif de chaque intervalle (non cumulé), somme, nombre
+        self._series: Dict[Tuple[str, ...], List] = {}
+
+    def observe(self, value: float, **labels):
+        if not METRICS_ENABLED:
+            return
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[2] if series else 0
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._series.items():
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                    cumulative += bucket_count
+                    lines.append((f"{self.name}_bucket", self._labels(key, le=_format_value(bound)), cumulative))
+                lines.append((f"{self.name}_sum", self._labels(key), total))
+                lines.append((f"{self.name}_count", self._labels(key), count))
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Métriques du processus, exposées au format texte de Prometheus par
+    /metrics.
+
+    Déclarer deux fois la même métrique renvoie l'instance existante, si
+    bien que chaque module déclare les siennes à l'import. Les compteurs et
+    histogrammes sont mis à jour sous un verrou par métrique (de l'ordre de
+    la microseconde) ; les collecteurs ne sont appelés qu'au scrape.
+
+    Comme pour les jobs, chaque worker gunicorn a ses propres valeurs : un
+    scrape ne voit que le worker qui le reçoit. Derrière un même port, deux
+    scrapes successifs peuvent tomber sur des workers différents et les
+    compteurs sembleraient repartir de zéro ; d'où un seul worker par
+    défaut (gunicorn.conf.py). Pour plusieurs workers, exposer chacun sur
+    son propre port et le déclarer comme une cible distincte.
+    """
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Collector] = []
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, documentation, labelnames, **kwargs):
+        full_name = f"{self.prefix}{name}"
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, documentation, labelnames, **kwargs)
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter, name, documentation, labelnames)
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def register_collector(self, collector: Collector):
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        for collector in collectors:
+            for name, kind, documentation, samples in collector():
+                name = f"{self.prefix}{name}"
+                lines.append(f"# HELP {name} {documentation}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+SPAN_SECONDS = registry.histogram(
+    'span_seconds', "Durée des opérations instrumentées (géocodage, ORS, LLM, export, SMTP)",
+    ('span', 'outcome'))
+STAGE_SECONDS = registry.histogram(
+    'pipeline_stage_seconds', "Durée de chaque étape de pipeline, nouvelles tentatives comprises",
+    ('pipeline', 'stage', 'outcome'))
+CACHE_REQUESTS = registry.counter(
+    'cache_requests', "Lectures de cache par résultat (hit, miss)", ('cache', 'result'))
+UPSTREAM_SECONDS = registry.histogram(
+    'upstream_request_seconds', "Latence des appels HTTP sortants par hôte et code (error : pas de réponse)",
+    ('host', 'status'))
+
+
+@contextmanager
+def span(name: str):
+    """Chronométrer un bloc dans SPAN_SECONDS, avec outcome=error s'il lève une exception"""
+    if not METRICS_ENABLED:
+        yield
+        return
+    start = time.perf_counter()
+    outcome = 'ok'
+    try:
+        yield
+    except BaseException:
+        outcome = 'error'
+        raise
+    finally:
+        SPAN_SECONDS.observe(time.perf_counter() - start, span=name, outcome=outcome)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
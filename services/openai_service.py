@@ -1,14 +1,36 @@
-import openai
-from config import OPENAI_API_KEY
+from config import OPENAI_API_KEY, OPENAI_BASE_URL
 import logging
 import json
+from services.description_cache import cached_description
+from services.metrics import span
 
-# the newest OpenAI model is "gpt-4o" which was released May 13, 2024
-openai.api_key = OPENAI_API_KEY
+_openai = None
+
+
+def _get_openai():
+    """The configured openai module, imported on first use (the import alone takes ~0.7s)"""
+    global _openai
+    if _openai is None:
+        import openai
+        # the newest OpenAI model is "gpt-4o" which was released May 13, 2024
+        openai.api_key = OPENAI_API_KEY
+        if OPENAI_BASE_URL:
+            # Trailing slash required: the module-level client joins paths relatively
+            openai.base_url = OPENAI_BASE_URL.rstrip('/') + '/'
+        _openai = openai
+    return _openai
+
+# Bump the version when the prompt changes, so cached descriptions are not reused
+CACHE_NAMESPACE = "gpt-4o-mini|route-json|v1"
 
 
 def generate_route_description(preferences):
-    """Generate an engaging route description based on user preferences."""
+    """
+    Generate an engaging route description based on user preferences.
+
+    Repeated preferences are served from the description cache; if gpt-4o-mini
+    fails or misses DESCRIPTION_DEADLINE, a template description is returned.
+    """
 
     # Map duration values to human-readable format
     duration_map = {
@@ -64,15 +86,29 @@ def generate_route_description(preferences):
     }}
     """
 
+    inputs = {field: preferences.get(field) for field in
+              ('activity_type', 'location', 'distance', 'level', 'landscape', 'route_type',
+               'elevation_preference', 'duration', 'surface_type', 'points_of_interest')}
+    return cached_description(
+        CACHE_NAMESPACE,
+        inputs,
+        generate=lambda: _request_route_description(prompt, preferences),
+        fallback=lambda: _fallback_route_description(preferences, duration_map[preferences['duration']])
+    )
+
+
+def _request_route_description(prompt, preferences):
+    """One gpt-4o-mini completion, validated; raises on any failure"""
     try:
         logging.debug(f"Sending OpenAI request with preferences: {preferences}")
-        response = openai.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[{
-                "role": "user",
-                "content": prompt
-            }],
-            response_format={"type": "json_object"})
+        with span('llm_route_json'):
+            response = _get_openai().chat.completions.create(
+                model="gpt-4o-mini",
+                messages=[{
+                    "role": "user",
+                    "content": prompt
+                }],
+                response_format={"type": "json_object"})
 
         response_content = response.choices[0].message.content
         logging.debug(f"Received OpenAI response: {response_content}")
@@ -95,4 +131,34 @@ def generate_route_description(preferences):
 
     except Exception as e:
         logging.error(f"Failed to generate route description: {str(e)}")
-        raise Exception(f"Failed to generate route description: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Failed to generate route description: {str(e)}")
+
+
+def _fallback_route_description(preferences, duration):
+    """Deterministic description in the same JSON format, from the preferences alone"""
+    route_type = "loop" if preferences['route_type'] == 'loop' else "out-and-back"
+    points_of_interest = preferences.get('points_of_interest')
+    return json.dumps({
+        "title": f"{preferences['distance']}km {preferences['activity_type']} {route_type} "
+                 f"from {preferences['location']} ({duration})",
+        "description": (
+            f"A {preferences['distance']}km {route_type} {preferences['activity_type']} route starting "
+            f"from {preferences['location']}, through {preferences['landscape']} landscape on "
+            f"{preferences['surface_type']} surfaces, with a {preferences['elevation_preference']} "
+            f"elevation profile suited to a {preferences['level']} level."
+        ),
+        "highlights": [
+            f"{preferences['distance']}km {route_type} from {preferences['location']}",
+            f"{preferences['landscape'].capitalize()} landscape on {preferences['surface_type']} surfaces",
+            (f"Points of interest: {points_of_interest}" if points_of_interest and points_of_interest != 'none'
+             else f"{preferences['elevation_preference'].capitalize()} elevation profile"),
+        ],
+        "difficulty_notes": f"Plan for about {duration} at a {preferences['level']} pace.",
+        "verification": {
+            "distance_match": True,
+            "duration_match": True,
+            "route_type_match": True,
+            "surface_match": True,
+            "elevation_match": True
+        }
+    }, ensure_ascii=False)
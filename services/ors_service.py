@@ -3,10 +3,53 @@ import logging
 import json
 import time
 import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
 from math import radians, cos, sin, pi
-from config import ORS_API_KEY, ORS_BASE_URL, ACTIVITY_PROFILES
+from typing import Optional, Tuple
+from config import (ORS_API_KEY, ORS_BASE_URL, ACTIVITY_PROFILES, ORS_GEOCODE_RACE,
+                    ORS_GEOCODE_MIN_SAMPLES, ORS_GEOCODE_MIN_WIN_RATE,
+                    ORS_ROUTE_CANDIDATES, ORS_ROUTE_CONCURRENCY)
+from services.geocode_cache import get_geocode_cache
+from services.gazetteer import get_gazetteer
+from services.distance_calibration import get_distance_calibration
+from services.route_cache import get_route_cache, route_cache_key, wants_variety
+from services.http_client import get_http_client
+from services.rate_limiter import RateLimitExceeded
+from services.geometry import check_against_ors, route_metrics
+from services.metrics import span
+from services.memory import check_response_size
+
+LOCATION_NOT_FOUND = "Impossible de localiser cette ville en Bretagne"
+
+
+@dataclass
+class GeocodeAttempt:
+    """Résultat d'une stratégie de géocodage"""
+    index: int
+    coordinates: Optional[Tuple[float, float]] = None  # (lon, lat)
+    in_bounds: bool = False
+    error: Optional[str] = None
+    transient: bool = False
+    rate_limited: bool = False
+    retry_after: float = 0.0
+    response: Optional[requests.Response] = None
+
 
 class ORSService:
+    # Limites de la Bretagne (légèrement élargies pour inclure les zones limitrophes)
+    BRETAGNE_BOUNDS = {
+        'min_lat': 47.0,
+        'max_lat': 49.0,
+        'min_lon': -5.2,
+        'max_lon': -0.8
+    }
+
+    # Statistiques partagées {index de stratégie: (essais, victoires)}
+    _strategy_stats = {}
+    _strategy_stats_lock = threading.Lock()
+
     def __init__(self):
         self.headers = {
             'Authorization': ORS_API_KEY,
@@ -14,20 +57,27 @@ class ORSService:
             'Accept': 'application/json, application/geo+json'
         }
 
+    @span('geocode')
     def geocode_location(self, location_name, preferences=None):
         """Convertir un nom de localité en coordonnées GPS"""
         endpoint = f"{ORS_BASE_URL}/geocode/search"
         
-        # Vérification de la clé API en premier
-        if not ORS_API_KEY or ORS_API_KEY.strip() == "":
-            logging.error("ERREUR CRITIQUE: La clé API ORS n'est pas configurée")
-            raise Exception("Configuration manquante: La clé API OpenRouteService n'est pas définie dans les variables d'environnement")
-            
         # Vérifier que la localité n'est pas vide
         if not location_name or location_name.strip() == "":
             logging.error("Localité vide fournie")
             raise Exception("Veuillez entrer un nom de ville ou village valide")
         
+        # Résolution locale des communes bretonnes, sans appel réseau ni clé API
+        place = get_gazetteer().resolve(location_name)
+        if place:
+            logging.info(f"Localité résolue hors ligne: {location_name} -> {place.name}")
+            return [place.longitude, place.latitude]
+        
+        # La clé API n'est nécessaire qu'à partir d'ici
+        if not ORS_API_KEY or ORS_API_KEY.strip() == "":
+            logging.error("ERREUR CRITIQUE: La clé API ORS n'est pas configurée")
+            raise Exception("Configuration manquante: La clé API OpenRouteService n'est pas définie dans les variables d'environnement")
+        
         # Normalisation du nom de la localité pour éviter les problèmes avec les tirets, etc.
         normalized_location = location_name.strip().replace("-", " ")
         logging.info(f"Localité normalisée: {normalized_location}")
@@ -61,124 +111,244 @@ class ORSService:
             }
         ]
         
-        # En dernier recours, essayer des villes connues en Bretagne
-        if normalized_location.lower() == "saint-brieuc":
-            logging.info("Utilisation des coordonnées prédéfinies pour Saint-Brieuc")
-            return [-2.7849, 48.5134]  # Coordonnées approximatives de Saint-Brieuc
-        elif normalized_location.lower() == "rennes":
-            return [-1.6743, 48.1173]
-        elif normalized_location.lower() == "brest":
-            return [-4.4860, 48.3904] 
-        elif normalized_location.lower() == "quimper":
-            return [-4.0972, 47.9960]
-        elif normalized_location.lower() == "vannes":
-            return [-2.7600, 47.6586]
-        elif normalized_location.lower() == "lorient":
-            return [-3.3800, 47.7486]
+        # Consulter le cache partagé avant tout appel réseau
+        cache = get_geocode_cache()
+        cached = cache.get(location_name)
+        if cached is not None:
+            if cached.found:
+                return [cached.longitude, cached.latitude]
+            # Même erreur que sans cache : surtout pas un départ silencieux depuis Rennes
+            logging.warning(f"Échec de géocodage en cache pour {location_name}")
+            raise Exception(f"{LOCATION_NOT_FOUND}: {location_name}")
             
         logging.info(f"Tentative de géocodage pour: {location_name}")
         
-        # Définir les limites de la Bretagne (légèrement élargies pour inclure les zones limitrophes)
-        BRETAGNE_BOUNDS = {
-            'min_lat': 47.0,
-            'max_lat': 49.0,
-            'min_lon': -5.2,
-            'max_lon': -0.8
-        }
+        if ORS_GEOCODE_RACE:
+            winner, attempts = self._race_geocode_strategies(endpoint, search_strategies)
+        else:
+            winner, attempts = self._sequential_geocode_strategies(endpoint, search_strategies)
+        self._record_strategy_outcome(attempts, winner)
         
-        last_error = None
-        last_response = None
+        if winner:
+            lon, lat = winner.coordinates
+            logging.info(f"Géocodage réussi (stratégie {winner.index+1}): {location_name} -> [{lon}, {lat}]")
+            cache.put(location_name, lat, lon)
+            return [lon, lat]  # Inverser l'ordre pour correspondre au format ORS
         
-        # Essayer chaque stratégie jusqu'à ce qu'une réussisse
+        # Si on arrive ici, aucune stratégie n'a fonctionné
+        last_error = next((attempt.error for attempt in reversed(attempts) if attempt.error), None)
+        error_msg = last_error or LOCATION_NOT_FOUND
+        logging.error(f"Échec du géocodage pour {location_name}: {error_msg}")
+        
+        # Si nous avons une réponse, enregistrer plus de détails pour le débogage
+        last_response = next((attempt.response for attempt in reversed(attempts) if attempt.response is not None), None)
+        if last_response is not None:
+            logging.error(f"Dernière réponse: Code {last_response.status_code}")
+            logging.error(f"Contenu de la réponse: {last_response.text[:500]}...")
+            logging.error(f"En-têtes de réponse: {dict(last_response.headers)}")
+        
+        # Localité introuvable : le signaler plutôt que de partir de Rennes. Un échec
+        # transitoire (réseau, code HTTP) ne doit pas être mis en cache comme négatif
+        if not any(attempt.transient for attempt in attempts):
+            cache.put_not_found(location_name)
+            raise Exception(f"{LOCATION_NOT_FOUND}: {location_name}")
+        
+        # Quota épuisé : échouer explicitement plutôt que de générer un parcours à Rennes
+        if any(attempt.rate_limited for attempt in attempts):
+            raise RateLimitExceeded('ors_geocode', max(attempt.retry_after for attempt in attempts))
+        
+        # Service indisponible : utiliser des coordonnées de secours pour Rennes
+        logging.warning(f"Utilisation des coordonnées par défaut pour Rennes comme solution de secours "
+                        f"pour '{location_name}' ({error_msg})")
+        return [-1.6743, 48.1173]  # Coordonnées approximatives de Rennes
+
+    def _sequential_geocode_strategies(self, endpoint, search_strategies):
+        """Essayer chaque stratégie l'une après l'autre jusqu'à ce qu'une réussisse"""
+        attempts = []
+        last_index = len(search_strategies) - 1
         for strategy_index, params in enumerate(search_strategies):
+            attempt = self._try_geocode_strategy(endpoint, strategy_index, params,
+                                                 strategy_index == last_index)
+            attempts.append(attempt)
+            if attempt.coordinates:
+                return attempt, attempts
+        return None, attempts
+
+    def _race_geocode_strategies(self, endpoint, search_strategies):
+        """
+        Lancer toutes les stratégies actives en parallèle et retenir le résultat
+        en Bretagne de la stratégie la plus prioritaire : un résultat n'est
+        accepté qu'une fois toutes les stratégies précédentes terminées sans
+        succès, et les stratégies suivantes encore en cours sont ignorées.
+        """
+        last_index = len(search_strategies) - 1
+        active = self._active_strategy_indexes(len(search_strategies))
+        logging.info(f"Géocodage en parallèle des stratégies {[index+1 for index in active]}")
+        
+        attempts = []
+        executor = ThreadPoolExecutor(max_workers=len(active), thread_name_prefix='geocode')
+        try:
+            futures = [
+                executor.submit(self._try_geocode_strategy, endpoint, index,
+                                search_strategies[index], index == last_index)
+                for index in active
+            ]
+            finished = {}
+            for future in as_completed(futures):
+                attempt = future.result()
+                attempts.append(attempt)
+                finished[attempt.index] = attempt
+                # Par ordre de priorité : une stratégie en cours devant empêche de conclure
+                winner = None
+                for index in active:
+                    if index not in finished:
+                        break
+                    if finished[index].in_bounds:
+                        winner = finished[index]
+                        break
+                if winner is not None:
+                    # Les stratégies encore en cours comptent comme essayées et perdues
+                    attempts.extend(GeocodeAttempt(index=index, transient=True)
+                                    for index in active if index not in finished)
+                    return winner, attempts
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        # Aucun résultat en Bretagne : appliquer le dernier recours hors Bretagne
+        fallback = next((attempt for attempt in attempts if attempt.coordinates), None)
+        return fallback, attempts
+
+    def _try_geocode_strategy(self, endpoint, strategy_index, params, is_last):
+        """Exécuter une stratégie de recherche et renvoyer un GeocodeAttempt"""
+        attempt = GeocodeAttempt(index=strategy_index)
+        try:
+            logging.info(f"Essai de la stratégie {strategy_index+1} avec params: {params}")
+            
+            # Vérifier et afficher l'URL complète pour le débogage
+            request_url = endpoint + "?" + "&".join([f"{k}={v}" for k, v in params.items()])
+            logging.debug(f"URL de requête: {request_url}")
+            
+            # Vérifier les en-têtes
+            logging.debug(f"En-têtes: Authorization: {ORS_API_KEY[:5]}...{ORS_API_KEY[-3:] if len(ORS_API_KEY) > 8 else ''}")
+            
+            response = get_http_client().get(
+                endpoint,
+                headers=self.headers,
+                params=params,
+                timeout=15
+            )
+            
+            attempt.response = response
+            
+            if response.status_code != 200:
+                logging.warning(f"Échec de la stratégie {strategy_index+1}: {response.status_code} - {response.text[:200]}")
+                attempt.error = f"Erreur de géocodage (code {response.status_code})"
+                attempt.transient = True
+                attempt.rate_limited = response.status_code == 429
+                return attempt
+            
+            # Vérifier si la réponse est bien du JSON
             try:
-                logging.info(f"Essai de la stratégie {strategy_index+1} avec params: {params}")
+                data = response.json()
+            except json.JSONDecodeError:
+                logging.warning(f"Réponse non-JSON pour la stratégie {strategy_index+1}")
+                logging.warning(f"Contenu: {response.text[:200]}...")
+                attempt.error = "Format de réponse invalide"
+                attempt.transient = True
+                return attempt
+            
+            if not data.get('features') or len(data['features']) == 0:
+                logging.warning(f"Aucun résultat pour la stratégie {strategy_index+1}")
+                attempt.error = "Localité non trouvée"
+                return attempt
+            
+            # Parcourir les résultats pour trouver une correspondance en Bretagne
+            for feature in data['features']:
+                if 'geometry' not in feature or 'coordinates' not in feature['geometry']:
+                    continue
                 
-                # Vérifier et afficher l'URL complète pour le débogage
-                request_url = endpoint + "?" + "&".join([f"{k}={v}" for k, v in params.items()])
-                logging.debug(f"URL de requête: {request_url}")
+                coordinates = feature['geometry']['coordinates']
+                lat = coordinates[1]
+                lon = coordinates[0]
                 
-                # Vérifier les en-têtes
-                logging.debug(f"En-têtes: Authorization: {ORS_API_KEY[:5]}...{ORS_API_KEY[-3:] if len(ORS_API_KEY) > 8 else ''}")
+                # Extraire le nom réel trouvé pour le log
+                found_name = feature.get('properties', {}).get('name', 'Localité inconnue')
+                found_region = feature.get('properties', {}).get('region', 'Région inconnue')
                 
-                response = requests.get(
-                    endpoint,
-                    headers=self.headers,
-                    params=params,
-                    timeout=15
+                # Vérifier si la localité est en Bretagne (ou à proximité)
+                in_bretagne = (
+                    self.BRETAGNE_BOUNDS['min_lat'] <= lat <= self.BRETAGNE_BOUNDS['max_lat'] and
+                    self.BRETAGNE_BOUNDS['min_lon'] <= lon <= self.BRETAGNE_BOUNDS['max_lon']
                 )
                 
-                last_response = response
-                
-                if response.status_code != 200:
-                    logging.warning(f"Échec de la stratégie {strategy_index+1}: {response.status_code} - {response.text[:200]}")
-                    last_error = f"Erreur de géocodage (code {response.status_code})"
-                    continue
-                
-                # Vérifier si la réponse est bien du JSON
-                try:
-                    data = response.json()
-                except json.JSONDecodeError:
-                    logging.warning(f"Réponse non-JSON pour la stratégie {strategy_index+1}")
-                    logging.warning(f"Contenu: {response.text[:200]}...")
-                    last_error = "Format de réponse invalide"
-                    continue
-                
-                if not data.get('features') or len(data['features']) == 0:
-                    logging.warning(f"Aucun résultat pour la stratégie {strategy_index+1}")
-                    last_error = "Localité non trouvée"
-                    continue
-                
-                # Parcourir les résultats pour trouver une correspondance en Bretagne
-                for feature in data['features']:
-                    if 'geometry' not in feature or 'coordinates' not in feature['geometry']:
-                        continue
-                    
-                    coordinates = feature['geometry']['coordinates']
-                    lat = coordinates[1]
-                    lon = coordinates[0]
-                    
-                    # Extraire le nom réel trouvé pour le log
-                    found_name = feature.get('properties', {}).get('name', 'Localité inconnue')
-                    found_region = feature.get('properties', {}).get('region', 'Région inconnue')
-                    
-                    # Vérifier si la localité est en Bretagne (ou à proximité)
-                    in_bretagne = (
-                        BRETAGNE_BOUNDS['min_lat'] <= lat <= BRETAGNE_BOUNDS['max_lat'] and
-                        BRETAGNE_BOUNDS['min_lon'] <= lon <= BRETAGNE_BOUNDS['max_lon']
-                    )
-                    
-                    logging.info(f"Résultat trouvé: {found_name}, {found_region} -> [{lon}, {lat}], En Bretagne: {in_bretagne}")
-                    
-                    if in_bretagne:
-                        logging.info(f"Géocodage réussi: {location_name} -> {found_name}, {found_region} -> [{lon}, {lat}]")
-                        return [lon, lat]  # Inverser l'ordre pour correspondre au format ORS
-                    
-                    # En dernier recours, prendre la première correspondance même hors Bretagne
-                    if strategy_index == len(search_strategies) - 1:
-                        logging.warning(f"Aucune correspondance en Bretagne, utilisation du premier résultat: {found_name}, {found_region}")
-                        return [lon, lat]
+                logging.info(f"Résultat trouvé: {found_name}, {found_region} -> [{lon}, {lat}], En Bretagne: {in_bretagne}")
                 
-                # Si on arrive ici, aucune correspondance n'a été trouvée en Bretagne
-                logging.warning(f"Aucune correspondance en Bretagne pour la stratégie {strategy_index+1}")
-                last_error = "Localité non trouvée en Bretagne"
+                if in_bretagne:
+                    attempt.coordinates = (lon, lat)
+                    attempt.in_bounds = True
+                    return attempt
                 
-            except requests.exceptions.RequestException as e:
-                logging.error(f"Erreur de connexion pour la stratégie {strategy_index+1}: {str(e)}")
-                last_error = f"Problème de connexion au service de géocodage: {str(e)}"
-        
-        # Si on arrive ici, aucune stratégie n'a fonctionné
-        error_msg = last_error or "Impossible de localiser cette ville en Bretagne"
-        
-        # Si nous avons une réponse, enregistrer plus de détails pour le débogage
-        if last_response:
-            logging.error(f"Dernière réponse: Code {last_response.status_code}")
-            logging.error(f"Contenu de la réponse: {last_response.text[:500]}...")
-            logging.error(f"En-têtes de réponse: {dict(last_response.headers)}")
+                # En dernier recours, prendre la première correspondance même hors Bretagne
+                if is_last:
+                    logging.warning(f"Aucune correspondance en Bretagne, utilisation du premier résultat: {found_name}, {found_region}")
+                    attempt.coordinates = (lon, lat)
+                    return attempt
+            
+            # Si on arrive ici, aucune correspondance n'a été trouvée en Bretagne
+            logging.warning(f"Aucune correspondance en Bretagne pour la stratégie {strategy_index+1}")
+            attempt.error = "Localité non trouvée en Bretagne"
+            
+        except RateLimitExceeded as e:
+            logging.warning(f"Stratégie {strategy_index+1} non exécutée: {str(e)}")
+            attempt.error = str(e)
+            attempt.transient = True
+            attempt.rate_limited = True
+            attempt.retry_after = e.wait
+        except requests.exceptions.RequestException as e:
+            logging.error(f"Erreur de connexion pour la stratégie {strategy_index+1}: {str(e)}")
+            attempt.error = f"Problème de connexion au service de géocodage: {str(e)}"
+            attempt.transient = True
         
-        # Utiliser des coordonnées de secours pour Rennes
-        logging.warning("Utilisation des coordonnées par défaut pour Rennes comme solution de secours")
-        return [-1.6743, 48.1173]  # Coordonnées approximatives de Rennes
+        return attempt
+
+    @classmethod
+    def _active_strategy_indexes(cls, strategy_count):
+        """
+        Écarter les stratégies qui ne gagnent (presque) jamais après assez
+        d'essais. La dernière est toujours gardée : elle gagne rarement, mais
+        c'est le seul recours hors Bretagne avant les coordonnées de Rennes.
+        """
+        last_index = strategy_count - 1
+        with cls._strategy_stats_lock:
+            active = []
+            for index in range(strategy_count):
+                tried, won = cls._strategy_stats.get(index, (0, 0))
+                if (index != last_index and tried >= ORS_GEOCODE_MIN_SAMPLES
+                        and won / tried < ORS_GEOCODE_MIN_WIN_RATE):
+                    continue
+                active.append(index)
+        return active
+
+    @classmethod
+    def _record_strategy_outcome(cls, attempts, winner):
+        with cls._strategy_stats_lock:
+            for attempt in attempts:
+                tried, won = cls._strategy_stats.get(attempt.index, (0, 0))
+                is_winner = winner is not None and attempt.index == winner.index
+                cls._strategy_stats[attempt.index] = (tried + 1, won + int(is_winner))
+
+    @classmethod
+    def geocode_strategy_stats(cls):
+        """Taux de réussite par stratégie de géocodage, pour le suivi"""
+        with cls._strategy_stats_lock:
+            return {
+                index + 1: {
+                    'attempts': tried,
+                    'wins': won,
+                    'hit_rate': round(won / tried, 3) if tried else None
+                }
+                for index, (tried, won) in sorted(cls._strategy_stats.items())
+            }
 
     def generate_route(self, coordinates, preferences):
         """Générer un itinéraire avec des coordonnées données et des préférences"""
@@ -226,27 +396,52 @@ class ORSService:
         profile = ACTIVITY_PROFILES.get(activity, 'foot-hiking')
         logging.info(f"Profil ORS sélectionné: {profile}")
 
+        # Un itinéraire déjà calculé depuis la même zone évite tout appel ORS
+        route_cache = get_route_cache()
+        variety = wants_variety(preferences)
+        cache_key = route_cache_key('ors', coordinates, profile, distance_km, route_type)
+        if route_cache:
+            cached_route = route_cache.get(cache_key, variety=variety)
+            if cached_route:
+                return cached_route
+        
+        # Suivre les appels directions pour calibrer le facteur d'ajustement
+        calibration = get_distance_calibration().start_run(coordinates, profile, route_type, distance_km)
+        
         # Générer l'itinéraire en fonction du type
-        if route_type == 'loop':
-            return self._generate_simple_loop(coordinates, profile, distance_km)
-        else:
-            return self._generate_simple_out_and_back(coordinates, profile, distance_km)
+        try:
+            if route_type == 'loop':
+                route_data = self._generate_simple_loop(coordinates, profile, distance_km, calibration)
+            else:
+                route_data = self._generate_simple_out_and_back(coordinates, profile, distance_km, calibration)
+        finally:
+            calibration.finish()
+        
+        # Vérifier la distance et le dénivelé annoncés par ORS avec nos propres calculs
+        metrics = route_metrics(route_data)
+        check_against_ors(route_data, metrics)
+        logging.info(f"Itinéraire mesuré: {metrics.distance_km:.2f}km, D+ {metrics.ascent_m:.0f}m, "
+                     f"D- {metrics.descent_m:.0f}m, pente max {metrics.max_grade_percent:.0f}%")
+        
+        if route_cache:
+            route_cache.put(cache_key, route_data)
+        return route_data
 
-    def _generate_simple_loop(self, start_point, profile, distance_km):
+    def _generate_simple_loop(self, start_point, profile, distance_km, calibration):
         """Générer un itinéraire en boucle simple"""
         logging.info(f"Génération d'un itinéraire en boucle de {distance_km}km depuis {start_point}")
         
-        # Facteur d'ajustement adaptatif basé sur la distance
-        # Plus la distance est grande, plus le facteur est important
-        if distance_km <= 3:
-            adjustment_factor = 1.3  # Augmenté pour les courtes distances
-        elif distance_km <= 10:
-            adjustment_factor = 1.7  # Augmenté pour les distances moyennes
-        else:
-            adjustment_factor = 2.0  # Augmenté pour les longues distances
-            
+        adjustment_factor = calibration.initial_factor or self._initial_loop_factor(distance_km)
         logging.info(f"Facteur d'ajustement initial: {adjustment_factor} pour {distance_km}km")
         
+        if ORS_ROUTE_CANDIDATES > 1:
+            candidates = [
+                (self._loop_waypoints(start_point, distance_km, adjustment_factor * scale, rotation),
+                 adjustment_factor * scale)
+                for scale, rotation in self._candidate_variations(ORS_ROUTE_CANDIDATES, 8)
+            ]
+            return self._route_candidates_concurrently(candidates, profile, distance_km, calibration)
+        
         # Plusieurs tentatives pour obtenir la bonne distance
         max_attempts = 3
         best_route_data = None
@@ -267,41 +462,7 @@ class ORSService:
                     # Augmenter progressivement si on n'a pas encore de résultat
                     adjustment_factor *= 1.2
             
-            # Calculer le rayon approximatif pour la distance souhaitée
-            # Formule ajustée: distance ≈ 2πr où r est le rayon, avec facteur d'ajustement
-            radius_km = (distance_km / (2 * pi)) * adjustment_factor
-            
-            # Convertir le rayon en degrés (approximativement)
-            # Ajustement pour la latitude: 1 degré de longitude ≈ 111km * cos(latitude)
-            lat_radians = radians(start_point[1])
-            lon_scale = cos(lat_radians)
-            radius_lon_deg = radius_km / (111.0 * lon_scale) if lon_scale > 0.1 else radius_km / 11.1
-            radius_lat_deg = radius_km / 111.0
-            
-            logging.info(f"Rayon calculé: {radius_km}km, {radius_lon_deg}° lon, {radius_lat_deg}° lat")
-            
-            # Générer des points en forme d'ellipse (pour compenser la distorsion)
-            points = []
-            points.append(start_point)  # Point de départ
-            
-            # Utiliser plus de points pour avoir un itinéraire plus naturel
-            num_points = 8  # Augmenté pour plus de précision
-            
-            for i in range(num_points):
-                angle = i * (2 * pi / num_points)
-                # Utiliser une forme d'ellipse pour compenser la projection
-                lon = start_point[0] + radius_lon_deg * cos(angle)
-                lat = start_point[1] + radius_lat_deg * sin(angle)
-                
-                # Ajouter un peu de variation aléatoire (±5%), réduit pour plus de précision
-                lon_jitter = radius_lon_deg * 0.05 * (random.random() - 0.5)
-                lat_jitter = radius_lat_deg * 0.05 * (random.random() - 0.5)
-                
-                points.append([lon + lon_jitter, lat + lat_jitter])
-                
-            points.append(start_point)  # Retour au point de départ
-            
-            logging.info(f"Généré {len(points)} points pour l'itinéraire")
+            points = self._loop_waypoints(start_point, distance_km, adjustment_factor)
             
             try:
                 # Essayer avec ces points
@@ -309,6 +470,7 @@ class ORSService:
                 
                 # Vérifier la distance obtenue
                 actual_distance = route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
+                calibration.observe(adjustment_factor, actual_distance)
                 distance_diff = abs(actual_distance - distance_km)
                 difference_percent = (distance_diff / distance_km) * 100
                 
@@ -327,6 +489,7 @@ class ORSService:
                     return route_data
                 
             except Exception as e:
+                calibration.observe(adjustment_factor)
                 logging.warning(f"Erreur lors de la tentative {attempt+1}: {str(e)}")
         
         # Retourner la meilleure route trouvée ou la dernière tentative
@@ -340,23 +503,78 @@ class ORSService:
         logging.warning("Aucune route acceptable trouvée, renvoi du dernier résultat")
         return route_data
 
-    def _generate_simple_out_and_back(self, start_point, profile, distance_km):
+    @staticmethod
+    def _initial_loop_factor(distance_km):
+        # Facteur d'ajustement adaptatif basé sur la distance
+        # Plus la distance est grande, plus le facteur est important
+        if distance_km <= 3:
+            return 1.3  # Augmenté pour les courtes distances
+        elif distance_km <= 10:
+            return 1.7  # Augmenté pour les distances moyennes
+        else:
+            return 2.0  # Augmenté pour les longues distances
+
+    @staticmethod
+    def _loop_waypoints(start_point, distance_km, adjustment_factor, rotation=0.0):
+        """Points de passage disposés en ellipse autour du départ"""
+        # Calculer le rayon approximatif pour la distance souhaitée
+        # Formule ajustée: distance ≈ 2πr où r est le rayon, avec facteur d'ajustement
+        radius_km = (distance_km / (2 * pi)) * adjustment_factor
+        
+        # Convertir le rayon en degrés (approximativement)
+        # Ajustement pour la latitude: 1 degré de longitude ≈ 111km * cos(latitude)
+        lat_radians = radians(start_point[1])
+        lon_scale = cos(lat_radians)
+        radius_lon_deg = radius_km / (111.0 * lon_scale) if lon_scale > 0.1 else radius_km / 11.1
+        radius_lat_deg = radius_km / 111.0
+        
+        logging.info(f"Rayon calculé: {radius_km}km, {radius_lon_deg}° lon, {radius_lat_deg}° lat")
+        
+        # Générer des points en forme d'ellipse (pour compenser la distorsion)
+        points = []
+        points.append(start_point)  # Point de départ
+        
+        # Utiliser plus de points pour avoir un itinéraire plus naturel
+        num_points = 8  # Augmenté pour plus de précision
+        
+        for i in range(num_points):
+            angle = rotation + i * (2 * pi / num_points)
+            # Utiliser une forme d'ellipse pour compenser la projection
+            lon = start_point[0] + radius_lon_deg * cos(angle)
+            lat = start_point[1] + radius_lat_deg * sin(angle)
+            
+            # Ajouter un peu de variation aléatoire (±5%), réduit pour plus de précision
+            lon_jitter = radius_lon_deg * 0.05 * (random.random() - 0.5)
+            lat_jitter = radius_lat_deg * 0.05 * (random.random() - 0.5)
+            
+            points.append([lon + lon_jitter, lat + lat_jitter])
+            
+        points.append(start_point)  # Retour au point de départ
+        
+        logging.info(f"Généré {len(points)} points pour l'itinéraire")
+        return points
+
+    def _generate_simple_out_and_back(self, start_point, profile, distance_km, calibration):
         """Générer un itinéraire aller-retour simple"""
         logging.info(f"Génération d'un itinéraire aller-retour de {distance_km}km depuis {start_point}")
         
         # Distance aller = moitié de la distance totale
         half_distance_km = distance_km / 2
         
-        # Facteur d'ajustement adaptatif, augmenté pour plus de précision
-        if half_distance_km <= 3:
-            adjustment_factor = 1.4
-        elif half_distance_km <= 10:
-            adjustment_factor = 1.7
-        else:
-            adjustment_factor = 2.0
-            
+        adjustment_factor = calibration.initial_factor or self._initial_out_and_back_factor(half_distance_km)
         logging.info(f"Facteur d'ajustement initial: {adjustment_factor} pour {half_distance_km}km (aller)")
         
+        if ORS_ROUTE_CANDIDATES > 1:
+            # Directions resserrées (±45°) autour de la direction préférée, qui évite l'océan
+            base_angle = self._initial_out_and_back_angle(start_point)
+            candidates = [
+                (self._out_and_back_waypoints(start_point, half_distance_km,
+                                              adjustment_factor * scale, base_angle + rotation),
+                 adjustment_factor * scale)
+                for scale, rotation in self._candidate_variations(ORS_ROUTE_CANDIDATES, 4, centred=True)
+            ]
+            return self._route_candidates_concurrently(candidates, profile, distance_km, calibration)
+        
         # Plusieurs tentatives pour obtenir la bonne distance
         max_attempts = 3
         best_route_data = None
@@ -377,61 +595,16 @@ class ORSService:
                     # Augmenter progressivement si on n'a pas encore de résultat
                     adjustment_factor *= 1.2
             
-            # Convertir la distance en degrés avec ajustement pour la latitude
-            lat_radians = radians(start_point[1])
-            lon_scale = cos(lat_radians)
-            
-            # Ajuster pour la distorsion aux différentes latitudes
-            lon_distance_deg = (half_distance_km * adjustment_factor) / (111.0 * lon_scale) if lon_scale > 0.1 else (half_distance_km * adjustment_factor) / 11.1
-            lat_distance_deg = (half_distance_km * adjustment_factor) / 111.0
-            
             # Utiliser différentes directions à chaque tentative pour avoir plus de chances de succès
             if attempt == 0:
-                # Première tentative: direction aléatoire mais avec des préférences régionales
-                angle = random.uniform(0, 2 * pi)
-                
-                # Ajouter une préférence pour éviter l'océan en Bretagne occidentale
-                if start_point[0] < -3.0:  # longitude ouest (Brest, etc.)
-                    # Éviter de trop aller vers l'ouest (océan)
-                    preferred_angles = [pi/4, 3*pi/4, 5*pi/4, 7*pi/4]  # NE, SE, SO, NO
-                    angle = min(preferred_angles, key=lambda a: abs((a - angle) % (2*pi)))
+                angle = self._initial_out_and_back_angle(start_point)
             else:
                 # Tentatives suivantes: directions orthogonales par rapport à la première
                 angle = (angle + (pi/2) * attempt) % (2*pi)
             
             logging.info(f"Tentative {attempt+1}: Direction {angle:.2f} radians")
             
-            # Calculer le point d'arrivée
-            end_point = [
-                start_point[0] + lon_distance_deg * cos(angle),
-                start_point[1] + lat_distance_deg * sin(angle)
-            ]
-            
-            # Créer des points intermédiaires pour un itinéraire plus naturel
-            points = [start_point]
-            
-            # Ajouter 3 points intermédiaires (plus que précédemment)
-            num_intermediates = 3
-            for i in range(1, num_intermediates + 1):
-                fraction = i / (num_intermediates + 1)
-                intermediate_point = [
-                    start_point[0] + fraction * (end_point[0] - start_point[0]),
-                    start_point[1] + fraction * (end_point[1] - start_point[1])
-                ]
-                
-                # Ajouter une légère variation pour éviter une ligne droite (réduite pour plus de précision)
-                jitter_scale = 0.08 * fraction * (1 - fraction)  # Max au milieu, zéro aux extrémités
-                lon_jitter = lon_distance_deg * jitter_scale * (random.random() - 0.5)
-                lat_jitter = lat_distance_deg * jitter_scale * (random.random() - 0.5)
-                
-                intermediate_point[0] += lon_jitter
-                intermediate_point[1] += lat_jitter
-                
-                points.append(intermediate_point)
-                
-            points.append(end_point)
-            
-            logging.info(f"Généré {len(points)} points pour l'itinéraire aller-retour")
+            points = self._out_and_back_waypoints(start_point, half_distance_km, adjustment_factor, angle)
             
             try:
                 # Essayer avec ces points
@@ -439,6 +612,7 @@ class ORSService:
                 
                 # Vérifier la distance obtenue
                 actual_distance = route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
+                calibration.observe(adjustment_factor, actual_distance)
                 distance_diff = abs(actual_distance - distance_km)
                 difference_percent = (distance_diff / distance_km) * 100
                 
@@ -457,6 +631,7 @@ class ORSService:
                     return route_data
                 
             except Exception as e:
+                calibration.observe(adjustment_factor)
                 logging.warning(f"Erreur lors de la tentative {attempt+1}: {str(e)}")
         
         # Retourner la meilleure route trouvée ou la dernière tentative
@@ -470,6 +645,147 @@ class ORSService:
         logging.warning("Aucune route acceptable trouvée, renvoi du dernier résultat")
         return route_data
 
+    @staticmethod
+    def _initial_out_and_back_factor(half_distance_km):
+        # Facteur d'ajustement adaptatif, augmenté pour plus de précision
+        if half_distance_km <= 3:
+            return 1.4
+        elif half_distance_km <= 10:
+            return 1.7
+        else:
+            return 2.0
+
+    @staticmethod
+    def _initial_out_and_back_angle(start_point):
+        # Première tentative: direction aléatoire mais avec des préférences régionales
+        angle = random.uniform(0, 2 * pi)
+        
+        # Ajouter une préférence pour éviter l'océan en Bretagne occidentale
+        if start_point[0] < -3.0:  # longitude ouest (Brest, etc.)
+            # Éviter de trop aller vers l'ouest (océan)
+            preferred_angles = [pi/4, 3*pi/4, 5*pi/4, 7*pi/4]  # NE, SE, SO, NO
+            angle = min(preferred_angles, key=lambda a: abs((a - angle) % (2*pi)))
+        return angle
+
+    @staticmethod
+    def _out_and_back_waypoints(start_point, half_distance_km, adjustment_factor, angle):
+        """Points de passage en ligne légèrement bruitée vers un point d'arrivée"""
+        # Convertir la distance en degrés avec ajustement pour la latitude
+        lat_radians = radians(start_point[1])
+        lon_scale = cos(lat_radians)
+        
+        # Ajuster pour la distorsion aux différentes latitudes
+        lon_distance_deg = (half_distance_km * adjustment_factor) / (111.0 * lon_scale) if lon_scale > 0.1 else (half_distance_km * adjustment_factor) / 11.1
+        lat_distance_deg = (half_distance_km * adjustment_factor) / 111.0
+        
+        # Calculer le point d'arrivée
+        end_point = [
+            start_point[0] + lon_distance_deg * cos(angle),
+            start_point[1] + lat_distance_deg * sin(angle)
+        ]
+        
+        # Créer des points intermédiaires pour un itinéraire plus naturel
+        points = [start_point]
+        
+        # Ajouter 3 points intermédiaires (plus que précédemment)
+        num_intermediates = 3
+        for i in range(1, num_intermediates + 1):
+            fraction = i / (num_intermediates + 1)
+            intermediate_point = [
+                start_point[0] + fraction * (end_point[0] - start_point[0]),
+                start_point[1] + fraction * (end_point[1] - start_point[1])
+            ]
+            
+            # Ajouter une légère variation pour éviter une ligne droite (réduite pour plus de précision)
+            jitter_scale = 0.08 * fraction * (1 - fraction)  # Max au milieu, zéro aux extrémités
+            lon_jitter = lon_distance_deg * jitter_scale * (random.random() - 0.5)
+            lat_jitter = lat_distance_deg * jitter_scale * (random.random() - 0.5)
+            
+            intermediate_point[0] += lon_jitter
+            intermediate_point[1] += lat_jitter
+            
+            points.append(intermediate_point)
+            
+        points.append(end_point)
+        
+        logging.info(f"Généré {len(points)} points pour l'itinéraire aller-retour")
+        return points
+
+    @staticmethod
+    def _candidate_variations(count, sectors, centred=False):
+        """
+        Couples (échelle du facteur, rotation) pour count candidats : les
+        rayons alternent autour du facteur initial et les rotations se
+        répartissent sur un secteur de 2π/sectors. Avec centred, le secteur
+        est centré sur la rotation nulle (0, +δ, -δ, +2δ...) : le premier
+        candidat garde la direction préférée et les autres s'en écartent
+        d'au plus π/sectors.
+        """
+        scales = [1.0, 0.85, 1.15, 0.75, 1.3, 0.65, 1.45]
+        step = (2 * pi / sectors) / count
+        if centred:
+            rotations = [((i + 1) // 2) * step * (1 if i % 2 else -1) for i in range(count)]
+        else:
+            rotations = [i * step for i in range(count)]
+        return [(scales[i % len(scales)], rotations[i]) for i in range(count)]
+
+    def _route_candidates_concurrently(self, candidates, profile, distance_km, calibration):
+        """
+        Calculer les candidats (points, facteur) en parallèle (au plus
+        ORS_ROUTE_CONCURRENCY à la fois) et renvoyer le premier dans la
+        tolérance, ou à défaut le plus proche de la distance demandée.
+        """
+        logging.info(f"Calcul de {len(candidates)} candidats en parallèle "
+                     f"(concurrence max {ORS_ROUTE_CONCURRENCY})")
+        
+        best_route_data = None
+        best_distance_diff = float('inf')
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, min(ORS_ROUTE_CONCURRENCY, len(candidates))),
+                                      thread_name_prefix='ors-candidate')
+        futures = {}
+        try:
+            futures = {
+                executor.submit(self._request_directions, points, profile): index
+                for index, (points, factor) in enumerate(candidates)
+            }
+            for future in as_completed(futures):
+                index = futures[future]
+                factor = candidates[index][1]
+                try:
+                    route_data = future.result()
+                except Exception as e:
+                    calibration.observe(factor)
+                    logging.warning(f"Erreur pour le candidat {index+1}: {str(e)}")
+                    continue
+                
+                actual_distance = route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
+                calibration.observe(factor, actual_distance)
+                distance_diff = abs(actual_distance - distance_km)
+                difference_percent = (distance_diff / distance_km) * 100
+                logging.info(f"Candidat {index+1}: Distance obtenue: {actual_distance:.2f}km "
+                             f"(différence: {difference_percent:.1f}%)")
+                
+                if distance_diff < best_distance_diff:
+                    best_distance_diff = distance_diff
+                    best_route_data = route_data
+                
+                if difference_percent <= 15:
+                    logging.info(f"Candidat {index+1} dans la tolérance, abandon des autres candidats")
+                    return route_data
+        finally:
+            # Les candidats pas encore envoyés sont annulés ; ceux déjà partis sont comptés
+            executor.shutdown(wait=False, cancel_futures=True)
+            calibration.observe(None, calls=sum(1 for future in futures
+                                                if not future.done() and not future.cancelled()))
+        
+        if best_route_data:
+            logging.info(f"Utilisation du meilleur candidat (différence: {best_distance_diff:.2f}km)")
+            return best_route_data
+        
+        raise Exception("Aucun itinéraire candidat n'a pu être généré")
+
+    @span('ors_directions')
     def _request_directions(self, points, profile):
         """Envoyer une requête à l'API Directions d'ORS"""
         endpoint = f"{ORS_BASE_URL}/directions/{profile}/geojson"
@@ -483,10 +799,11 @@ class ORSService:
         }
 
         logging.info(f"Envoi requête directions: {len(points)} points, profil {profile}")
-        logging.debug(f"Payload: {json.dumps(payload)}")
+        if logging.getLogger().isEnabledFor(logging.DEBUG):
+            logging.debug(f"Payload: {json.dumps(payload)}")
 
         try:
-            response = requests.post(
+            response = get_http_client().post(
                 endpoint,
                 headers=self.headers,
                 json=payload,
@@ -505,6 +822,9 @@ class ORSService:
                 logging.error(f"Contenu: {response.text[:300]}...")
                 raise Exception("Le service d'itinéraire a renvoyé un format invalide")
 
+            # Refusée avant décodage : le JSON analysé pèse environ 7 fois la réponse
+            check_response_size(len(response.content))
+
             # Analyser la réponse
             try:
                 data = response.json()
@@ -0,0 +1,176 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Sequence, Tuple, Type
+from services.metrics import STAGE_SECONDS
+from services.memory import track_memory
+from services.profiling import current_session
+
+
+@dataclass
+class Stage:
+    """
+    Étape déclarative du pipeline.
+
+    func reçoit un dictionnaire {nom d'étape: résultat} contenant les
+    résultats de ses dépendances et renvoie son propre résultat.
+    """
+    name: str
+    func: Callable[[Dict[str, Any]], Any]
+    depends_on: Tuple[str, ...] = ()
+    timeout: Optional[float] = None
+    retries: int = 0
+    retry_delay: float = 0.5
+    retry_on: Tuple[Type[BaseException], ...] = (Exception,)
+    error_message: Optional[str] = None
+
+
+class StageTimeout(Exception):
+    """Levée quand une tentative d'étape dépasse son délai"""
+
+
+class StageFailed(Exception):
+    """Échec définitif d'une étape, après épuisement des nouvelles tentatives"""
+
+    def __init__(self, stage: Stage, cause: BaseException):
+        super().__init__(stage.error_message or str(cause))
+        self.stage = stage.name
+        self.cause = cause
+        self.status_code = getattr(cause, 'status_code', 500)
+
+
+class PipelineExecutor:
+    """
+    Exécute un graphe d'étapes en lançant chaque étape dès que ses
+    dépendances sont terminées, pour que la latence totale corresponde à la
+    branche la plus lente plutôt qu'à la somme des étapes.
+
+    Une tentative qui dépasse son délai est abandonnée : le thread Python ne
+    peut pas être interrompu, mais son résultat est ignoré. Une nouvelle
+    tentative s'exécute donc en même temps que la précédente : les étapes
+    à effet de bord (email, quota) ne doivent pas en avoir, et retry_on est
+    à restreindre aux erreurs transitoires.
+    """
+
+    def __init__(self, stages: Sequence[Stage],
+                 on_stage: Optional[Callable[[str, str], None]] = None,
+                 name: str = 'pipeline'):
+        self.stages = {stage.name: stage for stage in stages}
+        self.name = name
+        self.on_stage = on_stage or (lambda name, event: None)
+        self.timings: Dict[str, float] = {}
+        self._validate()
+
+    def _validate(self):
+        for stage in self.stages.values():
+            for dependency in stage.depends_on:
+                if dependency not in self.stages:
+                    raise ValueError(f"Étape {stage.name}: dépendance inconnue {dependency}")
+
+        # Détection de cycle par parcours en profondeur
+        visiting, visited = set(), set()
+
+        def visit(name):
+            if name in visited:
+                return
+            if name in visiting:
+                raise ValueError(f"Cycle détecté dans le pipeline autour de {name}")
+            visiting.add(name)
+            for dependency in self.stages[name].depends_on:
+                visit(dependency)
+            visiting.discard(name)
+            visited.add(name)
+
+        for name in self.stages:
+            visit(name)
+
+    def run(self) -> Dict[str, Any]:
+        """Exécuter toutes les étapes et renvoyer leurs résultats par nom"""
+        # Pic mémoire de la requête entière (stage=total), en plus de celui de chaque étape
+        with track_memory(self.name, 'total'):
+            return self._run()
+
+    def _run(self) -> Dict[str, Any]:
+        results: Dict[str, Any] = {}
+        attempts: Dict[str, int] = {name: 0 for name in self.stages}
+        started_at: Dict[str, float] = {}
+        running = {}  # future -> (stage, échéance)
+
+        # Les tentatives abandonnées après un délai occupent encore un thread
+        max_workers = sum(stage.retries + 1 for stage in self.stages.values())
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='pipeline')
+        # Requête profilée (services/profiling.py) : les threads d'étape rejoignent sa session
+        session = current_session()
+
+        def launch(stage, delay=0.0):
+            attempts[stage.name] += 1
+            if stage.name not in started_at:
+                started_at[stage.name] = time.perf_counter()
+                self.on_stage(stage.name, 'started')
+            inputs = {dependency: results[dependency] for dependency in stage.depends_on}
+            future = executor.submit(self._attempt, self.name, stage, inputs, delay, session)
+            deadline = time.monotonic() + delay + stage.timeout if stage.timeout else None
+            running[future] = (stage, deadline)
+
+        def handle_failure(stage, error):
+            if attempts[stage.name] <= stage.retries and isinstance(error, stage.retry_on):
+                logging.warning(f"Étape {stage.name}: tentative {attempts[stage.name]} en échec "
+                                f"({str(error)}), nouvelle tentative")
+                launch(stage, stage.retry_delay * attempts[stage.name])
+                return
+            logging.error(f"Étape {stage.name} en échec: {str(error)}")
+            STAGE_SECONDS.observe(time.perf_counter() - started_at[stage.name],
+                                  pipeline=self.name, stage=stage.name, outcome='error')
+            self.on_stage(stage.name, 'failed')
+            raise StageFailed(stage, error) from error
+
+        def launch_ready():
+            for stage in self.stages.values():
+                if stage.name in started_at:
+                    continue
+                if all(dependency in results for dependency in stage.depends_on):
+                    launch(stage)
+
+        try:
+            launch_ready()
+            while running:
+                deadlines = [deadline for _, deadline in running.values() if deadline]
+                timeout = max(0.0, min(deadlines) - time.monotonic()) if deadlines else None
+                done, _ = wait(list(running), timeout=timeout, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    stage, _ = running.pop(future)
+                    error = future.exception()
+                    if error is not None:
+                        handle_failure(stage, error)
+                        continue
+                    results[stage.name] = future.result()
+                    self.timings[stage.name] = time.perf_counter() - started_at[stage.name]
+                    STAGE_SECONDS.observe(self.timings[stage.name], pipeline=self.name,
+                                          stage=stage.name, outcome='ok')
+                    self.on_stage(stage.name, 'done')
+
+                now = time.monotonic()
+                for future, (stage, deadline) in list(running.items()):
+                    if deadline and now >= deadline and not future.done():
+                        running.pop(future)
+                        future.cancel()
+                        handle_failure(stage, StageTimeout(
+                            f"L'étape {stage.name} a dépassé {stage.timeout}s"))
+
+                launch_ready()
+
+            return results
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @staticmethod
+    def _attempt(pipeline: str, stage: Stage, inputs: Dict[str, Any], delay: float, session=None):
+        if delay:
+            time.sleep(delay)
+        with track_memory(pipeline, stage.name):
+            if session is not None:
+                with session.track():
+                    return stage.func(inputs)
+            return stage.func(inputs)
@@ -0,0 +1,198 @@
+import cProfile
+import functools
+import hmac
+import logging
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+from config import (PROFILING_ENABLED, PROFILING_DIR, PROFILING_MODE, PROFILING_SAMPLE_RATE,
+                    PROFILING_TOKEN, PROFILING_INTERVAL, PROFILING_MAX_FILES)
+from services.geocode_cache import normalize_place_name
+
+PROFILE_HEADER = 'X-Profile-Token'
+EXTENSIONS = {'cprofile': '.pstats', 'sampling': '.collapsed'}
+
+_local = threading.local()
+
+
+def should_profile(headers) -> bool:
+    """
+    Profiler cette requête ? Oui si l'en-tête X-Profile-Token porte le jeton
+    d'administration, sinon avec la probabilité PROFILING_SAMPLE_RATE.
+    """
+    if not PROFILING_ENABLED:
+        return False
+    token = headers.get(PROFILE_HEADER)
+    if token and PROFILING_TOKEN and hmac.compare_digest(token, PROFILING_TOKEN):
+        return True
+    return PROFILING_SAMPLE_RATE > 0 and random.random() < PROFILING_SAMPLE_RATE
+
+
+def current_session() -> Optional['ProfileSession']:
+    """Session de profilage du thread courant, à propager aux threads qu'il utilise"""
+    return getattr(_local, 'session', None)
+
+
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class ProfileSession:
+    """
+    Profil d'une requête, sur tous les threads qui y participent.
+
+    Le thread de la requête et les threads d'étape du pipeline (voir
+    PipelineExecutor) entrent dans la session avec track(). En mode
+    'cprofile', chaque thread a son propre cProfile.Profile, fusionnés en un
+    fichier .pstats à la fin ; en mode 'sampling', un thread relève la pile
+    des threads suivis toutes les `interval` secondes (temps réel, attentes
+    réseau comprises) et écrit des piles repliées (.collapsed), lisibles par
+    flamegraph.pl ou speedscope.
+    """
+
+    def __init__(self, label: str, mode: str = PROFILING_MODE,
+                 directory: str = PROFILING_DIR, interval: float = PROFILING_INTERVAL):
+        if mode not in EXTENSIONS:
+            raise ValueError(f"Mode de profilage inconnu: {mode}")
+        self.label = label
+        self.mode = mode
+        self.directory = directory
+        self.interval = interval
+        self.started = time.perf_counter()
+        self._threads: Dict[int, str] = {}
+        self._profiles: List[cProfile.Profile] = []
+        self._stacks: Counter = Counter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._sampler = None
+        if mode == 'sampling':
+            self._sampler = threading.Thread(target=self._sample, daemon=True, name='profiler')
+            self._sampler.start()
+
+    @contextmanager
+    def track(self):
+        """Profiler le thread courant pendant le bloc"""
+        thread = threading.current_thread()
+        previous = getattr(_local, 'session', None)
+        _local.session = self
+        with self._lock:
+            self._threads[thread.ident] = thread.name
+        profile = None
+        if self.mode == 'cprofile':
+            profile = cProfile.Profile()
+            profile.enable()
+        try:
+            yield self
+        finally:
+            if profile is not None:
+                profile.disable()
+                with self._lock:
+                    self._profiles.append(profile)
+            with self._lock:
+                self._threads.pop(thread.ident, None)
+            _local.session = previous
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stopping.wait(self.interval):
+            frames = sys._current_frames()
+            with self._lock:
+                threads = dict(self._threads)
+            for ident, name in threads.items():
+                frame = frames.get(ident)
+                if frame is None or ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(_frame_label(frame))
+                    frame = frame.f_back
+                # Threads du pool regroupés sous un même nom (pipeline_0, pipeline_1... -> pipeline)
+                stack.append(re.sub(r'_\d+$', '', name))
+                with self._lock:
+                    self._stacks[';'.join(reversed(stack))] += 1
+
+    def finish(self) -> Optional[str]:
+        """Arrêter le profilage et écrire le fichier ; renvoie son nom"""
+        self._stopping.set()
+        if self._sampler is not None:
+            self._sampler.join()
+        elapsed = time.perf_counter() - self.started
+
+        os.makedirs(self.directory, exist_ok=True)
+        slug = re.sub(r'[^a-z0-9]+', '-', normalize_place_name(self.label)).strip('-')[:40] or 'request'
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}-{slug}{EXTENSIONS[self.mode]}"
+        path = os.path.join(self.directory, name)
+
+        with self._lock:
+            if self.mode == 'cprofile':
+                if not self._profiles:
+                    return None
+                stats = pstats.Stats(self._profiles[0])
+                for profile in self._profiles[1:]:
+                    stats.add(profile)
+                stats.dump_stats(path)
+            else:
+                if not self._stacks:
+                    return None
+                with open(path, 'w') as f:
+                    for stack, count in self._stacks.most_common():
+                        f.write(f"{stack} {count}\n")
+
+        logging.info(f"Profil {self.mode} de '{self.label}' ({elapsed:.2f}s) écrit dans {path}")
+        prune_profiles(self.directory)
+        return name
+
+
+def profiled(func: Callable, label: str, mode: str = PROFILING_MODE) -> Callable:
+    """
+    func exécutée sous une nouvelle ProfileSession ; le nom du fichier écrit
+    est ajouté au résultat (clé 'profile') quand celui-ci est un dictionnaire.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        session = ProfileSession(label, mode)
+        try:
+            with session.track():
+                result = func(*args, **kwargs)
+        finally:
+            name = session.finish()
+        if name and isinstance(result, dict):
+            result = dict(result, profile=name)
+        return result
+    return wrapper
+
+
+def list_profiles(directory: str = PROFILING_DIR) -> List[Dict]:
+    """Profils disponibles, du plus récent au plus ancien"""
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for entry in os.scandir(directory):
+        extension = os.path.splitext(entry.name)[1]
+        if not entry.is_file() or extension not in EXTENSIONS.values():
+            continue
+        stat = entry.stat()
+        profiles.append({
+            'name': entry.name,
+            'mode': 'cprofile' if extension == '.pstats' else 'sampling',
+            'size': stat.st_size,
+            'created_at': stat.st_mtime
+        })
+    return sorted(profiles, key=lambda profile: profile['created_at'], reverse=True)
+
+
+def prune_profiles(directory: str = PROFILING_DIR, keep: int = PROFILING_MAX_FILES):
+    for profile in list_profiles(directory)[keep:]:
+        try:
+            os.remove(os.path.join(directory, profile['name']))
+        except OSError as e:
+            logging.warning(f"Impossible de supprimer le profil {profile['name']}: {str(e)}")
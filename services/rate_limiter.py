@@ -0,0 +1,196 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Dict, List, Optional, Tuple
+from config import (NOMINATIM_BASE_URL, RATE_LIMIT_ENABLED, RATE_LIMIT_PATH, RATE_LIMIT_MAX_WAIT,
+                    ORS_DIRECTIONS_PER_MINUTE, ORS_DIRECTIONS_PER_DAY,
+                    ORS_GEOCODE_PER_MINUTE, ORS_GEOCODE_PER_DAY, NOMINATIM_PER_SECOND)
+
+
+class RateLimitExceeded(Exception):
+    """Aucun créneau disponible avant l'échéance fixée par l'appelant"""
+
+    def __init__(self, upstream, wait):
+        super().__init__(f"Quota {upstream} épuisé, prochain créneau dans {wait:.1f}s")
+        self.upstream = upstream
+        self.wait = wait
+        self.status_code = 503
+
+
+def upstream_for_url(url: str) -> Optional[str]:
+    """Associer une URL sortante à son quota"""
+    if url.startswith(NOMINATIM_BASE_URL) or 'nominatim' in url:
+        return 'nominatim'
+    if '/geocode/' in url:
+        return 'ors_geocode'
+    if '/directions/' in url:
+        return 'ors_directions'
+    return None
+
+
+class RateLimiter:
+    """
+    Seaux à jetons par service amont, stockés dans SQLite pour être partagés
+    entre les workers gunicorn d'une même machine.
+
+    Chaque service amont a un ou plusieurs seaux (par minute, par jour...).
+    acquire() attend qu'un jeton soit disponible dans tous les seaux, au
+    plus jusqu'à l'échéance donnée. Les en-têtes de quota renvoyés par ORS
+    et les réponses 429 ajustent les seaux après coup.
+    """
+
+    def __init__(self, buckets: Dict[str, List[Tuple[str, float, float]]],
+                 path: str = RATE_LIMIT_PATH):
+        # buckets : {service: [(nom du seau, capacité, jetons par seconde)]}
+        self.buckets = buckets
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets ("
+                " name TEXT PRIMARY KEY,"
+                " tokens REAL NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " blocked_until REAL NOT NULL DEFAULT 0)"
+            )
+
+    def _connect(self):
+        # isolation_level=None : les transactions sont gérées explicitement
+        return sqlite3.connect(self.path, timeout=10, isolation_level=None)
+
+    def acquire(self, upstream: str, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        """Prendre un jeton pour upstream, en attendant au plus max_wait secondes"""
+        if upstream not in self.buckets:
+            return
+        deadline = time.time() + max_wait
+        waited = 0.0
+        while True:
+            wait = self._try_take(upstream)
+            if wait <= 0:
+                if waited:
+                    logging.info(f"Quota {upstream}: créneau obtenu après {waited:.2f}s d'attente")
+                return
+            remaining = deadline - time.time()
+            if wait > remaining:
+                logging.warning(f"Quota {upstream}: attente de {wait:.1f}s au-delà de l'échéance")
+                raise RateLimitExceeded(upstream, wait)
+            time.sleep(wait)
+            waited += wait
+
+    def _try_take(self, upstream) -> float:
+        """Consommer un jeton si possible ; sinon renvoyer le temps d'attente estimé"""
+        now = time.time()
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                states = []
+                wait = 0.0
+                for name, capacity, rate in self.buckets[upstream]:
+                    key = f"{upstream}:{name}"
+                    row = conn.execute(
+                        "SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?", (key,)
+                    ).fetchone()
+                    tokens, updated_at, blocked_until = row if row else (capacity, now, 0.0)
+                    tokens = min(capacity, tokens + (now - updated_at) * rate)
+                    wait = max(wait, blocked_until - now)
+                    if tokens < 1:
+                        wait = max(wait, (1 - tokens) / rate)
+                    states.append((key, tokens, blocked_until))
+
+                if wait <= 0:
+                    states = [(key, tokens - 1, blocked) for key, tokens, blocked in states]
+                for key, tokens, blocked_until in states:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO buckets (name, tokens, updated_at, blocked_until)"
+                        " VALUES (?, ?, ?, ?)", (key, tokens, now, blocked_until)
+                    )
+                conn.execute("COMMIT")
+                return wait
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+    def observe(self, upstream: str, response):
+        """Ajuster les seaux d'après la réponse (429, en-têtes x-ratelimit-*)"""
+        if upstream not in self.buckets or response is None:
+            return
+        now = time.time()
+        blocked_until = 0.0
+        remaining = None
+
+        if response.status_code == 429:
+            retry_after = response.headers.get('Retry-After')
+            try:
+                blocked_until = now + float(retry_after) if retry_after else now + 1.0
+            except ValueError:
+                blocked_until = now + 1.0
+
+        try:
+            if 'x-ratelimit-remaining' in response.headers:
+                remaining = float(response.headers['x-ratelimit-remaining'])
+            if remaining is not None and remaining <= 0 and 'x-ratelimit-reset' in response.headers:
+                blocked_until = max(blocked_until, float(response.headers['x-ratelimit-reset']))
+        except ValueError:
+            pass
+
+        if not blocked_until and remaining is None:
+            return
+
+        # Le quota signalé par ORS est le quota journalier : il borne le seau le plus long
+        longest = max(self.buckets[upstream], key=lambda bucket: bucket[1])[0]
+        with self._lock, closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for name, capacity, rate in self.buckets[upstream]:
+                key = f"{upstream}:{name}"
+                row = conn.execute(
+                    "SELECT tokens, updated_at, blocked_until FROM buckets WHERE name = ?", (key,)
+                ).fetchone()
+                tokens, updated_at, current_block = row if row else (capacity, now, 0.0)
+                tokens = min(capacity, tokens + (now - updated_at) * rate)
+                if remaining is not None and name == longest:
+                    tokens = min(tokens, remaining)
+                conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated_at, blocked_until)"
+                    " VALUES (?, ?, ?, ?)", (key, tokens, now, max(current_block, blocked_until))
+                )
+            conn.execute("COMMIT")
+        if blocked_until:
+            logging.warning(f"Quota {upstream}: service amont saturé jusqu'à {blocked_until - now:.1f}s")
+
+
+def default_buckets() -> Dict[str, List[Tuple[str, float, float]]]:
+    return {
+        'ors_directions': [
+            ('minute', ORS_DIRECTIONS_PER_MINUTE, ORS_DIRECTIONS_PER_MINUTE / 60),
+            ('day', ORS_DIRECTIONS_PER_DAY, ORS_DIRECTIONS_PER_DAY / 86400),
+        ],
+        'ors_geocode': [
+            ('minute', ORS_GEOCODE_PER_MINUTE, ORS_GEOCODE_PER_MINUTE / 60),
+            ('day', ORS_GEOCODE_PER_DAY, ORS_GEOCODE_PER_DAY / 86400),
+        ],
+        'nominatim': [
+            ('second', 1, NOMINATIM_PER_SECOND),
+        ],
+    }
+
+
+_limiter = None
+_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> Optional[RateLimiter]:
+    """Instance partagée, ou None si la limitation est désactivée"""
+    global _limiter
+    if not RATE_LIMIT_ENABLED:
+        return None
+    with _limiter_lock:
+        if _limiter is None:
+            _limiter = RateLimiter(default_buckets())
+        return _limiter
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import random
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import closing
+from typing import Dict, Optional
+from config import (ROUTE_CACHE_ENABLED, ROUTE_CACHE_PATH, ROUTE_CACHE_MAX_BYTES,
+                    ROUTE_CACHE_CELL_DEG, ROUTE_CACHE_DISTANCE_STEP_KM, ROUTE_CACHE_VARIANTS,
+                    ROUTE_CACHE_VARIETY)
+from services.metrics import record_cache
+
+
+def route_cache_key(namespace: str, start_point, profile: str, distance_km: float,
+                    route_type: str) -> str:
+    """
+    Clé de cache : départ ramené à une cellule de grille, distance arrondie
+    au pas configuré, profil et type de parcours.
+    """
+    cell_x = round(float(start_point[0]) / ROUTE_CACHE_CELL_DEG)
+    cell_y = round(float(start_point[1]) / ROUTE_CACHE_CELL_DEG)
+    distance_step = round(float(distance_km) / ROUTE_CACHE_DISTANCE_STEP_KM)
+    return f"{namespace}|{cell_x}:{cell_y}|{profile}|{distance_step}|{route_type}"
+
+
+def wants_variety(preferences: Dict) -> bool:
+    """Mode variété demandé par l'utilisateur ou activé globalement"""
+    requested = (preferences or {}).get('variety')
+    if isinstance(requested, str):
+        requested = requested.lower() in ('1', 'true', 'yes', 'on')
+    return bool(requested) or ROUTE_CACHE_VARIETY
+
+
+def compact_route(route_data: Dict) -> Dict:
+    """Retirer les instructions détaillées, inutiles pour le GPX et la description"""
+    compact = dict(route_data)
+    compact['features'] = []
+    for feature in route_data.get('features', []):
+        properties = dict(feature.get('properties', {}))
+        properties['segments'] = [
+            {key: value for key, value in segment.items() if key != 'steps'}
+            for segment in properties.get('segments', [])
+        ]
+        compact['features'].append({**feature, 'properties': properties})
+    return compact
+
+
+class RouteCache:
+    """
+    Cache SQLite des itinéraires ORS, compressés (zlib) et bornés en taille
+    totale avec éviction des moins récemment utilisés.
+
+    Chaque clé peut conserver jusqu'à max_variants itinéraires : en mode
+    « variété », un variant est tiré au hasard une fois la collection
+    complète, et les requêtes manquent le cache jusque-là pour la remplir.
+    """
+
+    def __init__(self, path: str = ROUTE_CACHE_PATH,
+                 max_bytes: int = ROUTE_CACHE_MAX_BYTES,
+                 max_variants: int = ROUTE_CACHE_VARIANTS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_variants = max(1, max_variants)
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS routes ("
+                " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+                " key TEXT NOT NULL,"
+                " payload BLOB NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS routes_key ON routes (key)")
+            conn.execute("CREATE INDEX IF NOT EXISTS routes_last_used ON routes (last_used)")
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, key: str, variety: bool = False) -> Optional[Dict]:
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                rows = conn.execute(
+                    "SELECT id, payload FROM routes WHERE key = ? ORDER BY id", (key,)
+                ).fetchall()
+                if not rows:
+                    record_cache('route', hit=False)
+                    return None
+                if variety:
+                    if len(rows) < self.max_variants:
+                        logging.info(f"Cache d'itinéraires: {len(rows)}/{self.max_variants} variants "
+                                     f"pour {key}, génération d'un nouveau variant")
+                        record_cache('route', hit=False)
+                        return None
+                    row_id, payload = random.choice(rows)
+                else:
+                    row_id, payload = rows[0]
+                conn.execute("UPDATE routes SET last_used = ? WHERE id = ?", (time.time(), row_id))
+        except sqlite3.Error as e:
+            logging.warning(f"Cache d'itinéraires indisponible: {str(e)}")
+            record_cache('route', hit=False)
+            return None
+
+        record_cache('route', hit=True)
+        logging.info(f"Cache d'itinéraires: itinéraire trouvé pour {key}")
+        return json.loads(zlib.decompress(payload))
+
+    def put(self, key: str, route_data: Dict):
+        payload = zlib.compress(json.dumps(compact_route(route_data), separators=(',', ':')).encode())
+        now = time.time()
+        try:
+            with self._lock, closing(self._connect()) as conn, conn:
+                conn.execute(
+                    "INSERT INTO routes (key, payload, size, created_at, last_used) VALUES (?, ?, ?, ?, ?)",
+                    (key, payload, len(payload), now, now)
+                )
+                # Garder au plus max_variants itinéraires par clé (les plus récents)
+                conn.execute(
+                    "DELETE FROM routes WHERE key = ? AND id NOT IN ("
+                    " SELECT id FROM routes WHERE key = ? ORDER BY id DESC LIMIT ?)",
+                    (key, key, self.max_variants)
+                )
+                self._evict(conn)
+        except sqlite3.Error as e:
+            logging.warning(f"Impossible d'écrire dans le cache d'itinéraires: {str(e)}")
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM routes").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for row_id, size in conn.execute("SELECT id, size FROM routes ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM routes WHERE id = ?", (row_id,))
+            total -= size
+            evicted += 1
+        logging.info(f"Cache d'itinéraires: {evicted} entrées évincées")
+
+
+_route_cache = None
+_route_cache_lock = threading.Lock()
+
+
+def get_route_cache() -> Optional[RouteCache]:
+    """Instance partagée, ou None si le cache est désactivé"""
+    global _route_cache
+    if not ROUTE_CACHE_ENABLED:
+        return None
+    with _route_cache_lock:
+        if _route_cache is None:
+            _route_cache = RouteCache()
+        return _route_cache
@@ -0,0 +1,273 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import closing
+from dataclasses import dataclass
+from itertools import product
+from typing import Dict, Iterable, Optional, Sequence
+from config import (ROUTE_CATALOGUE_ENABLED, ROUTE_CATALOGUE_PATH, ROUTE_CATALOGUE_PLACES,
+                    ROUTE_CATALOGUE_DISTANCES_KM, ROUTE_CATALOGUE_DISTANCE_TOLERANCE, ROUTE_CATALOGUE_WORKERS, ACTIVITY_PROFILES)
+from services.gazetteer import get_gazetteer
+from services.geocode_cache import normalize_place_name
+from services.metrics import record_cache
+from services.rate_limiter import RateLimitExceeded
+from services.route_cache import compact_route
+from services.route_export import FORMATS, RouteExport
+
+
+@dataclass
+class CatalogueEntry:
+    """Itinéraire précalculé, prêt à être exporté et envoyé"""
+    place: str
+    latitude: float
+    longitude: float
+    activity_type: str
+    distance_km: float     # distance demandée lors de la génération (palier du catalogue)
+    route_data: Dict       # GeoJSON ORS compacté, trace déjà simplifiée
+    summary: Dict          # summarize_route() sur la trace complète : distance, dénivelé, métriques
+    gpx: bytes
+    created_at: float = 0.0
+
+    def gpx_export(self, basename: str = 'parcours_bretagne') -> RouteExport:
+        spec = FORMATS['gpx']
+        return RouteExport(
+            format=spec.name,
+            filename=f"{basename}.{spec.extension}",
+            content=self.gpx,
+            maintype=spec.maintype,
+            subtype=spec.subtype,
+            points=len(self.route_data['features'][0]['geometry']['coordinates'])
+        )
+
+
+def _place_key(place_name: str) -> str:
+    return normalize_place_name(place_name)
+
+
+class RouteCatalogue:
+    """
+    Catalogue SQLite d'itinéraires précalculés pour les départs les plus
+    demandés, rempli hors ligne par build_catalogue().
+
+    Une entrée par commune, activité et palier de distance. Une requête
+    correspond à l'entrée de même commune (résolue par le gazetteer) et
+    même activité dont la distance est la plus proche, à
+    ROUTE_CATALOGUE_DISTANCE_TOLERANCE près.
+
+    Les entrées sont produites par le générateur du pipeline web
+    (RouteGenerator.request_route, boucle round_trip d'ORS), qui ne tient
+    compte que de l'activité et de la distance : comme en direct, le type
+    de parcours, le niveau, le paysage et elevation_preference n'influent
+    pas sur l'itinéraire servi. Ils restent utilisés par la description ;
+    le GPX stocké porte des métadonnées génériques (sans niveau ni paysage).
+    """
+
+    def __init__(self, path: str = ROUTE_CATALOGUE_PATH,
+                 tolerance: float = ROUTE_CATALOGUE_DISTANCE_TOLERANCE):
+        self.path = path
+        self.tolerance = tolerance
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS catalogue ("
+                " place TEXT NOT NULL,"
+                " activity_type TEXT NOT NULL,"
+                " distance_km REAL NOT NULL,"
+                " name TEXT NOT NULL,"
+                " latitude REAL NOT NULL,"
+                " longitude REAL NOT NULL,"
+                " route BLOB NOT NULL,"
+                " summary TEXT NOT NULL,"
+                " gpx BLOB NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " PRIMARY KEY (place, activity_type, distance_km))"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.path, timeout=5)
+
+    def get(self, location: str, activity_type: str, distance_km) -> Optional[CatalogueEntry]:
+        """Entrée correspondant à une requête utilisateur, ou None"""
+        try:
+            distance_km = float(distance_km)
+        except (TypeError, ValueError):
+            return None
+        place = get_gazetteer().resolve(str(location))
+        if place is None or distance_km <= 0:
+            record_cache('catalogue', hit=False)
+            return None
+
+        try:
+            with self._lock, closing(self._connect()) as conn:
+                row = conn.execute(
+                    "SELECT name, latitude, longitude, distance_km, route, summary, gpx, created_at"
+                    " FROM catalogue WHERE place = ? AND activity_type = ?"
+                    " ORDER BY ABS(distance_km - ?) LIMIT 1",
+                    (_place_key(place.name), activity_type, distance_km)
+                ).fetchone()
+        except sqlite3.Error as e:
+            logging.warning(f"Catalogue d'itinéraires indisponible: {str(e)}")
+            record_cache('catalogue', hit=False)
+            return None
+
+        if row is None or abs(row[3] - distance_km) > self.tolerance * distance_km:
+            record_cache('catalogue', hit=False)
+            return None
+
+        name, latitude, longitude, entry_distance, route, summary, gpx, created_at = row
+        record_cache('catalogue', hit=True)
+        logging.info(f"Catalogue: parcours {activity_type} de {entry_distance:g}km "
+                     f"depuis {name} pour une demande de {distance_km:g}km")
+        return CatalogueEntry(
+            place=name, latitude=latitude, longitude=longitude,
+            activity_type=activity_type, distance_km=entry_distance,
+            route_data=json.loads(zlib.decompress(route)), summary=json.loads(summary),
+            gpx=zlib.decompress(gpx), created_at=created_at
+        )
+
+    def put(self, entry: CatalogueEntry):
+        route = zlib.compress(json.dumps(compact_route(entry.route_data), separators=(',', ':')).encode())
+        with self._lock, closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO catalogue (place, activity_type, distance_km, name,"
+                " latitude, longitude, route, summary, gpx, created_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (_place_key(entry.place), entry.activity_type, entry.distance_km,
+                 entry.place, entry.latitude, entry.longitude, route, json.dumps(entry.summary),
+                 zlib.compress(entry.gpx), entry.created_at or time.time())
+            )
+
+    def contains(self, place: str, activity_type: str, distance_km: float) -> bool:
+        with self._lock, closing(self._connect()) as conn:
+            return conn.execute(
+                "SELECT 1 FROM catalogue WHERE place = ? AND activity_type = ? AND distance_km = ?",
+                (_place_key(place), activity_type, float(distance_km))
+            ).fetchone() is not None
+
+    def stats(self) -> Dict:
+        with self._lock, closing(self._connect()) as conn:
+            entries, places, size = conn.execute(
+                "SELECT COUNT(*), COUNT(DISTINCT place),"
+                " COALESCE(SUM(LENGTH(route) + LENGTH(gpx)), 0) FROM catalogue"
+            ).fetchone()
+        return {'entries': entries, 'places': places, 'bytes': size}
+
+
+def build_entry(place_name: str, activity_type: str, distance_km: float) -> CatalogueEntry:
+    """
+    Générer une entrée avec le générateur des requêtes en direct
+    (RouteGenerator.request_route) ; exécutée dans un processus de
+    build_catalogue().
+    """
+    # Imports locaux : seuls les processus de génération ont besoin du client ORS
+    from services.route_generator import RouteGenerator
+    from services.gpx_writer import render_gpx
+    from services.simplify import simplify_route
+
+    place = get_gazetteer().resolve(place_name)
+    if place is None:
+        raise ValueError(f"Commune inconnue du gazetteer: {place_name}")
+
+    # Mêmes préférences qu'une requête du formulaire : seules l'activité et la distance comptent
+    generator = RouteGenerator()
+    route_data = generator.request_route((place.latitude, place.longitude),
+                                         {'activity_type': activity_type, 'distance': distance_km})
+    summary = generator.summarize_route(route_data)
+    simplified, _ = simplify_route(route_data)
+    coordinates = simplified['features'][0]['geometry']['coordinates']
+
+    # Le niveau et le paysage varient d'une requête à l'autre : absents du GPX précalculé
+    gpx = render_gpx(
+        coordinates,
+        name=f"Parcours {activity_type} - {place.name}",
+        description=f"Parcours {summary['distance']:.1f}km - D+ {summary['elevation_gain']:.0f}m",
+        author_name="Sport Outdoor Route Generator"
+    ).encode('utf-8')
+    logging.info(f"Catalogue: {place.name} {activity_type} {distance_km:g}km -> "
+                 f"{summary['distance']:.1f}km, {len(coordinates)} points")
+    return CatalogueEntry(
+        place=place.name, latitude=place.latitude, longitude=place.longitude,
+        activity_type=activity_type, distance_km=float(distance_km),
+        route_data=simplified, summary=summary, gpx=gpx, created_at=time.time()
+    )
+
+
+def _build_with_quota(place_name, activity_type, distance_km, attempts=3):
+    """build_entry en attendant la reconstitution du quota ORS plutôt qu'en échouant"""
+    for attempt in range(attempts):
+        try:
+            return build_entry(place_name, activity_type, distance_km)
+        except RateLimitExceeded as e:
+            if attempt + 1 >= attempts:
+                raise
+            logging.warning(f"Catalogue: {str(e)}, nouvelle tentative dans {e.wait:.0f}s")
+            time.sleep(e.wait)
+
+
+def build_catalogue(places: Sequence[str] = ROUTE_CATALOGUE_PLACES,
+                    activities: Iterable[str] = tuple(ACTIVITY_PROFILES),
+                    distances_km: Iterable[float] = ROUTE_CATALOGUE_DISTANCES_KM,
+                    workers: int = ROUTE_CATALOGUE_WORKERS, refresh: bool = False,
+                    catalogue: Optional[RouteCatalogue] = None) -> Dict[str, int]:
+    """
+    Remplir le catalogue pour chaque combinaison départ × activité × distance,
+    dans un pool de processus.
+
+    Les processus partagent le limiteur de débit SQLite (rate_limiter.py) :
+    le débit total reste sous le quota ORS quel que soit leur nombre. Les
+    entrées déjà présentes sont sautées sauf avec refresh, ce qui permet de
+    reprendre un remplissage interrompu par le quota journalier.
+    """
+    catalogue = catalogue or RouteCatalogue()
+    counts = {'built': 0, 'failed': 0, 'skipped': 0}
+    combinations = []
+    for place_name in places:
+        place = get_gazetteer().resolve(place_name)
+        if place is None:
+            logging.warning(f"Catalogue: commune inconnue du gazetteer, ignorée: {place_name}")
+            continue
+        for activity, distance in product(activities, distances_km):
+            if not refresh and catalogue.contains(place.name, activity, float(distance)):
+                counts['skipped'] += 1
+            else:
+                combinations.append((place.name, activity, float(distance)))
+    if not combinations:
+        return counts
+
+    logging.info(f"Catalogue: {len(combinations)} itinéraires à générer avec {workers} processus")
+    with ProcessPoolExecutor(max_workers=max(1, workers)) as executor:
+        futures = {executor.submit(_build_with_quota, *combination): combination
+                   for combination in combinations}
+        for future in as_completed(futures):
+            place, activity, distance = futures[future]
+            try:
+                catalogue.put(future.result())
+                counts['built'] += 1
+            except Exception as e:
+                counts['failed'] += 1
+                logging.error(f"Catalogue: échec pour {place} {activity} {distance:g}km: {str(e)}")
+    return counts
+
+
+_route_catalogue = None
+_route_catalogue_lock = threading.Lock()
+
+
+def get_route_catalogue() -> Optional[RouteCatalogue]:
+    """Instance partagée, ou None si le catalogue est désactivé"""
+    global _route_catalogue
+    if not ROUTE_CATALOGUE_ENABLED:
+        return None
+    with _route_catalogue_lock:
+        if _route_catalogue is None:
+            _route_catalogue = RouteCatalogue()
+        return _route_catalogue
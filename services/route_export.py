@@ -0,0 +1,308 @@
+import json
+import logging
+import struct
+import zlib
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterator, Optional
+
+import numpy as np
+
+from config import EXPORT_DEFAULT_FORMAT, EXPORT_GZIP_LEVEL
+from services.geometry import as_array, compute_metrics, cumulative_distance
+from services.gpx_writer import iter_gpx_bytes
+from services.metrics import span
+
+# Points encoded per chunk by the streaming encoders
+CHUNK_POINTS = 2000
+
+
+@dataclass
+class ExportFormat:
+    name: str
+    extension: str
+    maintype: str
+    subtype: str
+    encoder: Callable[..., Iterator[bytes]]
+    description: str
+
+
+@dataclass
+class RouteExport:
+    format: str
+    filename: str
+    content: bytes
+    maintype: str
+    subtype: str
+    points: int
+
+    @property
+    def mimetype(self) -> str:
+        return f"{self.maintype}/{self.subtype}"
+
+
+# --- GPX ---------------------------------------------------------------------
+
+def iter_gpx_export(coordinates, name=None, description=None, author_name=None,
+                    time=None, **_) -> Iterator[bytes]:
+    yield from iter_gpx_bytes(coordinates, name=name, description=description,
+                              author_name=author_name, time=time, chunk_points=CHUNK_POINTS)
+
+
+def iter_gpx_gzip(coordinates, **metadata) -> Iterator[bytes]:
+    """GPX compressed on the fly into a .gz stream"""
+    compressor = zlib.compressobj(EXPORT_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in iter_gpx_export(coordinates, **metadata):
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+# --- Encoded polyline ----------------------------------------------------------
+
+def _polyline_chunk(deltas: np.ndarray) -> bytes:
+    """Google polyline characters for a flat array of integer deltas"""
+    values = np.where(deltas < 0, ~(deltas << 1), deltas << 1).astype(np.int64)
+    # Up to 7 groups of 5 bits per value (deltas fit in 32 bits)
+    shifts = np.arange(0, 35, 5)
+    groups = (values[:, None] >> shifts) & 0x1F
+    lengths = np.maximum(1, (np.floor(np.log2(np.maximum(values, 1))).astype(np.int64) // 5) + 1)
+    lengths[values == 0] = 1
+    used = np.arange(len(shifts)) < lengths[:, None]
+    more = np.arange(len(shifts)) < (lengths - 1)[:, None]
+    characters = groups + 63 + np.where(more, 0x20, 0)
+    return characters[used].astype(np.uint8).tobytes()
+
+
+def iter_polyline(coordinates, precision: int = 5, **_) -> Iterator[bytes]:
+    """Google encoded polyline of (lat, lon); elevation is dropped by the format"""
+    points = as_array(coordinates)
+    if not len(points):
+        return
+    scaled = np.round(points[:, [1, 0]] * 10 ** precision).astype(np.int64)
+    deltas = np.diff(scaled, axis=0, prepend=np.zeros((1, 2), dtype=np.int64))
+    for start in range(0, len(deltas), CHUNK_POINTS):
+        yield _polyline_chunk(deltas[start:start + CHUNK_POINTS].ravel())
+
+
+def decode_polyline(encoded: str, precision: int = 5):
+    """[(lat, lon), ...] from an encoded polyline (used to check exports)"""
+    coordinates, index, lat, lon = [], 0, 0, 0
+    factor = 10 ** precision
+    while index < len(encoded):
+        deltas = []
+        for _ in range(2):
+            shift = result = 0
+            while True:
+                byte = ord(encoded[index]) - 63
+                index += 1
+                result |= (byte & 0x1F) << shift
+                shift += 5
+                if byte < 0x20:
+                    break
+            deltas.append(~(result >> 1) if result & 1 else result >> 1)
+        lat += deltas[0]
+        lon += deltas[1]
+        coordinates.append((lat / factor, lon / factor))
+    return coordinates
+
+
+# --- GeoJSON -------------------------------------------------------------------
+
+def iter_geojson(coordinates, name=None, description=None, **_) -> Iterator[bytes]:
+    """A single LineString Feature, written CHUNK_POINTS coordinates at a time"""
+    properties = json.dumps({'name': name, 'description': description}, ensure_ascii=False)
+    yield f'{{"type": "Feature", "properties": {properties}, "geometry": {{"type": "LineString", "coordinates": ['.encode('utf-8')
+    for start in range(0, len(coordinates), CHUNK_POINTS):
+        chunk = ', '.join(json.dumps(list(c)) for c in coordinates[start:start + CHUNK_POINTS])
+        yield (', ' + chunk if start else chunk).encode('utf-8')
+    yield b']}}'
+
+
+# --- FIT (Garmin/ANT+ course file) ---------------------------------------------
+
+FIT_EPOCH = datetime(1989, 12, 31, tzinfo=timezone.utc)
+FIT_PROFILE_VERSION = 2132
+SEMICIRCLES = 2 ** 31 / 180
+
+# FIT sport enum and an average moving speed (m/s) used for record timestamps
+FIT_SPORTS = {
+    'running': (1, 2.8),
+    'trail': (1, 2.2),
+    'cycling': (2, 5.5),
+    'walking': (11, 1.3),
+    'hiking': (17, 1.1),
+}
+
+# Base types
+ENUM, UINT16, SINT32, UINT32, STRING = 0x00, 0x84, 0x85, 0x86, 0x07
+
+# (global message number, [(field number, size, base type), ...])
+FILE_ID = (0, [(0, 1, ENUM), (1, 2, UINT16), (2, 2, UINT16), (4, 4, UINT32)])
+COURSE_NAME_SIZE = 32
+COURSE = (31, [(4, 1, ENUM), (5, COURSE_NAME_SIZE, STRING)])
+LAP = (19, [(253, 4, UINT32), (2, 4, UINT32), (3, 4, SINT32), (4, 4, SINT32), (5, 4, SINT32),
+            (6, 4, SINT32), (7, 4, UINT32), (8, 4, UINT32), (9, 4, UINT32), (21, 2, UINT16),
+            (22, 2, UINT16)])
+EVENT = (21, [(253, 4, UINT32), (0, 1, ENUM), (1, 1, ENUM)])
+RECORD = (20, [(253, 4, UINT32), (0, 4, SINT32), (1, 4, SINT32), (2, 2, UINT16), (5, 4, UINT32)])
+
+# CRC-16 from the FIT SDK, expanded to a byte table
+_CRC_NIBBLES = [0x0000, 0xCC01, 0xD801, 0x1400, 0xF001, 0x3C00, 0x2800, 0xE401,
+                0xA001, 0x6C00, 0x7800, 0xB401, 0x5000, 0x9C01, 0x8801, 0x4400]
+
+
+def _crc_byte_table():
+    table = []
+    for byte in range(256):
+        crc = 0
+        for nibble in (byte & 0xF, byte >> 4):
+            tmp = _CRC_NIBBLES[crc & 0xF]
+            crc = ((crc >> 4) & 0x0FFF) ^ tmp ^ _CRC_NIBBLES[nibble]
+        table.append(crc)
+    return table
+
+
+_CRC_TABLE = _crc_byte_table()
+
+
+def fit_crc(data: bytes, crc: int = 0) -> int:
+    table = _CRC_TABLE
+    for byte in data:
+        crc = (crc >> 8) ^ table[(crc ^ byte) & 0xFF]
+    return crc
+
+
+def _definition(local: int, message) -> bytes:
+    number, fields = message
+    return (struct.pack('<BBBHB', 0x40 | local, 0, 0, number, len(fields))
+            + b''.join(struct.pack('<BBB', *field) for field in fields))
+
+
+def _data(local: int, message, *values) -> bytes:
+    _, fields = message
+    formats = {ENUM: 'B', UINT16: 'H', SINT32: 'i', UINT32: 'I'}
+    layout = '<B' + ''.join(formats.get(base, f'{size}s') for _, size, base in fields)
+    return struct.pack(layout, local, *values)
+
+
+def _record_size(message) -> int:
+    return 1 + sum(size for _, size, _ in message[1])
+
+
+def iter_fit(coordinates, name=None, time=None, sport=None, **_) -> Iterator[bytes]:
+    """
+    A FIT course (file type 6) that watches and head units can follow:
+    file_id, course, lap, start event, one record per point, stop event.
+    Record timestamps assume a steady pace for the activity.
+    """
+    points = as_array(coordinates)
+    count = len(points)
+    sport_code, speed = FIT_SPORTS.get((sport or '').lower(), FIT_SPORTS['hiking'])
+    time = time or datetime.now(timezone.utc)
+    if time.tzinfo is None:
+        time = time.replace(tzinfo=timezone.utc)
+    start = int((time - FIT_EPOCH).total_seconds())
+
+    distance = cumulative_distance(points) if count else np.zeros(0)
+    timestamps = start + np.round(distance / speed).astype(np.int64)
+    elevation = points[:, 2]
+    metrics = compute_metrics(points)
+    # Altitude is stored as (m + 500) * 5; 0xFFFF means invalid
+    altitude = np.where(np.isnan(elevation), 0xFFFF,
+                        np.clip(np.round((np.nan_to_num(elevation) + 500) * 5), 0, 0xFFFE)).astype(np.uint16)
+    lat = np.round(points[:, 1] * SEMICIRCLES).astype(np.int32)
+    lon = np.round(points[:, 0] * SEMICIRCLES).astype(np.int32)
+    total_distance = float(distance[-1]) if count else 0.0
+    end = int(timestamps[-1]) if count else start
+    first = (int(lat[0]), int(lon[0])) if count else (0x7FFFFFFF, 0x7FFFFFFF)
+    last = (int(lat[-1]), int(lon[-1])) if count else (0x7FFFFFFF, 0x7FFFFFFF)
+
+    course_name = (name or 'Course').encode('utf-8')[:COURSE_NAME_SIZE - 1]
+    messages = b''.join([
+        _definition(0, FILE_ID), _data(0, FILE_ID, 6, 255, 0, start),
+        _definition(1, COURSE), _data(1, COURSE, sport_code, course_name),
+        _definition(2, LAP), _data(2, LAP, end, start, *first, *last,
+                                   (end - start) * 1000, (end - start) * 1000,
+                                   int(round(total_distance * 100)),
+                                   int(min(metrics.ascent_m, 0xFFFE)) if metrics.has_elevation else 0xFFFF,
+                                   int(min(metrics.descent_m, 0xFFFE)) if metrics.has_elevation else 0xFFFF),
+        _definition(3, EVENT), _data(3, EVENT, start, 0, 0),  # timer start
+        _definition(4, RECORD),
+    ])
+    stop = _data(3, EVENT, end, 0, 9)  # timer stop_disable_all
+    data_size = len(messages) + count * _record_size(RECORD) + len(stop)
+
+    header = struct.pack('<BBHI4s', 14, 0x20, FIT_PROFILE_VERSION, data_size, b'.FIT')
+    header += struct.pack('<H', fit_crc(header))
+    crc = fit_crc(messages, fit_crc(header))
+    yield header + messages
+
+    # Records are packed with a structured array, CHUNK_POINTS at a time
+    record_type = np.dtype([('header', 'u1'), ('timestamp', '<u4'), ('lat', '<i4'), ('lon', '<i4'),
+                            ('altitude', '<u2'), ('distance', '<u4')])
+    for offset in range(0, count, CHUNK_POINTS):
+        block = slice(offset, offset + CHUNK_POINTS)
+        records = np.zeros(len(lat[block]), dtype=record_type)
+        records['header'] = 4
+        records['timestamp'] = timestamps[block]
+        records['lat'] = lat[block]
+        records['lon'] = lon[block]
+        records['altitude'] = altitude[block]
+        records['distance'] = np.round(distance[block] * 100)
+        chunk = records.tobytes()
+        crc = fit_crc(chunk, crc)
+        yield chunk
+
+    crc = fit_crc(stop, crc)
+    yield stop + struct.pack('<H', crc)
+
+
+# --- Registry --------------------------------------------------------------------
+
+FORMATS: Dict[str, ExportFormat] = {
+    'gpx': ExportFormat('gpx', 'gpx', 'application', 'gpx', iter_gpx_export,
+                        "GPX 1.1 (XML)"),
+    'gpx.gz': ExportFormat('gpx.gz', 'gpx.gz', 'application', 'gzip', iter_gpx_gzip,
+                           "GPX compressé (gzip)"),
+    'fit': ExportFormat('fit', 'fit', 'application', 'vnd.ant.fit', iter_fit,
+                        "FIT course (montres GPS)"),
+    'polyline': ExportFormat('polyline', 'txt', 'text', 'plain', iter_polyline,
+                             "Polyline encodée (sans altitude)"),
+    'geojson': ExportFormat('geojson', 'geojson', 'application', 'geo+json', iter_geojson,
+                            "GeoJSON"),
+}
+
+_ALIASES = {'gpxgz': 'gpx.gz', 'gz': 'gpx.gz', 'gpx_gz': 'gpx.gz', 'json': 'geojson'}
+
+
+def normalize_format(value: Optional[str]) -> str:
+    """Export format for a request value, EXPORT_DEFAULT_FORMAT when empty"""
+    name = (value or EXPORT_DEFAULT_FORMAT).strip().lower()
+    name = _ALIASES.get(name, name)
+    if name not in FORMATS:
+        raise ValueError(f"Unsupported export format: {value} (expected one of {', '.join(FORMATS)})")
+    return name
+
+
+def iter_export(coordinates, export_format: str, **metadata) -> Iterator[bytes]:
+    """Stream a track in the given format (name, description, author_name, time, sport)"""
+    return FORMATS[normalize_format(export_format)].encoder(coordinates, **metadata)
+
+
+@span('export')
+def export_route(coordinates, export_format: Optional[str] = None,
+                 basename: str = 'parcours_bretagne', **metadata) -> RouteExport:
+    """The whole export in memory, ready to attach to an email"""
+    spec = FORMATS[normalize_format(export_format)]
+    content = b''.join(spec.encoder(coordinates, **metadata))
+    logging.debug(f"Exported {len(coordinates)} points as {spec.name}: {len(content)} bytes")
+    return RouteExport(
+        format=spec.name,
+        filename=f"{basename}.{spec.extension}",
+        content=content,
+        maintype=spec.maintype,
+        subtype=spec.subtype,
+        points=len(coordinates)
+    )
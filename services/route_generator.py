@@ -1,18 +1,25 @@
 import os
 import json
-import requests
-import gpxpy
-import gpxpy.gpx
+import random
 from typing import Dict, Optional, Tuple
 import logging
+from services.route_cache import get_route_cache, route_cache_key, wants_variety
+from services.http_client import get_http_client
+from services.gpx_writer import render_gpx
+from services.route_export import RouteExport, export_route
+from services.geometry import ORS_DISTANCE_UNITS, check_against_ors, compute_metrics, route_metrics
+from services.metrics import span
+from services.memory import check_response_size
+from config import ORS_BASE_URL
 
-logging.basicConfig(level=logging.DEBUG)
+# Unit of the distances in our ORS directions responses (the "units" request parameter)
+ORS_UNITS = 'km'
 
 
 class RouteGenerator:
     def __init__(self):
         self.api_key = os.environ.get('OPENROUTE_API_KEY')
-        self.base_url = "https://api.openrouteservice.org"
+        self.base_url = ORS_BASE_URL
 
     def _get_profile(self, activity_type: str) -> str:
         """Convert activity type to ORS profile"""
@@ -31,34 +38,67 @@ class RouteGenerator:
         Generate a route using OpenRouteService API
         """
         try:
-            profile = self._get_profile(preferences['activity_type'])
-
-            # Convert distance from km to meters and ensure it's a float
-            distance_meters = float(preferences['distance']) * 1000
-
-            # Prepare the request body for ORS API
-            body = {
-                "coordinates": [start_coords],
-                "profile": profile,
-                "preference": "recommended",
-                "units": "km",
-                "language": "fr",
-                "instructions": True,
-                "elevation": True,
-                "options": {
-                    "round_trip": {
-                        "length": distance_meters,  # Use converted distance
-                        "points": 5,
-                        "seed": 1
-                    }
+            route_data = self.request_route(start_coords, preferences)
+
+            # Convert GeoJSON to GPX
+            summary = self.summarize_route(route_data)
+            summary['gpx_content'] = self._convert_to_gpx(route_data, preferences)
+            summary['coordinates'] = json.dumps(route_data['features'][0]['geometry']['coordinates'])
+            return summary
+
+        except Exception as e:
+            logging.error(f"Error generating route: {str(e)}")
+            return None
+
+    def request_route(self,
+                      start_coords: Tuple[float, float],
+                      preferences: Dict) -> Dict:
+        """
+        Request a round trip from the ORS API and return the raw GeoJSON
+        """
+        profile = self._get_profile(preferences['activity_type'])
+
+        # Serve a cached route for the same start area, profile and distance
+        route_cache = get_route_cache()
+        variety = wants_variety(preferences)
+        cache_key = route_cache_key('round_trip', start_coords, profile,
+                                    float(preferences['distance']), 'loop')
+        if route_cache:
+            cached_route = route_cache.get(cache_key, variety=variety)
+            if cached_route:
+                return cached_route
+
+        # Convert distance from km to meters and ensure it's a float
+        distance_meters = float(preferences['distance']) * 1000
+
+        # Prepare the request body for ORS API
+        # start_coords is (latitude, longitude); ORS expects [longitude, latitude]
+        body = {
+            "coordinates": [[start_coords[1], start_coords[0]]],
+            "profile": profile,
+            "preference": "recommended",
+            "units": ORS_UNITS,
+            "language": "fr",
+            "instructions": True,
+            "elevation": True,
+            "options": {
+                "round_trip": {
+                    "length": distance_meters,  # Use converted distance
+                    "points": 5,
+                    # A fixed seed always yields the same loop; variety mode needs new ones
+                    "seed": random.randint(0, 90) if variety else 1
                 }
             }
+        }
 
+        debug = logging.getLogger().isEnabledFor(logging.DEBUG)
+        if debug:
             logging.debug(f"Sending request to ORS API with body: {json.dumps(body)}")
 
-            # Make request to ORS API
-            response = requests.post(
-                f"{self.base_url}/v2/directions/{profile}/geojson",
+        # Make request to ORS API
+        with span('ors_directions'):
+            response = get_http_client().post(
+                f"{self.base_url}/directions/{profile}/geojson",
                 json=body,
                 headers={
                     'Authorization': self.api_key,
@@ -66,52 +106,61 @@ class RouteGenerator:
                 }
             )
             response.raise_for_status()
-
+            # Refused before decoding: the parsed JSON weighs about 7 times the body
+            check_response_size(len(response.content))
             route_data = response.json()
+
+        # Serialising a whole route only when DEBUG is on
+        if debug:
             logging.debug(f"Received response from ORS API: {json.dumps(route_data)}")
 
-            # Convert GeoJSON to GPX
-            gpx_content = self._convert_to_gpx(route_data, preferences)
+        if route_cache:
+            route_cache.put(cache_key, route_data)
+        return route_data
 
-            return {
-                'gpx_content': gpx_content,
-                'coordinates': json.dumps(route_data['features'][0]['geometry']['coordinates']),
-                'distance': route_data['features'][0]['properties']['segments'][0]['distance'],
-                'elevation_gain': route_data['features'][0]['properties']['segments'][0]['ascent']
-            }
+    @staticmethod
+    def summarize_route(route_data: Dict, distance_unit: str = ORS_UNITS) -> Dict:
+        """
+        Extract the values the rest of the pipeline needs from the GeoJSON,
+        with the distance in km whatever unit ORS was asked for.
+        The track itself is left out: serialising it again cost as much
+        memory as the parsed response.
+        """
+        metrics = route_metrics(route_data)
+        check_against_ors(route_data, metrics, distance_unit)
+        segment = route_data['features'][0]['properties'].get('segments', [{}])[0]
+        distance_km = metrics.distance_km
+        if segment.get('distance') is not None:
+            distance_km = segment['distance'] * ORS_DISTANCE_UNITS[distance_unit] / 1000
+        return {
+            'distance': round(distance_km, 3),
+            'elevation_gain': segment.get('ascent', metrics.ascent_m),
+            'metrics': metrics.to_dict()
+        }
 
-        except Exception as e:
-            logging.error(f"Error generating route: {str(e)}")
-            return None
+    def _track_metadata(self, coordinates, preferences: Dict) -> Dict:
+        """Name, description and author written into every export format"""
+        metrics = compute_metrics(coordinates)
+        return {
+            'name': f"Parcours {preferences['activity_type']} - {preferences.get('location', 'Bretagne')}",
+            'description': (
+                f"Parcours {metrics.distance_km:.1f}km - "
+                f"D+ {metrics.ascent_m:.0f}m - "
+                f"Niveau {preferences.get('level', 'Intermédiaire')} - "
+                f"Type: {preferences.get('landscape', 'Varié')}"
+            ),
+            'author_name': "Sport Outdoor Route Generator"
+        }
 
     def _convert_to_gpx(self, geojson_data: Dict, preferences: Dict) -> str:
         """Convert GeoJSON route to GPX format"""
-        gpx = gpxpy.gpx.GPX()
-
-        # Create track
-        track = gpxpy.gpx.GPXTrack()
-        gpx.tracks.append(track)
-
-        # Create segment
-        segment = gpxpy.gpx.GPXTrackSegment()
-        track.segments.append(segment)
+        coordinates = geojson_data['features'][0]['geometry']['coordinates']
+        return render_gpx(coordinates, **self._track_metadata(coordinates, preferences))
 
-        # Add points
+    def export_route(self, geojson_data: Dict, preferences: Dict,
+                     export_format: Optional[str] = None) -> RouteExport:
+        """Route as an attachment in the requested format (GPX, GPX.gz, FIT, polyline, GeoJSON)"""
         coordinates = geojson_data['features'][0]['geometry']['coordinates']
-        for coord in coordinates:
-            segment.points.append(gpxpy.gpx.GPXTrackPoint(
-                latitude=coord[1],
-                longitude=coord[0],
-                elevation=coord[2] if len(coord) > 2 else None
-            ))
-
-        # Add metadata
-        gpx.name = f"Parcours {preferences['activity_type']} - {preferences.get('location', 'Bretagne')}"
-        gpx.description = (
-            f"Parcours {preferences['distance']}km - "
-            f"Niveau {preferences.get('level', 'Intermédiaire')} - "
-            f"Type: {preferences.get('landscape', 'Varié')}"
-        )
-        gpx.author_name = "Sport Outdoor Route Generator"
-
-        return gpx.to_xml()
\ No newline at end of file
+        return export_route(coordinates, export_format,
+                            sport=preferences.get('activity_type'),
+                            **self._track_metadata(coordinates, preferences))
\ No newline at end of file
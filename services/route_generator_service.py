@@ -4,13 +4,18 @@ from services.openai_service import generate_route_description
 from services.ors_service import ORSService
 from services.gpx_service import GPXService
 from services.email_service import EmailService
+from services.lazy import LazyService
+from services.pipeline import PipelineExecutor, Stage
+from services.simplify import simplify_route
+from services.route_export import normalize_format
 import json
 
 class RouteGeneratorService:
     def __init__(self):
         self.ors_service = ORSService()
         self.gpx_service = GPXService()
-        self.email_service = EmailService()
+        # Construit au premier envoi : sans configuration SMTP, seule l'étape email échoue
+        self.email_service = LazyService(EmailService)
     
     def process_user_preferences(self, user_preferences):
         """Traitement centralisé des préférences utilisateur"""
@@ -20,30 +25,57 @@ class RouteGeneratorService:
         normalized_preferences = self._normalize_preferences(user_preferences)
         
         # 2. Géocodage de la localisation
-        coordinates = self.ors_service.geocode_location(normalized_preferences['location'])
-        logging.info(f"Coordonnées obtenues: {coordinates}")
+        def geocode(results):
+            coordinates = self.ors_service.geocode_location(normalized_preferences['location'])
+            logging.info(f"Coordonnées obtenues: {coordinates}")
+            return coordinates
         
         # 3. Génération de l'itinéraire via ORS
-        route_data = self.ors_service.generate_route(coordinates, normalized_preferences)
+        def route(results):
+            route_data = self.ors_service.generate_route(results['geocode'], normalized_preferences)
+            
+            # 4. Vérification de la distance obtenue
+            actual_distance = route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
+            logging.info(f"Distance obtenue: {actual_distance}km (demandée: {normalized_preferences['distance']}km)")
+            return route_data
+        
+        # 5. Génération de la description via OpenAI (indépendante de l'itinéraire)
+        def describe(results):
+            return json.loads(generate_route_description(normalized_preferences))
+        
+        # 6. Simplification de la trace avant export (budget de points)
+        def simplify(results):
+            simplified, _ = simplify_route(results['route'])
+            return simplified
         
-        # 4. Vérification de la distance obtenue
-        actual_distance = route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
-        logging.info(f"Distance obtenue: {actual_distance}km (demandée: {normalized_preferences['distance']}km)")
+        # 7. Création du fichier dans le format choisi (GPX par défaut)
+        def gpx(results):
+            return self.gpx_service.create_export(results['simplify'], normalized_preferences,
+                                                  normalized_preferences['export_format'])
         
-        # 5. Génération de la description via OpenAI
-        route_description_json = generate_route_description(normalized_preferences)
-        route_description = json.loads(route_description_json)
+        # 8. Envoi de l'email avec le fichier GPX
+        def email(results):
+            return self.email_service.send_gpx_email(
+                normalized_preferences['email'],
+                results['gpx'],
+                results['describe'],
+                normalized_preferences
+            )
         
-        # 6. Création du fichier GPX
-        gpx_content = self.gpx_service.create_gpx(route_data, normalized_preferences)
+        # La description s'exécute en parallèle du géocodage, du routage, de la simplification et du GPX
+        results = PipelineExecutor([
+            Stage('geocode', geocode, timeout=60),
+            Stage('route', route, depends_on=('geocode',), timeout=90),
+            # Pas de nouvelle tentative : l'appel OpenAI expiré continue et serait payé deux fois,
+            # et la description retombe déjà sur le gabarit en cas d'échec
+            Stage('describe', describe, timeout=60),
+            Stage('simplify', simplify, depends_on=('route',), timeout=30),
+            Stage('gpx', gpx, depends_on=('simplify',), timeout=30),
+            # Pas de nouvelle tentative : l'email pourrait partir deux fois (l'outbox gère les échecs SMTP)
+            Stage('email', email, depends_on=('gpx', 'describe'), timeout=60),
+        ], name='route_generator_service').run()
         
-        # 7. Envoi de l'email avec le fichier GPX
-        self.email_service.send_gpx_email(
-            normalized_preferences['email'],
-            gpx_content,
-            route_description,
-            normalized_preferences
-        )
+        actual_distance = results['route']['features'][0]['properties']['segments'][0]['distance'] / 1000
         
         return {
             'success': True,
@@ -70,5 +102,11 @@ class RouteGeneratorService:
         # Normaliser le niveau
         if normalized.get('level') not in ['beginner', 'intermediate', 'advanced']:
             normalized['level'] = 'intermediate'
+        
+        # Format d'export (GPX par défaut si inconnu)
+        try:
+            normalized['export_format'] = normalize_format(normalized.get('export_format'))
+        except ValueError:
+            normalized['export_format'] = normalize_format(None)
             
         return normalized
@@ -0,0 +1,136 @@
+import heapq
+import logging
+from dataclasses import dataclass
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from config import GPX_SIMPLIFY_ENABLED, GPX_MAX_POINTS, GPX_SIMPLIFY_TOLERANCE_M
+from services.geometry import EARTH_RADIUS_M, as_array, compute_metrics
+from services.memory import BUDGET_ACTIONS, budget_points
+
+# Metres of vertical deviation counted as one metre of horizontal deviation
+ELEVATION_WEIGHT = 1.0
+
+
+@dataclass
+class SimplificationReport:
+    original_points: int
+    kept_points: int
+    max_error_m: float         # largest distance from a dropped point to the simplified track
+    distance_delta_m: float    # simplified minus original length
+    ascent_delta_m: float      # simplified minus original raw elevation gain
+
+    def to_dict(self) -> Dict:
+        return dict(vars(self))
+
+
+def _project(points: np.ndarray) -> np.ndarray:
+    """Local metric coordinates (x east, y north, weighted z) around the track's mean latitude"""
+    lat0 = np.radians(np.nanmean(points[:, 1]))
+    x = np.radians(points[:, 0]) * np.cos(lat0) * EARTH_RADIUS_M
+    y = np.radians(points[:, 1]) * EARTH_RADIUS_M
+    z = np.nan_to_num(points[:, 2]) * ELEVATION_WEIGHT
+    return np.column_stack([x, y, z])
+
+
+def _farthest(xyz: np.ndarray, first: int, last: int) -> Tuple[float, int]:
+    """Point of (first, last) farthest from the segment first-last, and its distance"""
+    if last - first < 2:
+        return 0.0, -1
+    inner = xyz[first + 1:last]
+    start, end = xyz[first], xyz[last]
+    direction = end - start
+    length_sq = direction @ direction
+    if length_sq == 0:
+        distances = np.linalg.norm(inner - start, axis=1)
+    else:
+        t = np.clip((inner - start) @ direction / length_sq, 0, 1)
+        distances = np.linalg.norm(inner - (start + t[:, None] * direction), axis=1)
+    index = int(np.argmax(distances))
+    return float(distances[index]), first + 1 + index
+
+
+def simplify_indexes(coordinates, max_points: int = GPX_MAX_POINTS,
+                     tolerance_m: float = GPX_SIMPLIFY_TOLERANCE_M) -> Tuple[np.ndarray, float]:
+    """
+    Douglas-Peucker, most significant split first, so it can stop at a point
+    budget as well as at a tolerance. The start, end and the lowest and
+    highest points are always kept.
+
+    Returns the sorted indexes to keep and the largest error left, in metres.
+    """
+    points = as_array(coordinates)
+    count = len(points)
+    if count <= 2 or (max_points >= count and tolerance_m <= 0):
+        return np.arange(count), 0.0
+
+    xyz = _project(points)
+    keep = {0, count - 1}
+    if not np.isnan(points[:, 2]).all():
+        keep.update((int(np.nanargmin(points[:, 2])), int(np.nanargmax(points[:, 2]))))
+
+    # Max-heap of ranges between kept points, keyed by their largest deviation
+    heap: List[Tuple[float, int, int, int]] = []
+    anchors = sorted(keep)
+    for first, last in zip(anchors, anchors[1:]):
+        distance, index = _farthest(xyz, first, last)
+        if index >= 0:
+            heapq.heappush(heap, (-distance, index, first, last))
+
+    budget = max(max_points, len(keep))
+    while heap and len(keep) < budget:
+        if -heap[0][0] <= tolerance_m:
+            break
+        _, index, first, last = heapq.heappop(heap)
+        keep.add(index)
+        for a, b in ((first, index), (index, last)):
+            distance, split = _farthest(xyz, a, b)
+            if split >= 0:
+                heapq.heappush(heap, (-distance, split, a, b))
+
+    max_error = -heap[0][0] if heap else 0.0
+    return np.array(sorted(keep)), max_error
+
+
+def simplify_route(route_data: Dict, max_points: int = GPX_MAX_POINTS,
+                   tolerance_m: float = GPX_SIMPLIFY_TOLERANCE_M) -> Tuple[Dict, SimplificationReport]:
+    """
+    Copy of an ORS GeoJSON response with a simplified first feature geometry.
+    Properties (ORS distance, ascent, segments) are kept as they were.
+
+    Tracks longer than the memory budget allows (MEMORY_BUDGET_MB) are
+    simplified down to it even when GPX_SIMPLIFY_ENABLED is off.
+    """
+    feature = route_data['features'][0]
+    coordinates = feature['geometry']['coordinates']
+    limit = budget_points()
+    over_budget = limit is not None and len(coordinates) > limit
+    if not GPX_SIMPLIFY_ENABLED and not over_budget:
+        count = len(coordinates)
+        return route_data, SimplificationReport(count, count, 0.0, 0.0, 0.0)
+    if over_budget:
+        BUDGET_ACTIONS.inc(action='simplified')
+        logging.warning(f"Track of {len(coordinates)} points exceeds the memory budget, "
+                        f"keeping at most {limit}")
+        max_points = min(max_points, limit) if GPX_SIMPLIFY_ENABLED else limit
+
+    indexes, max_error = simplify_indexes(coordinates, max_points, tolerance_m)
+    simplified = [coordinates[i] for i in indexes]
+
+    # Raw gain: the smoothing window is sized from point spacing, which simplification changes
+    before = compute_metrics(coordinates, smoothing_window_m=0)
+    after = compute_metrics(simplified, smoothing_window_m=0)
+    report = SimplificationReport(
+        original_points=len(coordinates),
+        kept_points=len(simplified),
+        max_error_m=round(max_error, 2),
+        distance_delta_m=round(after.distance_m - before.distance_m, 1),
+        ascent_delta_m=round(after.ascent_m - before.ascent_m, 1)
+    )
+    logging.info(f"Track simplified from {report.original_points} to {report.kept_points} points "
+                 f"(max error {report.max_error_m}m, distance {report.distance_delta_m:+}m, "
+                 f"ascent {report.ascent_delta_m:+}m)")
+
+    simplified_feature = {**feature, 'geometry': {**feature['geometry'], 'coordinates': simplified}}
+    return {**route_data, 'features': [simplified_feature] + route_data['features'][1:]}, report
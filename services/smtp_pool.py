@@ -0,0 +1,196 @@
+import logging
+import queue
+import smtplib
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import (SMTP_POOL_SIZE, SMTP_MAX_MESSAGES_PER_CONNECTION, SMTP_HEALTH_CHECK_AFTER,
+                    SMTP_MAX_IDLE, SMTP_TIMEOUT)
+
+# Errors after which a session is discarded and the send retried on a new one
+CONNECTION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, OSError)
+# 421: the server is closing the session (too many messages, idle timeout...)
+SERVICE_CLOSING = 421
+
+
+class SMTPSession:
+    """One authenticated SMTP connection and its usage counters"""
+
+    def __init__(self, smtp: smtplib.SMTP):
+        self.smtp = smtp
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.messages = 0
+
+    def idle_for(self) -> float:
+        return time.monotonic() - self.last_used
+
+    def close(self):
+        try:
+            self.smtp.quit()
+        except Exception:
+            self.smtp.close()
+
+
+class SMTPPool:
+    """
+    A few authenticated SMTP sessions reused across emails, so a send is one
+    MAIL/RCPT/DATA transaction instead of connect, EHLO, STARTTLS, EHLO and
+    AUTH every time.
+
+    At most `size` sessions are open at once; senders beyond that wait for
+    one to be returned. A session idle for more than health_check_after is
+    checked with NOOP before use, one idle for more than max_idle is simply
+    replaced, and each session is closed after max_messages so the server
+    never has to cut it. A send that fails because the session died (server
+    disconnect, 421) is retried once on a fresh session.
+    """
+
+    def __init__(self, host: str, port: int, username: str, password: str,
+                 starttls: bool = True,
+                 size: int = SMTP_POOL_SIZE,
+                 max_messages: int = SMTP_MAX_MESSAGES_PER_CONNECTION,
+                 health_check_after: float = SMTP_HEALTH_CHECK_AFTER,
+                 max_idle: float = SMTP_MAX_IDLE,
+                 timeout: float = SMTP_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.size = max(1, size)
+        self.max_messages = max_messages
+        self.health_check_after = health_check_after
+        self.max_idle = max_idle
+        self.timeout = timeout
+        self._idle: "queue.LifoQueue[SMTPSession]" = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._lock = threading.Lock()
+        self._stats = {'connections_opened': 0, 'messages_sent': 0, 'reconnects': 0,
+                       'health_check_failures': 0, 'recycled': 0}
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _connect(self) -> SMTPSession:
+        smtp = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        try:
+            if self.starttls:
+                smtp.starttls()
+            smtp.login(self.username, self.password)
+        except Exception:
+            smtp.close()
+            raise
+        self._count('connections_opened')
+        logging.debug(f"Opened SMTP session to {self.host}:{self.port}")
+        return SMTPSession(smtp)
+
+    def _healthy(self, session: SMTPSession) -> bool:
+        idle = session.idle_for()
+        if idle > self.max_idle:
+            return False
+        if idle > self.health_check_after:
+            try:
+                code, _ = session.smtp.noop()
+            except CONNECTION_ERRORS + (smtplib.SMTPException,):
+                code = None
+            if code != 250:
+                self._count('health_check_failures')
+                return False
+        return True
+
+    def _checkout(self) -> SMTPSession:
+        """An idle healthy session, or a new one"""
+        while True:
+            try:
+                session = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if self._healthy(session):
+                return session
+            session.smtp.close()
+
+    def _checkin(self, session: SMTPSession):
+        session.last_used = time.monotonic()
+        if self.max_messages and session.messages >= self.max_messages:
+            self._count('recycled')
+            session.close()
+        else:
+            self._idle.put(session)
+
+    @staticmethod
+    def _connection_lost(error: Exception) -> bool:
+        if isinstance(error, smtplib.SMTPResponseException):
+            return error.smtp_code == SERVICE_CLOSING
+        return isinstance(error, CONNECTION_ERRORS)
+
+    def _send(self, transaction: Callable[[smtplib.SMTP], Any], timeout: Optional[float]):
+        if not self._slots.acquire(timeout=timeout if timeout is not None else self.timeout):
+            raise smtplib.SMTPException("No SMTP session available")
+        try:
+            session = self._checkout()
+            try:
+                result = transaction(session.smtp)
+            except Exception as e:
+                if not self._connection_lost(e):
+                    # Refused sender, recipient or data: smtplib has reset the session
+                    if isinstance(e, smtplib.SMTPException):
+                        self._checkin(session)
+                    else:
+                        session.smtp.close()
+                    raise
+                # The message was not accepted: send it again on a fresh session
+                session.smtp.close()
+                logging.info(f"SMTP session lost ({e}), reconnecting")
+                self._count('reconnects')
+                session = self._connect()
+                try:
+                    result = transaction(session.smtp)
+                except Exception:
+                    session.smtp.close()
+                    raise
+            session.messages += 1
+            self._count('messages_sent')
+            self._checkin(session)
+            return result
+        finally:
+            self._slots.release()
+
+    def send_message(self, msg, timeout: Optional[float] = None):
+        """Send an email.message.Message on a pooled session"""
+        return self._send(lambda smtp: smtp.send_message(msg), timeout)
+
+    def sendmail(self, from_addr: str, to_addrs: List[str], payload: bytes,
+                 timeout: Optional[float] = None):
+        """Send an already serialised message (as stored by the outbox)"""
+        return self._send(lambda smtp: smtp.sendmail(from_addr, to_addrs, payload), timeout)
+
+    def close(self):
+        """Quit every idle session"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {**self._stats, 'idle': self._idle.qsize(), 'size': self.size}
+
+
+_pools: Dict[Tuple, SMTPPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_smtp_pool(host: str, port: int, username: str, password: str,
+                  starttls: bool = True) -> SMTPPool:
+    """Shared pool per server and account, used by every EmailService instance"""
+    key = (host, port, username, password, starttls)
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = SMTPPool(host, port, username, password, starttls)
+            _pools[key] = pool
+        return pool
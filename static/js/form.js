@@ -1,7 +1,92 @@
+const STAGE_LABELS = {
+    queued: 'Waiting for a free worker...',
+    started: 'Starting...',
+    geocoding: 'Locating your starting point...',
+    routing: 'Computing your route...',
+    simplifying: 'Optimising your track...',
+    gpx: 'Building your GPX file...',
+    describing: 'Writing your route description...',
+    emailing: 'Sending your route by email...'
+};
+
+const POLL_INTERVAL_MS = 1000;
+const EXPORT_FORMAT_KEY = 'preferredExportFormat';
+
+// Remember the export format between visits
+const exportFormatSelect = document.getElementById('export_format');
+const savedExportFormat = localStorage.getItem(EXPORT_FORMAT_KEY);
+if (savedExportFormat && exportFormatSelect.querySelector(`option[value="${savedExportFormat}"]`)) {
+    exportFormatSelect.value = savedExportFormat;
+}
+exportFormatSelect.addEventListener('change', () => {
+    localStorage.setItem(EXPORT_FORMAT_KEY, exportFormatSelect.value);
+});
+
+// Follow the job's Server-Sent Events: stage updates, then the description as it is written
+function streamJob(eventsUrl, statusMessage, descriptionPreview) {
+    return new Promise((resolve, reject) => {
+        const source = new EventSource(eventsUrl);
+        let described = false;
+
+        const on = (name, handler) => source.addEventListener(name, (event) => handler(JSON.parse(event.data)));
+
+        on('stage', (data) => {
+            statusMessage.textContent = `${STAGE_LABELS[data.stage] || 'Generating your route...'} (${data.progress}%)`;
+        });
+        on('token', (data) => {
+            // Tokens arriving after the final text (deadline fallback) are ignored
+            if (described) return;
+            descriptionPreview.style.display = 'block';
+            descriptionPreview.textContent += data.text;
+        });
+        on('described', (data) => {
+            described = true;
+            descriptionPreview.style.display = 'block';
+            descriptionPreview.textContent = data.text;
+        });
+        on('done', (result) => {
+            source.close();
+            resolve(result);
+        });
+        source.addEventListener('error', (event) => {
+            // A server-sent error event carries data; a dropped connection does not and
+            // EventSource reconnects by itself with Last-Event-ID
+            if (event.data) {
+                source.close();
+                reject(new Error(JSON.parse(event.data).error || 'Failed to generate route'));
+            } else if (source.readyState === EventSource.CLOSED) {
+                reject(new Error('Lost connection to the server'));
+            }
+        });
+    });
+}
+
+// Poll the job status endpoint until the job succeeds or fails
+async function pollJob(statusUrl, statusMessage) {
+    while (true) {
+        const response = await fetch(statusUrl);
+        const job = await response.json();
+
+        if (!response.ok) {
+            throw new Error(job.error || 'Failed to retrieve route status');
+        }
+        if (job.status === 'succeeded') {
+            return job.result;
+        }
+        if (job.status === 'failed') {
+            throw new Error(job.error || 'Failed to generate route');
+        }
+
+        statusMessage.textContent = `${STAGE_LABELS[job.stage] || 'Generating your route...'} (${job.progress}%)`;
+        await new Promise(resolve => setTimeout(resolve, POLL_INTERVAL_MS));
+    }
+}
+
 document.getElementById('routeForm').addEventListener('submit', async (e) => {
     e.preventDefault();
 
     const statusMessage = document.getElementById('statusMessage');
+    const descriptionPreview = document.getElementById('descriptionPreview');
     const submitButton = e.target.querySelector('button[type="submit"]');
 
     // Collect form data
@@ -16,6 +101,7 @@ document.getElementById('routeForm').addEventListener('submit', async (e) => {
         duration: document.getElementById('duration').value,
         surface_type: document.getElementById('surface_type').value,
         points_of_interest: document.getElementById('points_of_interest').value,
+        export_format: exportFormatSelect.value,
         email: document.getElementById('email').value
     };
 
@@ -27,8 +113,10 @@ document.getElementById('routeForm').addEventListener('submit', async (e) => {
         statusMessage.className = 'alert alert-info mt-3';
         statusMessage.style.display = 'block';
         statusMessage.textContent = 'Generating your route...';
+        descriptionPreview.style.display = 'none';
+        descriptionPreview.textContent = '';
 
-        const response = await fetch('/generate-route', {
+        const response = await fetch('/generate-route?async=1', {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
@@ -38,12 +126,18 @@ document.getElementById('routeForm').addEventListener('submit', async (e) => {
 
         const data = await response.json();
 
-        if (response.ok) {
-            statusMessage.className = 'alert alert-success mt-3';
-            statusMessage.textContent = 'Route generated successfully! Check your email.';
-        } else {
+        if (!response.ok) {
             throw new Error(data.error || 'Failed to generate route');
         }
+
+        if (window.EventSource && data.events_url) {
+            await streamJob(data.events_url, statusMessage, descriptionPreview);
+        } else {
+            await pollJob(data.status_url, statusMessage);
+        }
+
+        statusMessage.className = 'alert alert-success mt-3';
+        statusMessage.textContent = 'Route generated successfully! Check your email.';
     } catch (error) {
         statusMessage.className = 'alert alert-danger mt-3';
         statusMessage.textContent = error.message;
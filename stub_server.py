@@ -0,0 +1,582 @@
+"""
+Local stand-in for the external APIs used by the route pipeline.
+
+Serves the OpenRouteService, Nominatim and OpenAI endpoints we call, with
+synthetic but plausible data (routes with elevation, geocoding from the
+offline gazetteer) and configurable latency and error rates, so the whole
+pipeline can be load-tested without network access or API quota.
+
+    python stub_server.py --port 8090
+
+then point the app at it:
+
+    ORS_BASE_URL=http://127.0.0.1:8090/v2
+    NOMINATIM_BASE_URL=http://127.0.0.1:8090/nominatim
+    OPENAI_BASE_URL=http://127.0.0.1:8090/v1
+
+With --smtp-port, an SMTP sink that accepts and keeps every message is
+started as well (SMTP_SERVER / SMTP_PORT, with SMTP_STARTTLS=false).
+"""
+import argparse
+import json
+import math
+import random
+import socketserver
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Tuple
+
+from flask import Flask, Response, jsonify, request
+from werkzeug.serving import make_server
+
+EARTH_RADIUS_M = 6371000
+POINT_SPACING_M = 15
+
+# Typical speeds used by ORS for duration estimates, in m/s
+PROFILE_SPEEDS = {
+    'foot-walking': 1.39,
+    'foot-hiking': 1.25,
+    'cycling-regular': 4.2,
+    'cycling-mountain': 3.5,
+}
+
+
+@dataclass
+class EndpointProfile:
+    """Latency (log-normal, from median and p95) and error injection for one endpoint"""
+    median_ms: float
+    p95_ms: float
+    error_rate: float = 0.0
+    error_codes: Tuple[int, ...] = (429, 503)
+
+    def sample_latency(self, rng: random.Random, scale: float) -> float:
+        if scale <= 0 or self.median_ms <= 0:
+            return 0.0
+        sigma = math.log(max(self.p95_ms, self.median_ms) / self.median_ms) / 1.645
+        return scale * rng.lognormvariate(math.log(self.median_ms), sigma) / 1000
+
+
+DEFAULT_PROFILES = {
+    'ors_geocode': EndpointProfile(median_ms=120, p95_ms=400),
+    'ors_directions': EndpointProfile(median_ms=700, p95_ms=2000),
+    'nominatim': EndpointProfile(median_ms=250, p95_ms=800),
+    'openai': EndpointProfile(median_ms=1500, p95_ms=4000),
+}
+
+
+@dataclass
+class StubConfig:
+    latency_scale: float = 1.0
+    error_rate: Optional[float] = None  # overrides every endpoint when set
+    error_codes: Optional[Tuple[int, ...]] = None
+    quota_per_minute: Optional[int] = None  # ORS quota advertised in x-ratelimit-* headers
+    tokens_per_second: float = 60.0  # OpenAI streaming speed
+    seed: Optional[int] = None
+    profiles: Dict[str, EndpointProfile] = field(
+        default_factory=lambda: {name: EndpointProfile(**vars(p)) for name, p in DEFAULT_PROFILES.items()}
+    )
+
+    def __post_init__(self):
+        for profile in self.profiles.values():
+            if self.error_rate is not None:
+                profile.error_rate = self.error_rate
+            if self.error_codes:
+                profile.error_codes = tuple(self.error_codes)
+
+
+def haversine(lon1, lat1, lon2, lat2) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lon2 - lon1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+
+def terrain_elevation(lon: float, lat: float) -> float:
+    """Smooth, deterministic relief: a few rolling hills of up to ~150m"""
+    elevation = (70
+                 + 45 * math.sin(lat * 157) * math.cos(lon * 113)
+                 + 20 * math.sin(lat * 431 + lon * 297)
+                 + 6 * math.sin(lat * 1800) * math.cos(lon * 1300))
+    return round(max(0.0, elevation), 1)
+
+
+def _offset(lon, lat, distance_m, bearing):
+    """Point at distance_m along bearing (radians), flat-earth approximation"""
+    dlat = distance_m * math.cos(bearing) / 111320
+    dlon = distance_m * math.sin(bearing) / (111320 * math.cos(math.radians(lat)))
+    return lon + dlon, lat + dlat
+
+
+def _path_length(coords) -> float:
+    return sum(haversine(a[0], a[1], b[0], b[1]) for a, b in zip(coords, coords[1:]))
+
+
+def synthetic_loop(start, length_m, points, rng):
+    """Closed wobbly loop through start whose length is close to (but not exactly) length_m"""
+    actual_m = length_m * rng.uniform(0.85, 1.25)
+    radius = actual_m / (2 * math.pi)
+    heading = rng.uniform(0, 2 * math.pi)
+    centre = _offset(start[0], start[1], radius, heading)
+    lobes = max(2, points)
+    phase = rng.uniform(0, 2 * math.pi)
+    count = max(16, int(actual_m / POINT_SPACING_M))
+
+    coords = []
+    for i in range(count + 1):
+        theta = heading + math.pi + 2 * math.pi * i / count
+        r = radius * (1 + 0.2 * math.sin(lobes * theta + phase) * math.sin(math.pi * i / count))
+        coords.append(_offset(centre[0], centre[1], r, theta))
+    coords[0] = coords[-1] = (start[0], start[1])
+
+    # Rescale around the start so the drawn length matches the target
+    scale = actual_m / max(_path_length(coords), 1)
+    return [(start[0] + (lon - start[0]) * scale, start[1] + (lat - start[1]) * scale)
+            for lon, lat in coords]
+
+
+def synthetic_path(waypoints, rng):
+    """Road-like path through the waypoints: sinuous legs about 1.2-1.5x the straight line"""
+    coords = [tuple(waypoints[0][:2])]
+    for a, b in zip(waypoints, waypoints[1:]):
+        straight = haversine(a[0], a[1], b[0], b[1])
+        count = max(2, int(straight * 1.3 / POINT_SPACING_M))
+        waves = rng.randint(2, 6)
+        amplitude = straight * rng.uniform(0.05, 0.1)
+        bearing = math.atan2((b[0] - a[0]) * math.cos(math.radians(a[1])), b[1] - a[1])
+        for i in range(1, count + 1):
+            t = i / count
+            lon = a[0] + (b[0] - a[0]) * t
+            lat = a[1] + (b[1] - a[1]) * t
+            deviation = amplitude * math.sin(waves * math.pi * t)
+            coords.append(_offset(lon, lat, deviation, bearing + math.pi / 2))
+    return coords
+
+
+def build_route_geojson(coords, profile, query):
+    """ORS-shaped GeoJSON response (segments with distance, ascent and steps)"""
+    # ORS reports distances in the requested "units" (metres by default); elevations stay in metres
+    unit = {'km': 1000.0, 'mi': 1609.344}.get((query or {}).get('units'), 1.0)
+    coords3d = [[round(lon, 6), round(lat, 6), terrain_elevation(lon, lat)] for lon, lat in coords]
+    distance = _path_length(coords)
+    duration = distance / PROFILE_SPEEDS.get(profile, 1.3)
+    diffs = [b[2] - a[2] for a, b in zip(coords3d, coords3d[1:])]
+    ascent = sum(d for d in diffs if d > 0)
+    descent = -sum(d for d in diffs if d < 0)
+
+    # One instruction roughly every 500m, like a rural footpath network
+    steps = []
+    last = len(coords3d) - 1
+    stride = max(1, int(500 / POINT_SPACING_M))
+    for index, start_index in enumerate(range(0, last, stride)):
+        end_index = min(last, start_index + stride)
+        step_distance = _path_length(coords[start_index:end_index + 1])
+        steps.append({
+            'distance': round(step_distance / unit, 3),
+            'duration': round(step_distance / PROFILE_SPEEDS.get(profile, 1.3), 1),
+            'type': 11 if index == 0 else (0, 1, 5, 6, 12, 13)[index % 6],
+            'instruction': 'Head north' if index == 0 else 'Continue on path',
+            'name': '-',
+            'way_points': [start_index, end_index]
+        })
+    steps.append({'distance': 0.0, 'duration': 0.0, 'type': 10, 'instruction': 'Arrive',
+                  'name': '-', 'way_points': [last, last]})
+
+    lons = [c[0] for c in coords3d]
+    lats = [c[1] for c in coords3d]
+    eles = [c[2] for c in coords3d]
+    return {
+        'type': 'FeatureCollection',
+        'bbox': [min(lons), min(lats), min(eles), max(lons), max(lats), max(eles)],
+        'features': [{
+            'bbox': [min(lons), min(lats), min(eles), max(lons), max(lats), max(eles)],
+            'type': 'Feature',
+            'properties': {
+                'ascent': round(ascent, 1),
+                'descent': round(descent, 1),
+                'segments': [{
+                    'distance': round(distance / unit, 3),
+                    'duration': round(duration, 1),
+                    'steps': steps,
+                    'ascent': round(ascent, 1),
+                    'descent': round(descent, 1)
+                }],
+                'summary': {'distance': round(distance / unit, 3), 'duration': round(duration, 1)},
+                'way_points': [0, last]
+            },
+            'geometry': {'coordinates': coords3d, 'type': 'LineString'}
+        }],
+        'metadata': {
+            'attribution': 'openrouteservice.org stand-in',
+            'service': 'routing',
+            'timestamp': int(time.time() * 1000),
+            'query': query,
+            'engine': {'version': 'stub'}
+        }
+    }
+
+
+def _resolve_place(text):
+    # Imported lazily: config must not be loaded before callers point it at this server
+    from services.gazetteer import get_gazetteer
+    return get_gazetteer().resolve(text)
+
+
+def synthetic_description(prompt: str) -> str:
+    """French placeholder text, a few paragraphs long like a real completion"""
+    rng = random.Random(zlib.crc32(prompt.encode()))
+    openings = ["Au départ du bourg", "Dès les premiers pas", "Quittant le centre",
+                "Depuis la place de l'église"]
+    middles = ["le sentier longe un ruisseau bordé de chênes",
+               "le chemin creux serpente entre les talus et les landes",
+               "la piste s'élève doucement vers un point de vue dégagé",
+               "l'itinéraire traverse un hameau aux maisons de granit"]
+    endings = ["avant de revenir tranquillement au point de départ.",
+               "pour une fin de parcours ombragée et agréable.",
+               "où une pause s'impose avant le retour."]
+    paragraphs = []
+    for _ in range(3):
+        paragraphs.append(f"{rng.choice(openings)}, {rng.choice(middles)}, puis {rng.choice(middles)}, "
+                          f"{rng.choice(endings)}")
+    return "\n\n".join(paragraphs)
+
+
+def create_app(config: Optional[StubConfig] = None) -> Flask:
+    config = config or StubConfig()
+    app = Flask(__name__)
+    rng = random.Random(config.seed)
+    rng_lock = threading.Lock()
+    quota = {'window_start': time.time(), 'used': 0}
+
+    def simulate(endpoint, ors=False):
+        """Sleep for the sampled latency; return an error response or None"""
+        profile = config.profiles[endpoint]
+        with rng_lock:
+            latency = profile.sample_latency(rng, config.latency_scale)
+            failed = rng.random() < profile.error_rate
+            code = rng.choice(profile.error_codes) if failed else None
+        time.sleep(latency)
+
+        headers = {}
+        if ors and config.quota_per_minute:
+            with rng_lock:
+                now = time.time()
+                if now - quota['window_start'] >= 60:
+                    quota.update(window_start=now, used=0)
+                quota['used'] += 1
+                remaining = max(0, config.quota_per_minute - quota['used'])
+                headers = {
+                    'x-ratelimit-limit': str(config.quota_per_minute),
+                    'x-ratelimit-remaining': str(remaining),
+                    'x-ratelimit-reset': str(int(quota['window_start'] + 60))
+                }
+                if quota['used'] > config.quota_per_minute:
+                    code = 429
+        if code is None:
+            return None, headers
+        if code == 429:
+            headers['Retry-After'] = '1'
+        error = jsonify({'error': {'code': code, 'message': 'Simulated upstream error'}})
+        error.status_code = code
+        error.headers.update(headers)
+        return error, headers
+
+    def seeded_rng(*parts):
+        return random.Random(zlib.crc32(json.dumps(parts, sort_keys=True).encode()))
+
+    @app.route('/v2/geocode/search')
+    def ors_geocode():
+        error, headers = simulate('ors_geocode', ors=True)
+        if error is not None:
+            return error
+        text = request.args.get('text', '')
+        place = _resolve_place(text)
+        features = []
+        if place:
+            features.append({
+                'type': 'Feature',
+                'geometry': {'type': 'Point', 'coordinates': [place.longitude, place.latitude]},
+                'properties': {'name': place.name, 'region': 'Bretagne', 'country': 'France',
+                               'layer': 'locality', 'confidence': 1}
+            })
+        response = jsonify({'type': 'FeatureCollection', 'features': features,
+                            'geocoding': {'query': dict(request.args)}})
+        response.headers.update(headers)
+        return response
+
+    @app.route('/v2/directions/<profile>/geojson', methods=['POST'])
+    def ors_directions(profile):
+        error, headers = simulate('ors_directions', ors=True)
+        if error is not None:
+            return error
+        body = request.get_json(silent=True) or {}
+        coordinates = body.get('coordinates') or []
+        if not coordinates:
+            return jsonify({'error': {'code': 2003, 'message': "Parameter 'coordinates' is missing"}}), 400
+
+        round_trip = (body.get('options') or {}).get('round_trip')
+        if round_trip:
+            rng_route = seeded_rng(coordinates[0], round_trip)
+            coords = synthetic_loop(coordinates[0], float(round_trip.get('length', 5000)),
+                                    int(round_trip.get('points', 3)), rng_route)
+        elif len(coordinates) >= 2:
+            coords = synthetic_path(coordinates, seeded_rng(coordinates))
+        else:
+            return jsonify({'error': {'code': 2004, 'message': 'At least two coordinates are required'}}), 400
+
+        response = Response(json.dumps(build_route_geojson(coords, profile, body)),
+                            mimetype='application/geo+json')
+        response.headers.update(headers)
+        return response
+
+    @app.route('/nominatim/search')
+    def nominatim_search():
+        error, _ = simulate('nominatim')
+        if error is not None:
+            return error
+        query = request.args.get('q', '')
+        place = _resolve_place(query)
+        if not place:
+            return jsonify([])
+        return jsonify([{
+            'place_id': zlib.crc32(place.name.encode()),
+            'lat': str(place.latitude),
+            'lon': str(place.longitude),
+            'display_name': f"{place.name}, Bretagne, France",
+            'class': 'boundary',
+            'type': 'administrative',
+            'importance': 0.6
+        }])
+
+    @app.route('/v1/chat/completions', methods=['POST'])
+    def chat_completions():
+        error, _ = simulate('openai')
+        if error is not None:
+            return error
+        body = request.get_json(silent=True) or {}
+        prompt = "\n".join(str(m.get('content', '')) for m in body.get('messages', []))
+        content = synthetic_description(prompt)
+        if (body.get('response_format') or {}).get('type') == 'json_object':
+            paragraphs = content.split("\n\n")
+            content = json.dumps({
+                'title': 'Parcours synthétique',
+                'description': content,
+                'highlights': paragraphs,
+                'difficulty_notes': 'Dénivelé modéré, accessible à tous les niveaux.',
+                'verification': {'distance_match': True, 'duration_match': True, 'route_type_match': True,
+                                 'surface_match': True, 'elevation_match': True}
+            }, ensure_ascii=False)
+        completion_id = f"chatcmpl-stub{zlib.crc32(prompt.encode())}"
+        created = int(time.time())
+        model = body.get('model', 'gpt-4o')
+        usage = {'prompt_tokens': len(prompt.split()), 'completion_tokens': len(content.split()),
+                 'total_tokens': len(prompt.split()) + len(content.split())}
+
+        if not body.get('stream'):
+            return jsonify({
+                'id': completion_id, 'object': 'chat.completion', 'created': created, 'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': content},
+                             'finish_reason': 'stop'}],
+                'usage': usage
+            })
+
+        def chunk(delta, finish_reason=None):
+            return "data: " + json.dumps({
+                'id': completion_id, 'object': 'chat.completion.chunk', 'created': created,
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}]
+            }) + "\n\n"
+
+        def stream():
+            yield chunk({'role': 'assistant', 'content': ''})
+            words = content.split(' ')
+            for index, word in enumerate(words):
+                if config.latency_scale > 0 and config.tokens_per_second > 0:
+                    time.sleep(config.latency_scale / config.tokens_per_second)
+                yield chunk({'content': word if index == 0 else ' ' + word})
+            yield chunk({}, 'stop')
+            yield "data: [DONE]\n\n"
+
+        return Response(stream(), mimetype='text/event-stream')
+
+    return app
+
+
+class StubServer:
+    """Run the stand-in in a background thread (for benchmarks and tests)"""
+
+    def __init__(self, config: Optional[StubConfig] = None, host='127.0.0.1', port=0):
+        self.server = make_server(host, port, create_app(config), threaded=True)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.server.host}:{self.server.port}"
+
+    def environment(self) -> Dict[str, str]:
+        """Environment variables that point the app at this server"""
+        return {
+            'ORS_BASE_URL': f"{self.base_url}/v2",
+            'NOMINATIM_BASE_URL': f"{self.base_url}/nominatim",
+            'OPENAI_BASE_URL': f"{self.base_url}/v1",
+        }
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+
+
+class _SMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO, AUTH, MAIL, RCPT, DATA, NOOP, RSET, QUIT"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def readline(self):
+        return self.rfile.readline().decode('utf-8', 'replace').rstrip("\r\n")
+
+    def handle(self):
+        sink = self.server.sink
+        with sink.lock:
+            sink.connections += 1
+        if sink.handshake_latency:
+            time.sleep(sink.handshake_latency)  # TCP + TLS setup on a real server
+        self.reply("220 stub ESMTP ready")
+        envelope = {'from': None, 'to': []}
+        delivered = 0
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            command = line.split(' ', 1)[0].upper()
+            argument = line[len(command) + 1:]
+
+            if command == 'EHLO':
+                self.reply("250-stub")
+                self.reply("250-AUTH PLAIN LOGIN")
+                self.reply("250 SIZE 35882577")
+            elif command == 'HELO':
+                self.reply("250 stub")
+            elif command == 'AUTH':
+                parts = argument.split()
+                if parts and parts[0].upper() == 'LOGIN':
+                    self.reply("334 VXNlcm5hbWU6")
+                    self.readline()
+                    self.reply("334 UGFzc3dvcmQ6")
+                    self.readline()
+                elif len(parts) == 1:
+                    self.reply("334 ")
+                    self.readline()
+                if sink.handshake_latency:
+                    time.sleep(sink.handshake_latency)
+                self.reply("235 Authentication successful")
+            elif command == 'MAIL':
+                if sink.max_messages_per_connection and delivered >= sink.max_messages_per_connection:
+                    self.reply("421 Too many messages on this connection")
+                    return
+                envelope = {'from': argument, 'to': []}
+                self.reply("250 OK")
+            elif command == 'RCPT':
+                envelope['to'].append(argument)
+                self.reply("250 OK")
+            elif command == 'DATA':
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if not data_line or data_line.rstrip(b"\r\n") == b".":
+                        break
+                    lines.append(data_line[1:] if data_line.startswith(b"..") else data_line)
+                if sink.latency:
+                    time.sleep(sink.latency)
+                with sink.lock:
+                    sink.messages.append({**envelope, 'data': b"".join(lines)})
+                delivered += 1
+                self.reply("250 OK: queued")
+            elif command in ('NOOP', 'RSET'):
+                self.reply("250 OK")
+            elif command == 'STARTTLS':
+                self.reply("454 TLS not available")
+            elif command == 'QUIT':
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SMTPSink:
+    """
+    Local SMTP server that accepts every message and keeps it in memory.
+
+    latency delays each DATA, handshake_latency the greeting and AUTH (what
+    TLS and login cost against Gmail), and max_messages_per_connection makes
+    the server drop a session with 421 like Gmail does.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0, latency: float = 0.0,
+                 handshake_latency: float = 0.0, max_messages_per_connection: int = 0):
+        self.messages: List[Dict] = []
+        self.connections = 0
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.handshake_latency = handshake_latency
+        self.max_messages_per_connection = max_messages_per_connection
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self.server = socketserver.ThreadingTCPServer((host, port), _SMTPHandler)
+        self.server.daemon_threads = True
+        self.server.sink = self
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def environment(self) -> Dict[str, str]:
+        host, port = self.server.server_address[:2]
+        return {'SMTP_SERVER': host, 'SMTP_PORT': str(port), 'SMTP_STARTTLS': 'false'}
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-scale', type=float, default=1.0,
+                        help='multiply the default latencies (0 disables them)')
+    parser.add_argument('--error-rate', type=float, default=None,
+                        help='probability of an injected error on every endpoint')
+    parser.add_argument('--error-codes', default=None,
+                        help='comma-separated status codes for injected errors (default 429,503)')
+    parser.add_argument('--quota-per-minute', type=int, default=None,
+                        help='advertise and enforce an ORS per-minute quota')
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--smtp-port', type=int, default=None,
+                        help='also start an SMTP sink on this port')
+    args = parser.parse_args()
+
+    config = StubConfig(
+        latency_scale=args.latency_scale,
+        error_rate=args.error_rate,
+        error_codes=tuple(int(code) for code in args.error_codes.split(',')) if args.error_codes else None,
+        quota_per_minute=args.quota_per_minute,
+        seed=args.seed
+    )
+    server = StubServer(config, host=args.host, port=args.port)
+    environment = server.environment()
+    if args.smtp_port is not None:
+        environment.update(SMTPSink(host=args.host, port=args.smtp_port).start().environment())
+    for name, value in environment.items():
+        print(f"export {name}={value}")
+    server.server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import sys
+sys.path.append('.')
+
+import json
+import threading
+import time
+
+from services.description_cache import DescriptionCache, cached_description, description_cache_key
+from services.openai_service import _fallback_route_description
+
+INPUTS = {'location': 'Saint-Malo', 'activity_type': 'hiking', 'level': 'beginner',
+          'landscape': 'coastal', 'distance': '10'}
+
+
+def test_key_normalizes_inputs():
+    same = dict(INPUTS, location='st malo ', activity_type='Hiking', distance=10.2)
+    assert description_cache_key('ns', INPUTS) == description_cache_key('ns', same)
+    assert description_cache_key('ns', INPUTS) != description_cache_key('ns', dict(INPUTS, distance='12'))
+    assert description_cache_key('ns', INPUTS) != description_cache_key('other', INPUTS)
+
+
+def test_variants_and_ttl(tmp_path):
+    cache = DescriptionCache(str(tmp_path / 'descriptions.sqlite3'), max_variants=2, ttl_seconds=3600)
+    cache.put('key', 'first')
+    assert cache.get('key') is None  # still collecting variants
+    cache.put('key', 'second')
+    cache.put('key', 'third')
+    assert {cache.get('key') for _ in range(30)} == {'second', 'third'}
+
+    cache.ttl_seconds = 0
+    time.sleep(0.01)
+    assert cache.get('key') is None
+
+
+def test_deadline_falls_back_and_late_result_is_cached(tmp_path):
+    cache = DescriptionCache(str(tmp_path / 'descriptions.sqlite3'), max_variants=1)
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return "Texte généré"
+
+    start = time.monotonic()
+    result = cached_description('ns', INPUTS, slow, lambda: "Gabarit", deadline=0.05, cache=cache)
+    assert result == "Gabarit" and time.monotonic() - start < 1
+    release.set()
+
+    deadline = time.monotonic() + 5
+    while cache.get(description_cache_key('ns', INPUTS)) is None and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cached_description('ns', INPUTS, lambda: 1 / 0, lambda: "Gabarit", cache=cache) == "Texte généré"
+    assert cached_description('ns', dict(INPUTS, level='advanced'), lambda: 1 / 0, lambda: "Gabarit",
+                              cache=cache) == "Gabarit"
+
+
+def test_route_description_fallback_format():
+    preferences = dict(INPUTS, route_type='loop', elevation_preference='flat', surface_type='dirt',
+                       points_of_interest='panoramic')
+    description = json.loads(_fallback_route_description(preferences, '2 heures ou plus'))
+    assert set(description) == {'title', 'description', 'highlights', 'difficulty_notes', 'verification'}
+    assert 'Saint-Malo' in description['title'] and len(description['highlights']) == 3
+
+
+def test_started_stream_is_not_replaced_by_the_template(tmp_path):
+    cache = DescriptionCache(str(tmp_path / 'descriptions.sqlite3'), max_variants=1)
+    first_token = threading.Event()
+    sent = []
+
+    def slow_stream():
+        for word in ("Une ", "balade ", "lente"):
+            first_token.set()
+            sent.append(word)
+            time.sleep(0.05)
+        return ''.join(sent)
+
+    # Le flux dure bien plus que l'échéance, mais son premier token arrive avant
+    result = cached_description('ns', INPUTS, slow_stream, lambda: "Gabarit", deadline=0.02,
+                                cache=cache, first_token=first_token)
+    assert result == "Une balade lente" and sent == ["Une ", "balade ", "lente"]
+
+
+def test_stream_without_a_first_token_falls_back(tmp_path):
+    cache = DescriptionCache(str(tmp_path / 'descriptions.sqlite3'), max_variants=1)
+    release = threading.Event()
+
+    def silent():
+        release.wait(5)
+        return "Trop tard"
+
+    start = time.monotonic()
+    result = cached_description('ns', INPUTS, silent, lambda: "Gabarit", deadline=0.05,
+                                cache=cache, first_token=threading.Event())
+    assert result == "Gabarit" and time.monotonic() - start < 1
+    release.set()
@@ -0,0 +1,82 @@
+import sys
+sys.path.append('.')
+
+import pytest
+
+from services.distance_calibration import MAX_FACTOR, DistanceCalibration, region_key
+
+RENNES = [-1.6778, 48.1173]   # (lon, lat)
+BREST = [-4.4860, 48.3904]
+
+
+def record_runs(model, start_point, factors_and_distances, distance_km=10, route_type='loop'):
+    """Une génération par couple (facteur utilisé, distance obtenue)"""
+    for factor, achieved_km in factors_and_distances:
+        run = model.start_run(start_point, 'foot-hiking', route_type, distance_km)
+        run.observe(factor, achieved_km)
+        run.finish()
+
+
+def test_static_factor_until_enough_samples(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=3)
+
+    record_runs(model, RENNES, [(1.0, 12.5), (1.0, 8.0)])
+    run = model.start_run(RENNES, 'foot-hiking', 'loop', 10)
+    # Moins de min_samples observations : None, l'appelant garde son facteur statique
+    assert run.initial_factor is None and not run.calibrated
+
+    record_runs(model, RENNES, [(1.2, 10.0)])
+    run = model.start_run(RENNES, 'foot-hiking', 'loop', 10)
+    # Facteurs idéaux : 0.8, 1.25 et 1.2 -> médiane 1.2
+    assert run.initial_factor == pytest.approx(1.2)
+    assert run.calibrated
+
+
+def test_learned_factor_is_the_median_of_the_window(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=3, window=3)
+    record_runs(model, RENNES, [(1.0, 5.0), (1.0, 10.0), (1.0, 20.0), (1.0, 25.0)])
+
+    # Seules les 3 dernières observations comptent : 1.0, 0.5 et 0.4
+    factor = model.suggest_factor(region_key(RENNES), 'foot-hiking', 'loop', 10)
+    assert factor == pytest.approx(0.5)
+
+
+def test_other_regions_are_used_before_the_static_factor(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=2)
+    record_runs(model, RENNES, [(1.0, 5.0), (1.0, 5.0)])
+
+    assert region_key(RENNES) != region_key(BREST)
+    assert model.suggest_factor(region_key(BREST), 'foot-hiking', 'loop', 10) == pytest.approx(2.0)
+    # Autre tranche de distance ou autre type de parcours : pas d'historique
+    assert model.suggest_factor(region_key(BREST), 'foot-hiking', 'loop', 30) is None
+    assert model.suggest_factor(region_key(BREST), 'foot-hiking', 'out_and_back', 10) is None
+
+
+def test_learned_factor_is_clamped(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=1)
+    record_runs(model, RENNES, [(1.0, 1.0)])
+
+    # Facteur idéal 10 : ramené à la borne haute
+    assert model.suggest_factor(region_key(RENNES), 'foot-hiking', 'loop', 10) == MAX_FACTOR
+
+
+def test_report_separates_static_and_calibrated_routes(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=1)
+    record_runs(model, RENNES, [(1.0, 10.0)])
+
+    run = model.start_run(RENNES, 'foot-hiking', 'loop', 10)
+    run.observe(1.0)              # échec : compté comme appel, sans observation
+    run.observe(1.0, 10.0)
+    run.finish()
+
+    report = model.report()
+    assert report['observations'] == 2
+    assert report['fixed_factor'] == {'loop': {'routes': 1, 'avg_directions_calls': 1.0}}
+    assert report['calibrated'] == {'loop': {'routes': 1, 'avg_directions_calls': 2.0}}
+
+
+def test_disabled_model_never_suggests(tmp_path):
+    model = DistanceCalibration(path=str(tmp_path / 'calibration.sqlite3'), min_samples=1, enabled=False)
+    record_runs(model, RENNES, [(1.0, 10.0)])
+
+    assert model.start_run(RENNES, 'foot-hiking', 'loop', 10).initial_factor is None
@@ -2,13 +2,16 @@ import logging
 import sys
 sys.path.append('.')
 
+import services.email_service
 from services.email_service import EmailService
+from services.email_outbox import EmailOutbox
 from services.openai_service import generate_route_description
+from stub_server import SMTPSink
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 
-def test_email_personalization():
+def test_email_personalization(monkeypatch, tmp_path):
     # Sample test data
     test_preferences = {
         'activity_type': 'hiking',
@@ -48,7 +51,14 @@ def test_email_personalization():
         <trk><name>Test Route</name></trk>
     </gpx>"""
 
+    # Send to a local SMTP sink rather than the real Gmail account
+    monkeypatch.setattr(services.email_service, 'SENDER_EMAIL', 'sender@example.com')
+    monkeypatch.setattr(services.email_service, 'GMAIL_CREDENTIALS', 'test-credentials')
+    sink = SMTPSink().start()
     email_service = EmailService()
+    email_service.smtp_server, email_service.smtp_port = sink.server.server_address[:2]
+    email_service.use_starttls = False
+    email_service.outbox = EmailOutbox(str(tmp_path / 'outbox.sqlite3'))
     
     try:
         # Test email generation
@@ -58,11 +68,20 @@ def test_email_personalization():
             route_description=sample_description,
             preferences=test_preferences
         )
+        assert email_service.outbox.flush(timeout=10)
         print("Email personalization test completed successfully")
         
     except Exception as e:
         print(f"Email personalization test failed: {str(e)}")
         raise
+    finally:
+        email_service.outbox.stop()
+        sink.stop()
+
+    assert len(sink.messages) == 1
+    assert 'test@example.com' in sink.messages[0]['to'][0]
+    assert b'parcours_bretagne.gpx' in sink.messages[0]['data']
 
 if __name__ == "__main__":
-    test_email_personalization()
+    import pytest
+    sys.exit(pytest.main([__file__]))
@@ -0,0 +1,126 @@
+import sys
+sys.path.append('.')
+
+import smtplib
+import time
+
+from services.email_outbox import EmailOutbox
+
+
+def outbox(tmp_path, **kwargs):
+    return EmailOutbox(str(tmp_path / 'outbox.sqlite3'), backoff_base=0.01, backoff_max=0.05,
+                       poll_interval=0.01, **kwargs)
+
+
+def test_background_delivery(tmp_path):
+    box = outbox(tmp_path)
+    delivered = []
+    for i in range(5):
+        box.enqueue('sender@example.com', [f"user{i}@example.com"], f"Subject: {i}\r\n\r\nbody".encode())
+    box.start(lambda sender, recipients, payload: delivered.append((recipients[0], payload)))
+    try:
+        assert box.flush(timeout=5)
+    finally:
+        box.stop()
+    assert sorted(r for r, _ in delivered) == [f"user{i}@example.com" for i in range(5)]
+    assert box.stats()['sent'] == 5 and box.stats()['pending'] == 0
+
+
+def test_retries_then_dead_letters(tmp_path):
+    box = outbox(tmp_path, max_attempts=3)
+    box.enqueue('sender@example.com', ['flaky@example.com'], b'flaky')
+    box.enqueue('sender@example.com', ['down@example.com'], b'down')
+    attempts = {b'flaky': 0, b'down': 0}
+
+    def deliver(sender, recipients, payload):
+        attempts[payload] += 1
+        if payload == b'down' or attempts[payload] < 2:
+            raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline and box.stats()['pending']:
+        box.process_one(deliver)
+        time.sleep(0.01)
+
+    assert attempts == {b'flaky': 2, b'down': 3}
+    stats = box.stats()
+    assert stats['sent'] == 1 and stats['dead'] == 1
+    dead = box.dead_letters()
+    assert dead[0]['recipients'] == ['down@example.com'] and 'unexpectedly' in dead[0]['last_error']
+    assert box.requeue(dead[0]['id']) and box.stats()['pending'] == 1
+
+
+def test_permanent_refusal_and_expired_lease(tmp_path):
+    box = outbox(tmp_path, lease_seconds=0.05)
+    box.enqueue('sender@example.com', ['nobody@example.com'], b'bounce')
+
+    def refuse(sender, recipients, payload):
+        raise smtplib.SMTPRecipientsRefused({recipients[0]: (550, b'No such user')})
+
+    assert box.process_one(refuse)
+    assert box.stats()['dead'] == 1  # no retry on a 5xx refusal
+
+    # A sender that died after claiming leaves the message to be claimed again
+    box.enqueue('sender@example.com', ['user@example.com'], b'again')
+    assert box.claim() is not None
+    assert box.claim() is None
+    time.sleep(0.1)
+    message = box.claim()
+    assert message is not None and message.payload == b'again'
+
+
+def test_restarted_process_drains_existing_outbox(tmp_path):
+    # Un processus arrêté en plein envoi : un message en attente, un autre bail en cours
+    crashed = outbox(tmp_path, lease_seconds=0.05)
+    crashed.enqueue('sender@example.com', ['pending@example.com'], b'pending')
+    crashed.enqueue('sender@example.com', ['leased@example.com'], b'leased')
+    assert crashed.claim() is not None
+
+    # Le processus suivant rouvre le fichier et démarre ses expéditeurs sans nouvel envoi
+    time.sleep(0.1)
+    restarted = outbox(tmp_path)
+    delivered = []
+    restarted.start(lambda sender, recipients, payload: delivered.append(recipients[0]))
+    try:
+        assert restarted.flush(timeout=5)
+    finally:
+        restarted.stop()
+    assert sorted(delivered) == ['leased@example.com', 'pending@example.com']
+    assert restarted.stats()['sent'] == 2
+
+
+def test_expired_lease_does_not_overwrite_the_new_claim(tmp_path):
+    box = outbox(tmp_path, lease_seconds=0.05, max_attempts=3)
+    box.enqueue('sender@example.com', ['user@example.com'], b'slow')
+
+    slow = box.claim()
+    time.sleep(0.1)  # l'envoi dépasse le bail : un autre expéditeur reprend le message
+    fast = box.claim()
+    assert fast.id == slow.id and fast.token != slow.token
+
+    # Le premier expéditeur échoue tard : ni statut ni tentatives modifiés
+    assert box.mark_failed(slow, 'timed out') is None
+    assert box.stats()['sending'] == 1
+    assert box.mark_sent(fast)
+    assert not box.mark_sent(slow)
+    assert box.stats()['sent'] == 1 and box.stats()['pending'] == 0
+
+
+def test_outbox_created_without_claim_tokens_is_upgraded(tmp_path):
+    import sqlite3
+    path = tmp_path / 'outbox.sqlite3'
+    with sqlite3.connect(path) as conn:
+        conn.execute(
+            "CREATE TABLE outbox (id INTEGER PRIMARY KEY AUTOINCREMENT, sender TEXT NOT NULL,"
+            " recipients TEXT NOT NULL, payload BLOB, status TEXT NOT NULL,"
+            " attempts INTEGER NOT NULL DEFAULT 0, next_attempt_at REAL NOT NULL, locked_until REAL,"
+            " last_error TEXT, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        conn.execute("INSERT INTO outbox (sender, recipients, payload, status, next_attempt_at,"
+                     " created_at, updated_at) VALUES ('s@example.com', 'old@example.com', x'00',"
+                     " 'pending', 0, 0, 0)")
+
+    box = outbox(tmp_path)
+    delivered = []
+    assert box.process_one(lambda sender, recipients, payload: delivered.append(recipients[0]))
+    assert delivered == ['old@example.com'] and box.stats()['sent'] == 1
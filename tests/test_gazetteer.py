@@ -0,0 +1,48 @@
+import sys
+sys.path.append('.')
+
+import csv
+
+from config import GAZETTEER_PATH
+from services.gazetteer import get_gazetteer
+from services.geocode_cache import normalize_place_name
+
+# Vrais homonymes : deux communes distinctes de même nom
+KNOWN_HOMONYMS = {'saint armel'}  # Ille-et-Vilaine (35) et Morbihan (56)
+
+
+def test_resolve_exact_and_normalised_names():
+    gazetteer = get_gazetteer()
+    assert gazetteer.resolve('Rennes').name == 'Rennes'
+    assert gazetteer.resolve('vitre').name == 'Vitré'
+    assert gazetteer.resolve('saint-brieuc').name == 'Saint-Brieuc'
+    assert gazetteer.resolve('SAINT BRIEUC').name == 'Saint-Brieuc'
+    assert gazetteer.resolve('Quimper, Finistère').name == 'Quimper'
+
+
+def test_near_misses_are_suggested_not_resolved():
+    gazetteer = get_gazetteer()
+    # Villes hors de Bretagne : le géocodage en ligne doit les refuser
+    for name in ('Lille', 'Paris', 'Lyon, France'):
+        assert gazetteer.resolve(name) is None
+    assert gazetteer.resolve('Quimpr') is None
+    assert [place.name for place in gazetteer.suggest('Quimpr')] == ['Quimper']
+    assert gazetteer.suggest('Paris') == []
+
+
+def test_island_communes_resolve_offline():
+    gazetteer = get_gazetteer()
+    for name in ('Île-de-Batz', 'ile de brehat', 'Île-de-Sein', 'Ouessant', 'Hoedic'):
+        assert gazetteer.resolve(name) is not None, name
+
+
+def test_no_duplicate_rows_besides_real_homonyms():
+    names = {}
+    with open(GAZETTEER_PATH, newline='', encoding='utf-8') as f:
+        for row in csv.DictReader(f):
+            names.setdefault(normalize_place_name(row['name']), []).append(row)
+
+    duplicates = {key for key, rows in names.items() if len(rows) > 1}
+    assert duplicates == KNOWN_HOMONYMS
+    # Lanmeur est dans le nord du Finistère, pas dans le Morbihan
+    assert get_gazetteer().resolve('Lanmeur').latitude > 48.6
@@ -0,0 +1,46 @@
+import sys
+sys.path.append('.')
+
+from services.geocode_cache import GeocodeCache, normalize_place_name
+
+
+def test_normalize_place_name():
+    assert normalize_place_name("  Saint-Brieuc ") == "saint brieuc"
+    assert normalize_place_name("Plérin") == "plerin"
+    assert normalize_place_name("L'Hermitage") == "l hermitage"
+
+
+def test_positive_and_negative_entries(tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geocode.sqlite3"))
+
+    assert cache.get("Quimper") is None
+
+    cache.put("Quimper", 47.996, -4.097)
+    entry = cache.get("quimper")
+    assert entry.found
+    assert (entry.latitude, entry.longitude) == (47.996, -4.097)
+
+    cache.put_not_found("Nulle-Part")
+    assert cache.get("nulle part").found is False
+
+
+def test_expired_entries_are_ignored(tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geocode.sqlite3"),
+                         ttl_seconds=-1, negative_ttl_seconds=-1)
+    cache.put("Brest", 48.39, -4.486)
+    cache.put_not_found("Nulle-Part")
+
+    assert cache.get("Brest") is None
+    assert cache.get("Nulle-Part") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = GeocodeCache(path=str(tmp_path / "geocode.sqlite3"), max_entries=2)
+    cache.put("Rennes", 48.11, -1.67)
+    cache.put("Brest", 48.39, -4.48)
+    cache.get("Rennes")
+    cache.put("Vannes", 47.65, -2.76)
+
+    assert cache.get("Rennes") is not None
+    assert cache.get("Vannes") is not None
+    assert cache.get("Brest") is None
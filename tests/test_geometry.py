@@ -0,0 +1,61 @@
+import sys
+sys.path.append('.')
+
+import numpy as np
+import pytest
+
+from services.geometry import compute_metrics, cumulative_distance, as_array
+
+
+def ramp(length_m=5000, spacing_m=10, climb_m=100):
+    """Straight line due north climbing steadily, then flat"""
+    count = length_m // spacing_m + 1
+    lat = 48.0 + np.arange(count) * spacing_m / 111195
+    elevation = np.minimum(np.arange(count) * spacing_m, length_m / 2) * climb_m / (length_m / 2)
+    return np.column_stack([np.full(count, -2.0), lat, elevation])
+
+
+def test_distance_matches_haversine():
+    # One degree of latitude on the mean Earth radius
+    assert cumulative_distance(as_array([[0, 0], [0, 1]]))[-1] == pytest.approx(111195, rel=1e-4)
+
+
+def test_ascent_grade_and_splits():
+    metrics = compute_metrics(ramp())
+    assert metrics.distance_m == pytest.approx(5000, rel=1e-3)
+    assert metrics.ascent_m == pytest.approx(100, abs=2)
+    assert metrics.descent_m == pytest.approx(0, abs=1)
+    assert metrics.max_grade_percent == pytest.approx(4, abs=0.2)
+
+    assert len(metrics.splits) == 5
+    assert sum(split.distance_m for split in metrics.splits) == pytest.approx(5000, rel=1e-3)
+    assert sum(split.ascent_m for split in metrics.splits) == pytest.approx(metrics.ascent_m, abs=0.5)
+    assert metrics.splits[-1].ascent_m == pytest.approx(0, abs=1)
+
+
+def test_missing_elevation_gives_distance_only():
+    metrics = compute_metrics([[-2.0, 48.0], [-2.0, 48.01, None], [-2.0, 48.02, 30]])
+    assert metrics.distance_m == pytest.approx(2224, rel=1e-3)
+    assert metrics.ascent_m == 0.0
+    assert not metrics.has_elevation
+
+
+def test_summary_distance_in_km_whatever_the_ors_unit(caplog):
+    from services.route_generator import RouteGenerator
+    coordinates = [[-1.68, 48.11, 30.0], [-1.67, 48.11, 35.0], [-1.67, 48.12, 32.0]]
+    length_km = compute_metrics(coordinates).distance_km
+
+    def route(distance):
+        return {'features': [{'properties': {'segments': [{'distance': distance, 'ascent': 5.0}]},
+                              'geometry': {'coordinates': coordinates}}]}
+
+    with caplog.at_level('WARNING'):
+        in_km = RouteGenerator.summarize_route(route(round(length_km, 3)))
+        in_m = RouteGenerator.summarize_route(route(round(length_km * 1000, 1)), distance_unit='m')
+    assert in_km['distance'] == in_m['distance'] == round(length_km, 3)
+    assert 'mismatch' not in caplog.text
+
+    # Sans segment ORS, la distance calculée, en km elle aussi
+    bare = {'features': [{'properties': {}, 'geometry': {'coordinates': coordinates}}]}
+    fallback = RouteGenerator.summarize_route(bare)
+    assert fallback['distance'] == round(length_km, 3)
@@ -0,0 +1,65 @@
+import sys
+sys.path.append('.')
+
+import random
+from datetime import datetime
+
+import gpxpy
+import gpxpy.gpx
+
+from services.gpx_writer import iter_gpx_bytes, render_gpx
+
+
+def gpxpy_xml(coordinates, name=None, description=None, author_name=None, time=None):
+    """The object-graph path GPXService and RouteGenerator used before the writer"""
+    gpx = gpxpy.gpx.GPX()
+    track = gpxpy.gpx.GPXTrack()
+    gpx.tracks.append(track)
+    segment = gpxpy.gpx.GPXTrackSegment()
+    track.segments.append(segment)
+    for coord in coordinates:
+        segment.points.append(gpxpy.gpx.GPXTrackPoint(
+            latitude=coord[1],
+            longitude=coord[0],
+            elevation=coord[2] if len(coord) > 2 else None
+        ))
+    gpx.name = name
+    gpx.description = description
+    gpx.author_name = author_name
+    gpx.time = time
+    return gpx.to_xml()
+
+
+def test_matches_gpxpy_on_random_routes():
+    rng = random.Random(7)
+    coordinates = [[round(rng.uniform(-5, -1), rng.randint(0, 9)),
+                    round(rng.uniform(47, 49), rng.randint(0, 9)),
+                    round(rng.uniform(0, 300), rng.randint(0, 2))]
+                   for _ in range(2000)]
+    metadata = {
+        'name': "Hiking Route - Saint-Malo",
+        'description': "Generated route for 10km hiking",
+        'author_name': "Route Generator",
+        'time': datetime(2025, 5, 1, 8, 30, 12, 345678)
+    }
+    assert render_gpx(coordinates, chunk_points=128, **metadata) == gpxpy_xml(coordinates, **metadata)
+
+
+def test_matches_gpxpy_on_edge_cases():
+    coordinates = [
+        [-1.5, 48.1],                # no elevation
+        [-1.5, 48.1, None],
+        [0.0, -0.0, 0],              # zeros written as gpxpy does
+        [1e-07, 48, 1e20],           # no scientific notation
+        [-4, 47, 12.0],
+    ]
+    metadata = {'name': "Parcours <trail> & co", 'author_name': "Sport Outdoor Route Generator"}
+    assert render_gpx(coordinates, **metadata) == gpxpy_xml(coordinates, **metadata)
+    assert render_gpx([]) == gpxpy_xml([])
+
+
+def test_bytes_chunks():
+    coordinates = [[-1.0, 48.0, float(i)] for i in range(10)]
+    chunks = list(iter_gpx_bytes(coordinates, name="é", chunk_points=3))
+    assert len(chunks) == 6  # header, 4 point chunks, footer
+    assert b''.join(chunks).decode('utf-8') == gpxpy_xml(coordinates, name="é")
@@ -0,0 +1,142 @@
+import sys
+sys.path.append('.')
+
+import pytest
+import requests
+from urllib3.exceptions import MaxRetryError, NewConnectionError
+
+from services.http_client import HTTPClient
+
+URL = 'https://api.example.test/v2/directions'
+
+
+def make_response(status_code, headers=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.headers.update(headers or {})
+    return response
+
+
+class ScriptedSession:
+    """Session dont chaque appel renvoie (ou lève) l'élément suivant du script"""
+
+    def __init__(self, script):
+        self.script = list(script)
+        self.calls = 0
+
+    def request(self, method, url, timeout=None, **kwargs):
+        self.calls += 1
+        outcome = self.script.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+
+class FakeLimiter:
+    def __init__(self):
+        self.acquired = 0
+        self.observed = []
+
+    def acquire(self, upstream, max_wait=None):
+        self.acquired += 1
+
+    def observe(self, upstream, response):
+        self.observed.append(response.status_code)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr('services.http_client.time.sleep', delays.append)
+    monkeypatch.setattr('services.http_client.random.uniform', lambda low, high: 1.0)
+    monkeypatch.setattr('services.http_client.get_rate_limiter', lambda: None)
+    return delays
+
+
+def scripted_client(monkeypatch, script, **kwargs):
+    client = HTTPClient(backoff_base=1.0, backoff_max=3.0, **kwargs)
+    session = ScriptedSession(script)
+    client._session(URL.split('/')[2])  # crée les compteurs de l'hôte
+    monkeypatch.setattr(client, '_session', lambda host: session)
+    return client, session
+
+
+def connection_refused():
+    reason = NewConnectionError(None, 'Failed to establish a new connection: [Errno 111] Connection refused')
+    return requests.exceptions.ConnectionError(MaxRetryError(None, URL, reason))
+
+
+def test_server_errors_are_retried_with_exponential_backoff(monkeypatch, sleeps):
+    client, session = scripted_client(monkeypatch, [make_response(503)] * 4, max_retries=3)
+
+    response = client.get(URL)
+
+    # La dernière réponse en échec est renvoyée, le délai plafonne à backoff_max
+    assert response.status_code == 503
+    assert session.calls == 4
+    assert sleeps == [1.0, 2.0, 3.0]
+    stats = client.stats()['api.example.test']
+    assert stats['retries'] == 3 and stats['errors'] == 4
+
+
+def test_success_after_a_server_error(monkeypatch, sleeps):
+    client, session = scripted_client(monkeypatch, [make_response(502), make_response(200)])
+
+    assert client.get(URL).status_code == 200
+    assert session.calls == 2
+
+
+def test_client_errors_are_not_retried(monkeypatch, sleeps):
+    client, session = scripted_client(monkeypatch, [make_response(400)])
+
+    assert client.post(URL).status_code == 400
+    assert session.calls == 1 and sleeps == []
+
+
+def test_retry_after_header_sets_the_delay(monkeypatch, sleeps):
+    client, _ = scripted_client(monkeypatch, [make_response(429, {'Retry-After': '2'}),
+                                              make_response(503, {'Retry-After': '60'}),
+                                              make_response(200)])
+
+    assert client.get(URL).status_code == 200
+    # Retry-After est plafonné par backoff_max
+    assert sleeps == [2.0, 3.0]
+
+
+def test_rate_limited_upstream_waits_in_the_limiter(monkeypatch, sleeps):
+    limiter = FakeLimiter()
+    monkeypatch.setattr('services.http_client.get_rate_limiter', lambda: limiter)
+    monkeypatch.setattr('services.http_client.upstream_for_url', lambda url: 'ors')
+    client, _ = scripted_client(monkeypatch, [make_response(429, {'Retry-After': '2'}), make_response(200)])
+
+    assert client.post(URL).status_code == 200
+    # Pas de backoff local : le limiteur a vu le 429 et fait attendre le prochain acquire()
+    assert sleeps == []
+    assert limiter.acquired == 2
+    assert limiter.observed == [429, 200]
+
+
+def test_get_is_retried_after_a_read_timeout(monkeypatch, sleeps):
+    client, session = scripted_client(monkeypatch, [requests.exceptions.ReadTimeout(), make_response(200)])
+
+    assert client.get(URL).status_code == 200
+    assert session.calls == 2
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ReadTimeout(),
+                                   requests.exceptions.ConnectionError('Connection aborted')])
+def test_post_is_not_retried_once_it_may_have_been_received(monkeypatch, sleeps, error):
+    client, session = scripted_client(monkeypatch, [error, make_response(200)])
+
+    with pytest.raises(type(error)):
+        client.post(URL, json={})
+    assert session.calls == 1
+
+
+@pytest.mark.parametrize('error', [requests.exceptions.ConnectTimeout(), connection_refused()])
+def test_post_is_retried_when_it_could_not_be_sent(monkeypatch, sleeps, error):
+    client, session = scripted_client(monkeypatch, [error, make_response(200)])
+
+    assert client.post(URL, json={}).status_code == 200
+    assert session.calls == 2
+    assert sleeps == [1.0]
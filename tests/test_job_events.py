@@ -0,0 +1,57 @@
+import sys
+import threading
+sys.path.append('.')
+
+from services.job_service import JobManager
+
+
+def test_events_stream_stages_tokens_then_done():
+    manager = JobManager(max_workers=1)
+    release = threading.Event()
+
+    def pipeline(report, text):
+        report('describing', 50)
+        for word in text.split():
+            report.publish('token', {'text': word})
+        release.wait(5)
+        return {'success': True}
+
+    job = manager.submit(pipeline, 'une belle boucle')
+
+    # Un consommateur en retard relit tout depuis le début
+    received, after = [], 0
+    while not any(event['event'] == 'token' and event['data']['text'] == 'boucle' for event in received):
+        events = manager.wait_events(job.id, after, timeout=5)
+        received += events
+        after = received[-1]['id']
+
+    release.set()
+    events = manager.wait_events(job.id, after, timeout=5)
+    while events[-1]['event'] != 'done':
+        events += manager.wait_events(job.id, events[-1]['id'], timeout=5)
+    received += events
+
+    names = [event['event'] for event in received]
+    assert names == ['stage', 'stage', 'token', 'token', 'token', 'done']
+    assert [event['id'] for event in received] == list(range(1, 7))
+    assert received[-1]['data'] == {'success': True}
+    # Rien de plus à transmettre : le flux se termine au lieu d'attendre
+    assert manager.wait_events(job.id, after=6, timeout=5) is None
+
+
+def test_failed_job_ends_with_error_event():
+    manager = JobManager(max_workers=1)
+
+    def pipeline(report):
+        error = ValueError('Location must be in Brittany')
+        error.status_code = 400
+        raise error
+
+    job = manager.submit(pipeline)
+    events = manager.wait_events(job.id, 0, timeout=5)
+    while events[-1]['event'] not in ('done', 'error'):
+        events += manager.wait_events(job.id, events[-1]['id'], timeout=5)
+
+    assert events[-1] == {'id': len(events), 'event': 'error',
+                          'data': {'error': 'Location must be in Brittany', 'status_code': 400}}
+    assert manager.wait_events('unknown', 0, timeout=0.1) is None
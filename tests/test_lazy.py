@@ -0,0 +1,60 @@
+import sys
+import threading
+import time
+sys.path.append('.')
+
+from services.lazy import LazyService, reset_services
+
+
+class Slow:
+    built = 0
+
+    def __init__(self):
+        time.sleep(0.05)
+        Slow.built += 1
+
+    def ping(self):
+        return 'pong'
+
+
+def test_built_once_on_first_use_across_threads():
+    Slow.built = 0
+    service = LazyService(Slow)
+    assert not service.initialized and Slow.built == 0
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(service.ping())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['pong'] * 8
+    assert Slow.built == 1
+
+
+def test_reset_after_fork_rebuilds_on_next_use():
+    Slow.built = 0
+    service = LazyService(Slow)
+    first = service.get()
+    reset_services()
+    assert not service.initialized
+    assert service.get() is not first
+    assert Slow.built == 2
+
+
+def test_failing_factory_is_retried():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ValueError("SENDER_EMAIL environment variable is not set")
+        return Slow()
+
+    service = LazyService(factory)
+    try:
+        service.ping()
+    except ValueError:
+        pass
+    assert service.ping() == 'pong'
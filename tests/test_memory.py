@@ -0,0 +1,36 @@
+import sys
+sys.path.append('.')
+
+import pytest
+
+import services.memory as memory
+from services.memory import MemoryBudgetExceeded, PEAK_BYTES, check_response_size, track_memory
+from services.simplify import simplify_route
+
+
+def test_track_memory_records_stage_peak(monkeypatch):
+    monkeypatch.setattr(memory, 'MEMORY_TRACKING', True)
+    before = PEAK_BYTES.count(pipeline='test', stage='allocate')
+    with track_memory('test', 'allocate'):
+        block = bytearray(8 * 1024 * 1024)
+        del block
+    assert PEAK_BYTES.count(pipeline='test', stage='allocate') == before + 1
+    totals = [value for name, labels, value in PEAK_BYTES.samples()
+              if name.endswith('_sum') and labels == {'pipeline': 'test', 'stage': 'allocate'}]
+    assert totals[0] >= 8 * 1024 * 1024
+
+
+def test_budget_rejects_large_responses_and_simplifies_long_tracks(monkeypatch):
+    monkeypatch.setattr(memory, 'MEMORY_BUDGET_MB', 1)
+    with pytest.raises(MemoryBudgetExceeded):
+        check_response_size(512 * 1024)
+    check_response_size(64 * 1024)
+
+    # Au-delà du budget (1 Mio / MEMORY_BYTES_PER_POINT points), même si la simplification est désactivée
+    monkeypatch.setattr('services.simplify.GPX_SIMPLIFY_ENABLED', False)
+    coordinates = [[-1.68 + i * 1e-5, 48.11 + (i % 7) * 1e-5, 40.0] for i in range(5000)]
+    route = {'type': 'FeatureCollection',
+             'features': [{'type': 'Feature', 'properties': {},
+                           'geometry': {'type': 'LineString', 'coordinates': coordinates}}]}
+    simplified, report = simplify_route(route)
+    assert report.kept_points <= memory.budget_points() < report.original_points
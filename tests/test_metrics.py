@@ -0,0 +1,44 @@
+import sys
+sys.path.append('.')
+
+import pytest
+
+from services.metrics import MetricsRegistry, span, SPAN_SECONDS
+
+
+def test_histogram_renders_cumulative_buckets():
+    registry = MetricsRegistry(prefix='test_')
+    latency = registry.histogram('latency_seconds', "Latence", ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.7, 3.0):
+        latency.observe(value, stage='routing')
+    hits = registry.counter('cache_requests', "Lectures de cache", ('cache', 'result'))
+    hits.inc(cache='route', result='hit')
+    hits.inc(cache='route', result='hit')
+
+    lines = registry.render().splitlines()
+    assert '# TYPE test_latency_seconds histogram' in lines
+    assert 'test_latency_seconds_bucket{stage="routing",le="0.1"} 1' in lines
+    assert 'test_latency_seconds_bucket{stage="routing",le="1.0"} 3' in lines
+    assert 'test_latency_seconds_bucket{stage="routing",le="+Inf"} 4' in lines
+    assert 'test_latency_seconds_count{stage="routing"} 4' in lines
+    assert 'test_cache_requests_total{cache="route",result="hit"} 2' in lines
+    # Déclarer de nouveau renvoie la même métrique
+    assert registry.counter('cache_requests', "Lectures de cache", ('cache', 'result')) is hits
+
+
+def test_span_records_outcome_and_works_as_decorator():
+    before_ok = SPAN_SECONDS.count(span='test_op', outcome='ok')
+    before_error = SPAN_SECONDS.count(span='test_op', outcome='error')
+
+    @span('test_op')
+    def operation(fail):
+        if fail:
+            raise ValueError('boom')
+        return 42
+
+    assert operation(False) == 42
+    with pytest.raises(ValueError):
+        operation(True)
+
+    assert SPAN_SECONDS.count(span='test_op', outcome='ok') == before_ok + 1
+    assert SPAN_SECONDS.count(span='test_op', outcome='error') == before_error + 1
@@ -0,0 +1,249 @@
+import sys
+sys.path.append('.')
+
+import threading
+import time
+from math import pi
+
+import pytest
+
+from services.ors_service import GeocodeAttempt, ORSService
+
+STRATEGIES = [{'text': 'strict'}, {'text': 'region'}, {'text': 'country'}, {'text': 'anywhere'}]
+
+
+@pytest.fixture(autouse=True)
+def reset_strategy_stats():
+    ORSService._strategy_stats = {}
+    yield
+    ORSService._strategy_stats = {}
+
+
+def scripted_strategies(monkeypatch, outcomes):
+    """outcomes : index -> (délai en secondes, dans la région ?) ; absent = aucun résultat"""
+    calls = []
+    lock = threading.Lock()
+
+    def try_strategy(self, endpoint, strategy_index, params, is_last):
+        with lock:
+            calls.append(strategy_index)
+        delay, in_bounds = outcomes.get(strategy_index, (0.0, None))
+        time.sleep(delay)
+        attempt = GeocodeAttempt(index=strategy_index)
+        if in_bounds is None:
+            attempt.error = "Localité non trouvée"
+        elif in_bounds or is_last:
+            attempt.coordinates = (-1.0 - strategy_index, 48.0)
+            attempt.in_bounds = in_bounds
+        return attempt
+
+    monkeypatch.setattr(ORSService, '_try_geocode_strategy', try_strategy)
+    return calls
+
+
+def test_race_prefers_the_highest_priority_strategy(monkeypatch):
+    scripted_strategies(monkeypatch, {0: (0.2, True), 1: (0.0, True), 2: (0.0, True)})
+
+    winner, attempts = ORSService()._race_geocode_strategies('geocode', STRATEGIES)
+
+    assert winner.index == 0
+    assert sorted(attempt.index for attempt in attempts) == [0, 1, 2, 3]
+
+
+def test_race_stops_waiting_once_a_higher_priority_strategy_wins(monkeypatch):
+    scripted_strategies(monkeypatch, {0: (0.0, None), 1: (0.0, True), 2: (1.0, True), 3: (1.0, False)})
+
+    started = time.monotonic()
+    winner, attempts = ORSService()._race_geocode_strategies('geocode', STRATEGIES)
+
+    assert winner.index == 1
+    assert time.monotonic() - started < 0.5
+    # Les stratégies abandonnées comptent comme essayées et perdues
+    assert {attempt.index for attempt in attempts if attempt.transient} == {2, 3}
+
+
+def test_race_falls_back_to_the_last_resort(monkeypatch):
+    scripted_strategies(monkeypatch, {3: (0.0, False)})
+
+    winner, _ = ORSService()._race_geocode_strategies('geocode', STRATEGIES)
+
+    assert winner.index == 3 and not winner.in_bounds
+
+
+def test_losing_strategies_are_pruned_but_not_the_last_resort(monkeypatch):
+    monkeypatch.setattr('services.ors_service.ORS_GEOCODE_MIN_SAMPLES', 10)
+    monkeypatch.setattr('services.ors_service.ORS_GEOCODE_MIN_WIN_RATE', 0.1)
+    # La stratégie 2 ne gagne jamais, la dernière pas davantage
+    ORSService._strategy_stats = {0: (20, 15), 1: (20, 5), 2: (20, 0), 3: (20, 0)}
+
+    assert ORSService._active_strategy_indexes(4) == [0, 1, 3]
+
+
+def test_pruned_strategies_are_not_raced(monkeypatch):
+    monkeypatch.setattr('services.ors_service.ORS_GEOCODE_MIN_SAMPLES', 10)
+    calls = scripted_strategies(monkeypatch, {3: (0.0, False)})
+    ORSService._strategy_stats = {0: (20, 0), 1: (20, 0), 2: (20, 0), 3: (20, 0)}
+
+    winner, _ = ORSService()._race_geocode_strategies('geocode', STRATEGIES)
+
+    assert calls == [3]
+    assert winner.index == 3
+
+
+def test_outcomes_feed_the_strategy_stats(monkeypatch):
+    scripted_strategies(monkeypatch, {0: (0.0, None), 1: (0.0, True)})
+    service = ORSService()
+
+    winner, attempts = service._race_geocode_strategies('geocode', STRATEGIES)
+    service._record_strategy_outcome(attempts, winner)
+
+    assert ORSService._strategy_stats[0] == (1, 0)
+    assert ORSService._strategy_stats[1] == (1, 1)
+
+
+START = [-2.0470, 48.4540]  # Dinan (lon, lat)
+
+
+class RecordingCalibration:
+    initial_factor = None  # pas d'historique : facteur statique
+
+    def __init__(self):
+        self.observed = []
+
+    def observe(self, factor, achieved_km=None, calls=1):
+        self.observed.append((factor, achieved_km, calls))
+
+
+@pytest.fixture
+def stub_ors(monkeypatch):
+    from stub_server import StubConfig, StubServer
+    stub = StubServer(StubConfig(latency_scale=0, seed=1)).start()
+    monkeypatch.setattr('services.ors_service.ORS_BASE_URL', f"{stub.base_url}/v2")
+    monkeypatch.setattr('services.ors_service.ORS_ROUTE_CONCURRENCY', 3)
+    monkeypatch.setattr('services.http_client.get_rate_limiter', lambda: None)
+    yield stub
+    stub.stop()
+
+
+def out_and_back(length_deg, factor):
+    """Candidat (points, facteur) : aller-retour vers le nord de length_deg degrés"""
+    turn = [START[0], START[1] + length_deg]
+    return [START, turn, START], factor
+
+
+def route_km(route_data):
+    return route_data['features'][0]['properties']['segments'][0]['distance'] / 1000
+
+
+def measured_km(candidates):
+    service = ORSService()
+    return [route_km(service._request_directions(points, 'foot-hiking')) for points, _ in candidates]
+
+
+def test_candidate_variations_spread_radius_and_rotation():
+    variations = ORSService._candidate_variations(4, sectors=2)
+
+    assert variations[0] == (1.0, 0.0)
+    assert [scale for scale, _ in variations] == [1.0, 0.85, 1.15, 0.75]
+    # Rotations régulières sur un demi-tour (2π / 2 secteurs)
+    assert [round(rotation, 6) for _, rotation in variations] == \
+        [round(i * pi / 4, 6) for i in range(4)]
+    assert len({scale for scale, _ in ORSService._candidate_variations(7, sectors=3)}) == 7
+
+
+def test_candidate_within_tolerance_is_returned(stub_ors):
+    candidates = [out_and_back(0.005, 0.5), out_and_back(0.02, 1.0), out_and_back(0.05, 1.5)]
+    target_km = measured_km(candidates)[1]
+    calibration = RecordingCalibration()
+
+    route_data = ORSService()._route_candidates_concurrently(candidates, 'foot-hiking', target_km, calibration)
+
+    assert route_km(route_data) == pytest.approx(target_km)
+    assert (1.0, pytest.approx(target_km), 1) in calibration.observed
+
+
+def test_closest_candidate_wins_when_none_is_within_tolerance(stub_ors):
+    candidates = [out_and_back(0.005, 0.5), out_and_back(0.02, 1.0), out_and_back(0.04, 1.5)]
+    distances = measured_km(candidates)
+    target_km = distances[2] * 2
+
+    route_data = ORSService()._route_candidates_concurrently(
+        candidates, 'foot-hiking', target_km, RecordingCalibration())
+
+    assert route_km(route_data) == pytest.approx(max(distances))
+
+
+def test_failed_candidates_are_skipped(stub_ors):
+    # Un seul point : le stub répond 400 comme ORS
+    candidates = [([START], 0.5), out_and_back(0.02, 1.0), ([START], 1.5)]
+    calibration = RecordingCalibration()
+
+    route_data = ORSService()._route_candidates_concurrently(candidates, 'foot-hiking', 50, calibration)
+
+    assert route_km(route_data) == pytest.approx(measured_km([candidates[1]])[0])
+    # Les échecs comptent comme des appels sans distance obtenue
+    assert sorted(factor for factor, achieved, _ in calibration.observed if factor and achieved is None) == \
+        [0.5, 1.5]
+
+
+def test_all_candidates_failing_raises(stub_ors):
+    with pytest.raises(Exception, match="Aucun itinéraire candidat"):
+        ORSService()._route_candidates_concurrently(
+            [([START], 0.5), ([START], 1.0)], 'foot-hiking', 10, RecordingCalibration())
+
+
+def test_gazetteer_places_need_no_api_key(monkeypatch):
+    monkeypatch.setattr('services.ors_service.ORS_API_KEY', '')
+
+    assert ORSService().geocode_location('Île-de-Batz') == pytest.approx([-4.015, 48.74472])
+    with pytest.raises(Exception, match="Configuration manquante"):
+        ORSService().geocode_location('Atlantis')
+
+
+def test_unknown_place_is_reported_with_and_without_cache(monkeypatch, tmp_path):
+    from services.geocode_cache import GeocodeCache
+    cache = GeocodeCache(path=str(tmp_path / 'geocode.sqlite3'))
+    monkeypatch.setattr('services.ors_service.get_geocode_cache', lambda: cache)
+    monkeypatch.setattr('services.ors_service.ORS_GEOCODE_RACE', False)
+    monkeypatch.setattr('services.ors_service.ORS_API_KEY', 'x' * 40)
+    calls = scripted_strategies(monkeypatch, {})  # aucune stratégie ne trouve la localité
+
+    with pytest.raises(Exception, match="Impossible de localiser"):
+        ORSService().geocode_location('Atlantis')
+    assert cache.get('Atlantis').found is False
+
+    # Le négatif en cache donne la même erreur, sans appel réseau ni départ depuis Rennes
+    calls.clear()
+    with pytest.raises(Exception, match="Impossible de localiser"):
+        ORSService().geocode_location('Atlantis')
+    assert calls == []
+
+
+def test_centred_variations_stay_within_the_sector():
+    for count in (2, 4, 5, 7):
+        rotations = [rotation for _, rotation in ORSService._candidate_variations(count, 4, centred=True)]
+        assert rotations[0] == 0
+        assert all(abs(rotation) <= pi / 4 + 1e-9 for rotation in rotations)
+        assert len(set(rotations)) == count
+
+
+def test_out_and_back_candidates_follow_the_preferred_direction(monkeypatch):
+    monkeypatch.setattr('services.ors_service.ORS_ROUTE_CANDIDATES', 4)
+    monkeypatch.setattr(ORSService, '_initial_out_and_back_angle', staticmethod(lambda start: pi / 4))
+    angles = []
+    real_waypoints = ORSService._out_and_back_waypoints
+
+    def waypoints(start_point, half_distance_km, adjustment_factor, angle):
+        angles.append(angle)
+        return real_waypoints(start_point, half_distance_km, adjustment_factor, angle)
+
+    monkeypatch.setattr(ORSService, '_out_and_back_waypoints', staticmethod(waypoints))
+    monkeypatch.setattr(ORSService, '_route_candidates_concurrently',
+                        lambda self, candidates, profile, distance_km, calibration: candidates)
+
+    # Brest : la direction préférée (nord-est) évite la mer, les candidats aussi
+    candidates = ORSService()._generate_simple_out_and_back([-4.486, 48.390], 'foot-hiking', 10,
+                                                            RecordingCalibration())
+    assert len(candidates) == 4
+    assert angles[0] == pi / 4
+    assert all(0 <= angle <= pi / 2 for angle in angles)
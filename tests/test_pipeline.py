@@ -0,0 +1,85 @@
+import sys
+import time
+sys.path.append('.')
+
+import pytest
+
+from services.pipeline import PipelineExecutor, Stage, StageFailed, StageTimeout
+
+
+def _sleep_then(value, delay=0.2):
+    def func(results):
+        time.sleep(delay)
+        return value
+    return func
+
+
+def test_independent_branches_run_concurrently():
+    executor = PipelineExecutor([
+        Stage('route', _sleep_then('geojson')),
+        Stage('describe', _sleep_then('text')),
+        Stage('email', lambda results: (results['route'], results['describe']),
+              depends_on=('route', 'describe')),
+    ])
+
+    start = time.perf_counter()
+    results = executor.run()
+    elapsed = time.perf_counter() - start
+
+    assert results['email'] == ('geojson', 'text')
+    # Les deux branches de 0.2s se chevauchent au lieu de s'additionner
+    assert elapsed < 0.35
+    assert set(executor.timings) == {'route', 'describe', 'email'}
+
+
+def test_retry_then_success():
+    calls = []
+
+    def flaky(results):
+        calls.append(1)
+        if len(calls) < 2:
+            raise ConnectionError("boom")
+        return 'ok'
+
+    results = PipelineExecutor([
+        Stage('flaky', flaky, retries=1, retry_delay=0.01)
+    ]).run()
+
+    assert results['flaky'] == 'ok'
+    assert len(calls) == 2
+
+
+def test_retry_on_limits_retries_to_transient_errors():
+    calls = []
+
+    def over_quota(results):
+        calls.append(1)
+        raise PermissionError("quota")
+
+    with pytest.raises(StageFailed) as excinfo:
+        PipelineExecutor([
+            Stage('routing', over_quota, retries=1, retry_delay=0.01, retry_on=(ConnectionError,))
+        ]).run()
+
+    assert len(calls) == 1
+    assert isinstance(excinfo.value.cause, PermissionError)
+
+
+def test_timeout_raises_stage_failed():
+    executor = PipelineExecutor([
+        Stage('slow', _sleep_then('late', delay=1.0), timeout=0.1, error_message='Too slow')
+    ])
+
+    with pytest.raises(StageFailed) as excinfo:
+        executor.run()
+
+    assert str(excinfo.value) == 'Too slow'
+    assert isinstance(excinfo.value.cause, StageTimeout)
+
+
+def test_cycle_is_rejected():
+    with pytest.raises(ValueError):
+        PipelineExecutor([
+            Stage('a', lambda results: 1, depends_on=('b',)),
+            Stage('b', lambda results: 2, depends_on=('a',)),
+        ])
@@ -0,0 +1,48 @@
+import sys
+import time
+sys.path.append('.')
+
+import pstats
+
+from services.pipeline import PipelineExecutor, Stage
+from services.profiling import ProfileSession, list_profiles
+
+
+def _busy_stage(results):
+    deadline = time.perf_counter() + 0.05
+    total = 0
+    while time.perf_counter() < deadline:
+        total += sum(range(100))
+    return total
+
+
+def _pipeline():
+    return PipelineExecutor([
+        Stage('busy', _busy_stage),
+        Stage('after', lambda results: results['busy'], depends_on=('busy',)),
+    ]).run()
+
+
+def test_sampling_writes_collapsed_stacks(tmp_path):
+    session = ProfileSession('Vitré', mode='sampling', directory=str(tmp_path), interval=0.002)
+    with session.track():
+        _pipeline()
+    name = session.finish()
+
+    assert name.endswith('-vitre.collapsed')
+    lines = (tmp_path / name).read_text().splitlines()
+    # Les piles du thread d'étape sont relevées, regroupées sous le nom du pool
+    assert any(line.startswith('pipeline;') and '_busy_stage' in line for line in lines)
+    assert all(line.rsplit(' ', 1)[1].isdigit() for line in lines)
+    assert [profile['name'] for profile in list_profiles(str(tmp_path))] == [name]
+
+
+def test_cprofile_merges_thread_profiles(tmp_path):
+    session = ProfileSession('Rennes', mode='cprofile', directory=str(tmp_path))
+    with session.track():
+        _pipeline()
+    name = session.finish()
+
+    stats = pstats.Stats(str(tmp_path / name))
+    functions = {function for _, _, function in stats.stats}
+    assert {'run', '_busy_stage'} <= functions
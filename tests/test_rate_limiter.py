@@ -0,0 +1,47 @@
+import sys
+sys.path.append('.')
+
+import time
+import pytest
+from types import SimpleNamespace
+from services.rate_limiter import RateLimiter, RateLimitExceeded, upstream_for_url
+
+
+def make_limiter(tmp_path, capacity=2, rate=20.0):
+    return RateLimiter({'test': [('second', capacity, rate)]},
+                       path=str(tmp_path / "limits.sqlite3"))
+
+
+def test_upstream_for_url():
+    assert upstream_for_url("https://nominatim.openstreetmap.org/search") == 'nominatim'
+    assert upstream_for_url("https://api.openrouteservice.org/geocode/search") == 'ors_geocode'
+    assert upstream_for_url("https://api.openrouteservice.org/v2/directions/foot-hiking/geojson") == 'ors_directions'
+    assert upstream_for_url("https://api.openai.com/v1/chat/completions") is None
+
+
+def test_burst_waits_for_refill(tmp_path):
+    limiter = make_limiter(tmp_path)
+    start = time.perf_counter()
+    for _ in range(4):
+        limiter.acquire('test', max_wait=1)
+    # Two tokens in the bucket, then two more at 20 tokens/s
+    assert 0.05 <= time.perf_counter() - start < 0.5
+
+
+def test_state_is_shared_between_instances(tmp_path):
+    make_limiter(tmp_path, rate=0.01).acquire('test')
+    other = make_limiter(tmp_path, rate=0.01)
+    other.acquire('test')
+    with pytest.raises(RateLimitExceeded):
+        other.acquire('test', max_wait=0.1)
+
+
+def test_quota_headers_adjust_buckets(tmp_path):
+    limiter = make_limiter(tmp_path, capacity=100, rate=0.01)
+    response = SimpleNamespace(status_code=200, headers={
+        'x-ratelimit-remaining': '0',
+        'x-ratelimit-reset': str(time.time() + 60)
+    })
+    limiter.observe('test', response)
+    with pytest.raises(RateLimitExceeded):
+        limiter.acquire('test', max_wait=1)
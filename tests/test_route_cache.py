@@ -0,0 +1,106 @@
+import sys
+sys.path.append('.')
+
+import itertools
+import random
+import sqlite3
+
+import pytest
+
+from services.route_cache import RouteCache, compact_route, route_cache_key, wants_variety
+
+
+def make_route(seed, points=200):
+    """GeoJSON ORS peu compressible : la taille stockée varie peu d'une graine à l'autre"""
+    rng = random.Random(seed)
+    coordinates = [[round(rng.uniform(-4.5, -1.0), 6), round(rng.uniform(47.3, 48.9), 6)]
+                   for _ in range(points)]
+    return {'type': 'FeatureCollection', 'features': [{
+        'type': 'Feature',
+        'properties': {'segments': [{'distance': seed, 'steps': [{'instruction': 'Continue'}] * 20}]},
+        'geometry': {'type': 'LineString', 'coordinates': coordinates}}]}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Horloge strictement croissante : l'ordre LRU ne dépend pas de la résolution de time.time()"""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr('services.route_cache.time.time', lambda: float(next(ticks)))
+
+
+def stored_sizes(cache):
+    with sqlite3.connect(cache.path) as conn:
+        return [row[0] for row in conn.execute("SELECT size FROM routes ORDER BY id")]
+
+
+def test_key_quantizes_start_point_and_distance(monkeypatch):
+    monkeypatch.setattr('services.route_cache.ROUTE_CACHE_CELL_DEG', 0.005)
+    monkeypatch.setattr('services.route_cache.ROUTE_CACHE_DISTANCE_STEP_KM', 1)
+
+    key = route_cache_key('ors', [-1.6778, 48.1173], 'foot-hiking', 10.2, 'loop')
+    assert key == 'ors|-336:9623|foot-hiking|10|loop'
+    # Même cellule (≈ 500m) et même pas de distance : même clé
+    assert route_cache_key('ors', [-1.6790, 48.1160], 'foot-hiking', 9.8, 'loop') == key
+    assert route_cache_key('ors', [-1.6900, 48.1173], 'foot-hiking', 10.2, 'loop') != key
+    assert route_cache_key('ors', [-1.6778, 48.1173], 'foot-hiking', 11, 'loop') != key
+    assert route_cache_key('ors', [-1.6778, 48.1173], 'cycling-road', 10.2, 'loop') != key
+    assert route_cache_key('rg', [-1.6778, 48.1173], 'foot-hiking', 10.2, 'loop') != key
+
+
+def test_entries_are_stored_without_steps(tmp_path):
+    cache = RouteCache(path=str(tmp_path / 'routes.sqlite3'))
+    route = make_route(1)
+
+    assert cache.get('k') is None
+    cache.put('k', route)
+
+    assert cache.get('k') == compact_route(route)
+    assert 'steps' not in cache.get('k')['features'][0]['properties']['segments'][0]
+
+
+def test_variants_fill_up_before_variety_hits(tmp_path, clock):
+    cache = RouteCache(path=str(tmp_path / 'routes.sqlite3'), max_variants=2)
+    cache.put('k', make_route(1))
+
+    # Sans variété, le premier variant est servi ; en variété, la collection doit se remplir
+    assert cache.get('k')['features'][0]['properties']['segments'][0]['distance'] == 1
+    assert cache.get('k', variety=True) is None
+
+    cache.put('k', make_route(2))
+    served = {cache.get('k', variety=True)['features'][0]['properties']['segments'][0]['distance']
+              for _ in range(30)}
+    assert served == {1, 2}
+
+    # Au-delà de max_variants, les plus anciens variants sont remplacés
+    cache.put('k', make_route(3))
+    assert len(stored_sizes(cache)) == 2
+    assert cache.get('k')['features'][0]['properties']['segments'][0]['distance'] == 2
+
+
+def test_least_recently_used_entries_are_evicted_by_size(tmp_path, clock):
+    probe = RouteCache(path=str(tmp_path / 'probe.sqlite3'))
+    probe.put('probe', make_route(0))
+    entry_size = stored_sizes(probe)[0]
+
+    # Place pour deux entrées, pas pour trois
+    cache = RouteCache(path=str(tmp_path / 'routes.sqlite3'), max_bytes=int(entry_size * 2.5))
+    cache.put('a', make_route(1))
+    cache.put('b', make_route(2))
+    assert cache.get('a') is not None  # 'a' devient la plus récemment utilisée
+
+    cache.put('c', make_route(3))
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert sum(stored_sizes(cache)) <= cache.max_bytes
+
+
+def test_wants_variety(monkeypatch):
+    monkeypatch.setattr('services.route_cache.ROUTE_CACHE_VARIETY', False)
+    assert not wants_variety({})
+    assert not wants_variety({'variety': 'off'})
+    assert wants_variety({'variety': 'true'})
+    assert wants_variety({'variety': True})
+
+    monkeypatch.setattr('services.route_cache.ROUTE_CACHE_VARIETY', True)
+    assert wants_variety(None)
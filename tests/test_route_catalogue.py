@@ -0,0 +1,71 @@
+import sys
+sys.path.append('.')
+
+import pytest
+
+from services.route_catalogue import CatalogueEntry, RouteCatalogue, build_catalogue
+
+COORDINATES = [[-1.2098, 48.1228, 60.0], [-1.2001, 48.1301, 72.0], [-1.2098, 48.1228, 60.0]]
+
+
+def _entry(distance_km):
+    return CatalogueEntry(
+        place='Vitré', latitude=48.12279, longitude=-1.20983,
+        activity_type='running', distance_km=distance_km,
+        route_data={'type': 'FeatureCollection', 'features': [{
+            'type': 'Feature',
+            'properties': {'segments': [{'distance': 9.87, 'ascent': 120.0, 'steps': [{}] * 50}]},
+            'geometry': {'type': 'LineString', 'coordinates': COORDINATES}}]},
+        summary={'distance': 9.87, 'elevation_gain': 120.0, 'metrics': {}},
+        gpx=b'<gpx/>'
+    )
+
+
+def test_lookup_matches_place_activity_and_nearest_distance(tmp_path):
+    catalogue = RouteCatalogue(path=str(tmp_path / 'catalogue.sqlite3'), tolerance=0.1)
+    catalogue.put(_entry(10.0))
+    catalogue.put(_entry(15.0))
+
+    # Saisie libre résolue par le gazetteer, distance à 10 % près
+    entry = catalogue.get('vitre, Bretagne', 'running', '10.8')
+    assert entry.place == 'Vitré' and entry.distance_km == 10.0
+    assert entry.route_data['features'][0]['geometry']['coordinates'] == COORDINATES
+    assert 'steps' not in entry.route_data['features'][0]['properties']['segments'][0]
+    export = entry.gpx_export()
+    assert (export.format, export.filename, export.content, export.points) == \
+        ('gpx', 'parcours_bretagne.gpx', b'<gpx/>', 3)
+
+    assert catalogue.get('Vitré', 'running', 12.5) is None
+    assert catalogue.get('Vitré', 'hiking', 10) is None
+    assert catalogue.get('Atlantis', 'running', 10) is None
+    assert catalogue.contains('vitre', 'running', 15)
+    assert catalogue.stats()['entries'] == 2
+
+
+@pytest.fixture
+def stub_ors(monkeypatch):
+    from stub_server import StubConfig, StubServer
+    stub = StubServer(StubConfig(latency_scale=0, seed=1)).start()
+    # Les processus du pool sont des fork : ils héritent de ces remplacements
+    monkeypatch.setattr('services.route_generator.ORS_BASE_URL', f"{stub.base_url}/v2")
+    monkeypatch.setattr('services.route_generator.get_route_cache', lambda: None)
+    monkeypatch.setattr('services.http_client.get_rate_limiter', lambda: None)
+    yield stub
+    stub.stop()
+
+
+def test_build_catalogue_with_the_live_generator(tmp_path, stub_ors):
+    catalogue = RouteCatalogue(path=str(tmp_path / 'catalogue.sqlite3'))
+    counts = build_catalogue(['Dinan', 'Atlantis'], ['hiking'], [5, 8], workers=2, catalogue=catalogue)
+    assert counts == {'built': 2, 'failed': 0, 'skipped': 0}
+
+    entry = catalogue.get('Dinan', 'hiking', 8)
+    coordinates = entry.route_data['features'][0]['geometry']['coordinates']
+    # Boucle ORS partant de la commune, distance rendue en km comme en direct
+    assert coordinates[0][:2] == [round(entry.longitude, 6), round(entry.latitude, 6)]
+    assert 6 <= entry.summary['distance'] <= 10
+    assert entry.gpx.startswith(b'<?xml') and b'Dinan' in entry.gpx
+
+    # Reprise : les entrées présentes ne sont pas régénérées
+    again = build_catalogue(['Dinan'], ['hiking'], [5, 8], workers=2, catalogue=catalogue)
+    assert again == {'built': 0, 'failed': 0, 'skipped': 2}
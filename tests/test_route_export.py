@@ -0,0 +1,92 @@
+import sys
+sys.path.append('.')
+
+import gzip
+import json
+import struct
+from datetime import datetime
+
+import pytest
+
+from services.email_service import EmailService
+from services.gpx_writer import render_gpx
+from services.route_export import (FIT_EPOCH, decode_polyline, export_route, fit_crc,
+                                   iter_export, normalize_format)
+
+COORDINATES = [[-1.6778 + i * 1e-4, 48.1173 + i * 5e-5, 40 + (i % 50)] for i in range(5000)]
+METADATA = {'name': "Parcours hiking - Rennes", 'description': "Parcours 10.0km",
+            'author_name': "Sport Outdoor Route Generator", 'time': datetime(2025, 5, 1, 8, 30)}
+
+
+def read_fit(content):
+    """Minimal FIT reader: {global message number: [field values, ...]}"""
+    header_size, _, _, data_size, magic = struct.unpack('<BBHI4s', content[:12])
+    assert magic == b'.FIT' and header_size + data_size + 2 == len(content)
+    formats = {0x00: 'B', 0x84: 'H', 0x85: 'i', 0x86: 'I'}
+    definitions, messages, offset = {}, {}, header_size
+    while offset < header_size + data_size:
+        record_header = content[offset]
+        local = record_header & 0x0F
+        if record_header & 0x40:
+            number, count = struct.unpack('<HB', content[offset + 3:offset + 6])
+            fields = [struct.unpack('<BBB', content[offset + 6 + 3 * i:offset + 9 + 3 * i]) for i in range(count)]
+            layout = '<' + ''.join(formats.get(base, f'{size}s') for _, size, base in fields)
+            definitions[local] = (number, layout)
+            offset += 6 + 3 * count
+        else:
+            number, layout = definitions[local]
+            messages.setdefault(number, []).append(struct.unpack_from(layout, content, offset + 1))
+            offset += 1 + struct.calcsize(layout)
+    return messages
+
+
+def test_polyline_matches_reference_encoding():
+    # Example from Google's polyline algorithm documentation
+    points = [[-120.2, 38.5], [-120.95, 40.7], [-126.453, 43.252]]
+    assert export_route(points, 'polyline').content == b'_p~iF~ps|U_ulLnnqC_mqNvxq`@'
+    decoded = decode_polyline(export_route(COORDINATES, 'polyline').content.decode())
+    assert len(decoded) == len(COORDINATES)
+    assert all(abs(lat - c[1]) <= 5e-6 and abs(lon - c[0]) <= 5e-6 for (lat, lon), c in zip(decoded, COORDINATES))
+
+
+def test_gzip_and_geojson_round_trip():
+    gpx = export_route(COORDINATES, 'gpx', **METADATA)
+    gpx_gz = export_route(COORDINATES, 'gpx.gz', **METADATA)
+    assert gpx.content == render_gpx(COORDINATES, **METADATA).encode('utf-8')
+    assert gzip.decompress(gpx_gz.content) == gpx.content
+    assert len(gpx_gz.content) * 5 < len(gpx.content)
+    assert gpx_gz.filename == 'parcours_bretagne.gpx.gz'
+
+    feature = json.loads(export_route(COORDINATES, 'geojson', **METADATA).content)
+    assert feature['geometry']['coordinates'] == COORDINATES
+    assert feature['properties']['name'] == METADATA['name']
+
+
+def test_fit_course():
+    export = export_route(COORDINATES, 'fit', sport='running', **METADATA)
+    assert fit_crc(export.content) == 0
+    messages = read_fit(export.content)
+    file_id, course = messages[0][0], messages[31][0]
+    assert file_id[0] == 6  # course file
+    assert course[0] == 1 and course[1].rstrip(b'\0') == METADATA['name'].encode()
+    records = messages[20]
+    assert len(records) == len(COORDINATES)
+    timestamp, lat, lon, altitude, distance = records[-1]
+    assert abs(lat * 180 / 2 ** 31 - COORDINATES[-1][1]) < 1e-6
+    assert abs(lon * 180 / 2 ** 31 - COORDINATES[-1][0]) < 1e-6
+    assert altitude / 5 - 500 == COORDINATES[-1][2]
+    assert timestamp > (METADATA['time'].replace(tzinfo=FIT_EPOCH.tzinfo) - FIT_EPOCH).total_seconds()
+    assert distance > 0
+    assert b''.join(iter_export(COORDINATES, 'fit', sport='running', **METADATA)) == export.content
+
+
+def test_formats_and_attachment():
+    assert normalize_format(None) == 'gpx'
+    assert normalize_format('GPXGZ') == 'gpx.gz'
+    with pytest.raises(ValueError):
+        normalize_format('kml')
+
+    attachment = EmailService._route_attachment(export_route(COORDINATES[:10], 'fit'))
+    assert attachment.get_content_type() == 'application/vnd.ant.fit'
+    assert attachment.get_filename() == 'parcours_bretagne.fit'
+    assert attachment.get_payload(decode=True)[8:12] == b'.FIT'
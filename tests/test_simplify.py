@@ -0,0 +1,46 @@
+import sys
+sys.path.append('.')
+
+import math
+
+from services.geometry import compute_metrics
+from services.simplify import simplify_indexes, simplify_route
+
+
+def wavy_track(count=3000):
+    """About 15 km of gently curving track with a clear high point and low point"""
+    return [[-1.68 + i * 5e-5, 48.11 + 0.002 * math.sin(i / 200),
+             50 + 40 * math.sin(i / 700) + (30 if i == 1234 else 0)]
+            for i in range(count)]
+
+
+def test_point_budget_and_extremes():
+    coordinates = wavy_track()
+    indexes, max_error = simplify_indexes(coordinates, max_points=100, tolerance_m=0)
+    assert len(indexes) == 100
+    assert indexes[0] == 0 and indexes[-1] == len(coordinates) - 1
+    elevations = [c[2] for c in coordinates]
+    assert elevations.index(max(elevations)) in indexes
+    assert elevations.index(min(elevations)) in indexes
+    assert max_error > 0
+
+
+def test_tolerance_bounds_error():
+    coordinates = wavy_track()
+    indexes, max_error = simplify_indexes(coordinates, max_points=len(coordinates), tolerance_m=1.0)
+    assert len(indexes) < len(coordinates) / 5
+    assert max_error <= 1.0
+
+
+def test_simplify_route_keeps_properties_and_reports():
+    coordinates = wavy_track()
+    route = {'type': 'FeatureCollection',
+             'features': [{'type': 'Feature', 'properties': {'segments': [{'distance': 15000}]},
+                           'geometry': {'type': 'LineString', 'coordinates': coordinates}}]}
+    simplified, report = simplify_route(route, max_points=500, tolerance_m=0.5)
+
+    assert route['features'][0]['geometry']['coordinates'] is coordinates  # input untouched
+    assert simplified['features'][0]['properties'] == route['features'][0]['properties']
+    assert len(simplified['features'][0]['geometry']['coordinates']) == report.kept_points <= 500
+    assert report.original_points == len(coordinates)
+    assert abs(report.distance_delta_m) < 0.01 * compute_metrics(coordinates).distance_m
@@ -0,0 +1,65 @@
+import sys
+sys.path.append('.')
+
+from email.mime.text import MIMEText
+
+from services.smtp_pool import SMTPPool
+from stub_server import SMTPSink
+
+
+def message(index):
+    msg = MIMEText(f"Parcours {index}")
+    msg['Subject'] = "Votre Parcours Personnalisé"
+    msg['From'] = 'sender@example.com'
+    msg['To'] = f"user{index}@example.com"
+    return msg
+
+
+def pool_for(sink, **kwargs):
+    host, port = sink.server.server_address[:2]
+    return SMTPPool(host, port, 'sender@example.com', 'secret', starttls=False, **kwargs)
+
+
+def test_sessions_are_reused_and_recycled():
+    sink = SMTPSink().start()
+    pool = pool_for(sink, size=1, max_messages=3)
+    try:
+        for i in range(7):
+            pool.send_message(message(i))
+    finally:
+        pool.close()
+        sink.stop()
+    assert len(sink.messages) == 7
+    assert sink.connections == 3  # 3 + 3 + 1 messages
+    assert pool.stats()['recycled'] == 2
+
+
+def test_reconnects_when_the_server_closes_the_session():
+    # The server drops sessions after 2 messages, before our own limit
+    sink = SMTPSink(max_messages_per_connection=2).start()
+    pool = pool_for(sink, size=1, max_messages=50)
+    try:
+        for i in range(5):
+            pool.send_message(message(i))
+    finally:
+        pool.close()
+        sink.stop()
+    assert [m['to'][0] for m in sink.messages] == [f"TO:<user{i}@example.com>" for i in range(5)]
+    assert pool.stats()['reconnects'] == 2
+
+
+def test_stale_sessions_are_checked_or_replaced():
+    sink = SMTPSink().start()
+    checked = pool_for(sink, size=1, health_check_after=0)
+    replaced = pool_for(sink, size=1, max_idle=0)
+    try:
+        for i in range(3):
+            checked.send_message(message(i))
+        assert sink.connections == 1  # NOOP succeeded each time
+        for i in range(3):
+            replaced.send_message(message(i))
+        assert sink.connections == 4
+    finally:
+        checked.close()
+        replaced.close()
+        sink.stop()
@@ -0,0 +1,46 @@
+import sys
+sys.path.append('.')
+
+from stub_server import StubConfig, create_app
+
+
+def make_client(**kwargs):
+    return create_app(StubConfig(latency_scale=0, seed=1, **kwargs)).test_client()
+
+
+def test_round_trip_has_elevation_and_requested_length():
+    client = make_client()
+    response = client.post('/v2/directions/foot-hiking/geojson', json={
+        'coordinates': [[-1.68, 48.11]],
+        'elevation': True,
+        'options': {'round_trip': {'length': 10000, 'points': 3, 'seed': 1}}
+    })
+    assert response.status_code == 200
+    feature = response.get_json()['features'][0]
+    segment = feature['properties']['segments'][0]
+    coordinates = feature['geometry']['coordinates']
+
+    assert 8500 <= segment['distance'] <= 12500
+    assert segment['ascent'] > 0
+    assert all(len(point) == 3 for point in coordinates)
+    assert coordinates[0][:2] == coordinates[-1][:2] == [-1.68, 48.11]
+
+    # Distances follow the requested units, like ORS
+    in_km = client.post('/v2/directions/foot-hiking/geojson', json={
+        'coordinates': [[-1.68, 48.11]], 'units': 'km',
+        'options': {'round_trip': {'length': 10000, 'points': 3, 'seed': 1}}
+    }).get_json()['features'][0]['properties']['segments'][0]
+    assert abs(in_km['distance'] * 1000 - segment['distance']) < 1
+
+
+def test_injected_errors_and_quota_headers():
+    client = make_client(error_rate=1.0, error_codes=(429,))
+    response = client.get('/nominatim/search?q=Rennes')
+    assert response.status_code == 429
+    assert response.headers['Retry-After'] == '1'
+
+    client = make_client(quota_per_minute=1)
+    first = client.get('/v2/geocode/search?text=Rennes')
+    assert first.status_code == 200
+    assert first.headers['x-ratelimit-remaining'] == '0'
+    assert client.get('/v2/geocode/search?text=Rennes').status_code == 429